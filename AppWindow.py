@@ -3,10 +3,11 @@ import sys
 from PyQt5 import QtCore, QtWidgets  # core Qt functionality
 from PyQt5 import QtGui  # extends QtCore with GUI functionality
 import os
-import csv
+from datetime import datetime
 from PyQt5 import QtOpenGL
 from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel
 
+from project_loader import ProjectLoader
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -17,6 +18,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setWindowTitle('Seismic Visualiser')
 
         self.glWidget = glWidget
+        self.loader = None
+        self.loadingItems = {}
+        self.projectObjects = {}
 
         self.menuBar = self.menuBar()
         self.menuToolBar = QtWidgets.QToolBar()
@@ -29,7 +33,6 @@ class MainWindow(QtWidgets.QMainWindow):
         self.treeView.setModel(self.model)
 
         self.initGUI()
-        self.initTimer()
 
 
 
@@ -38,40 +41,78 @@ class MainWindow(QtWidgets.QMainWindow):
         if not folder_path:
             return
 
-        fx = lambda x : float(x.replace(',', '.'))
-        for entry in os.listdir(folder_path):
-            if entry.lower().endswith('.dxf'):
-                dxf_file = os.path.join(folder_path, entry)
-                self.glWidget.add_object_dxf(dxf_file)
-            elif entry == "detectors.csv":
-                csv_file = os.path.join(folder_path, entry)
-                with open(csv_file, newline='') as f:
-                    r = csv.reader(f, delimiter=';', quotechar='|')
-                    for row in r:
-
-                        self.glWidget.add_object_detector(int(row[0]), fx(row[2]), fx(row[3]), fx(row[1]))
-            elif entry == "events.csv":
-                csv_file = os.path.join(folder_path, entry)
-                with open(csv_file, newline='') as f:
-                    r = csv.reader(f, delimiter=';', quotechar='|')
-                    for row in r:
-                        print(row)
-                        self.glWidget.add_object_event(fx(row[1]), fx(row[3]), fx(row[2]), row[-1], fx(row[5]))
+        self.cancelLoading()
 
         rootNode = self.model.invisibleRootItem()
         project_item = QtGui.QStandardItem(os.path.basename(folder_path))
         rootNode.appendRow(project_item)
 
+        self.loadingItems = {}
+
         def addItems(parent_item, path):
             for entry in os.listdir(path):
                 entry_path = os.path.join(path, entry)
                 item = QtGui.QStandardItem(entry)
                 parent_item.appendRow(item)
+                self.loadingItems[entry_path] = item
                 if os.path.isdir(entry_path):
                     addItems(item, entry_path)
 
         addItems(project_item, folder_path)
 
+        loader = self.loader = ProjectLoader(folder_path, self.glWidget.meshCache,
+                                             weld_tolerance=self.glWidget.DXF_WELD_TOLERANCE,
+                                             lod_levels=self.glWidget.DXF_LOD_LEVELS, parent=self)
+        # the loader cancelled above keeps running until it sees the flag, what it still sends is dropped
+        def current(slot):
+            return lambda *args: slot(*args) if loader is self.loader else None
+
+        self.loader.progress.connect(current(self.onLoadProgress))
+        self.projectObjects[id(project_item)] = []
+        self.loader.meshesReady.connect(current(lambda meshes: self.addProjectMeshes(project_item, meshes)))
+        # tagged with the project, so closing it removes them too
+        source = id(project_item)
+        self.loader.detectorsReady.connect(current(lambda path, rows: self.glWidget.add_detectors(rows, source)))
+        self.loader.eventsReady.connect(current(lambda path, rows: self.glWidget.add_events(rows, source)))
+        self.loader.fileFinished.connect(current(lambda path: self.setItemStatus(path, None)))
+        self.loader.failed.connect(current(lambda path, error: self.setItemStatus(path, "ошибка")))
+        self.loader.finished.connect(self.onLoadFinished)
+
+        for kind, path in self.loader.files:
+            self.setItemStatus(path, "в очереди")
+        self.cancelLoadAction.setEnabled(True)
+        self.loader.start()
+
+    def addProjectMeshes(self, project_item, meshes):
+        objects = self.glWidget.add_objects_dxf_data([arrays for path, arrays in meshes])
+        self.projectObjects.setdefault(id(project_item), []).extend(obj.id for obj in objects)
+
+    def setItemStatus(self, path, status):
+        item = self.loadingItems.get(path)
+        if item is None:
+            return
+        name = os.path.basename(path)
+        item.setText(name if status is None else f"{name} — {status}")
+
+    def onLoadProgress(self, path, percent):
+        self.setItemStatus(path, f"{percent}%")
+
+    def onLoadFinished(self, cancelled):
+        if self.sender() is not self.loader:
+            return
+        if cancelled:
+            for kind, path in self.loader.files:
+                item = self.loadingItems.get(path)
+                if item is not None and item.text() != os.path.basename(path):
+                    self.setItemStatus(path, "отменено")
+        elif self.glWidget.ENABLE_STATIC_BATCHING:
+            self.glWidget.build_static_batches()
+        self.cancelLoadAction.setEnabled(False)
+
+    def cancelLoading(self):
+        if self.loader is not None and self.loader.is_running():
+            self.loader.cancel()
+
     def closeSelectedProject(self):
         index = self.treeView.currentIndex()
         if not index.isValid():
@@ -82,6 +123,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
         parent = item.parent()
         if parent is None:
+            for obj_id in self.projectObjects.pop(id(item), []):
+                self.glWidget.remove_object(obj_id)
+            self.glWidget.remove_tables(id(item))
+            if self.glWidget.staticBatches:
+                self.glWidget.build_static_batches()
             self.model.removeRow(item.row())
         else:
             QtWidgets.QMessageBox.warning(self, "Ошибка", "Выделена не корневая папка")
@@ -90,17 +136,117 @@ class MainWindow(QtWidgets.QMainWindow):
         optionsMenu = self.menuBar.addMenu('Настройки')
 
         exitAction = QtWidgets.QAction('Закрыть проект', self)
+        self.cancelLoadAction = QtWidgets.QAction('Отменить загрузку', self)
+        self.cancelLoadAction.setEnabled(False)
+        self.cancelLoadAction.triggered.connect(self.cancelLoading)
         createFileAction = QtWidgets.QAction('Создать проект', self)
         openFileAction = QtWidgets.QAction('Открыть проект', self)
         openFileAction.triggered.connect(self.openProject)
         changeColorAction = QtWidgets.QAction('Цвета', self)
+        clearCacheAction = QtWidgets.QAction('Очистить кэш моделей', self)
+        clearCacheAction.triggered.connect(self.clearMeshCache)
 
         exitAction.triggered.connect(self.closeSelectedProject)
         fileMenu.addAction(createFileAction)
         fileMenu.addAction(openFileAction)
+        fileMenu.addAction(self.cancelLoadAction)
         fileMenu.addAction(exitAction)
 
+        weldAction = QtWidgets.QAction('Объединять совпадающие вершины DXF', self, checkable=True)
+        weldAction.setChecked(self.glWidget.DXF_WELD_TOLERANCE is not None)
+        weldAction.triggered.connect(self.glWidget.set_dxf_welding)
+
         optionsMenu.addAction(changeColorAction)
+        optionsMenu.addAction(clearCacheAction)
+        optionsMenu.addAction(weldAction)
+
+        pickingMenu = optionsMenu.addMenu('Выбор объектов')
+        pickingGroup = QtWidgets.QActionGroup(self)
+        for title, mode in self.PICKING_MODES:
+            action = QtWidgets.QAction(title, self, checkable=True)
+            action.setChecked(mode == self.glWidget.pickingMode)
+            action.triggered.connect(lambda checked, mode=mode: self.glWidget.set_picking_mode(mode))
+            pickingGroup.addAction(action)
+            pickingMenu.addAction(action)
+
+        rendererMenu = optionsMenu.addMenu('Отрисовка')
+        rendererGroup = QtWidgets.QActionGroup(self)
+        for title, name in self.RENDERERS:
+            action = QtWidgets.QAction(title, self, checkable=True)
+            action.setChecked(name == self.glWidget.rendererName)
+            action.triggered.connect(lambda checked, name=name: self.glWidget.set_renderer(name))
+            rendererGroup.addAction(action)
+            rendererMenu.addAction(action)
+
+        profilerAction = QtWidgets.QAction('Статистика кадра', self, checkable=True)
+        profilerAction.setChecked(self.glWidget.profiler.enabled)
+        profilerAction.triggered.connect(lambda checked: self.glWidget.set_profiling(checked, overlay=checked))
+        saveProfileAction = QtWidgets.QAction('Сохранить журнал кадров', self)
+        saveProfileAction.triggered.connect(self.saveFrameProfile)
+        optionsMenu.addAction(profilerAction)
+        optionsMenu.addAction(saveProfileAction)
+
+        self.initPlaybackMenu()
+
+    PICKING_MODES = [('Лучом (ЦП)', 'ray'), ('Буфером идентификаторов (ГП)', 'gpu')]
+
+    RENDERERS = [('Совместимая (OpenGL 2)', 'legacy'), ('Шейдерная (OpenGL 3.3)', 'core')]
+
+    PLAYBACK_SPEEDS = [('1 мин/с', 60.0), ('1 ч/с', 3600.0), ('1 сут/с', 86400.0), ('1 нед/с', 604800.0)]
+
+    def initPlaybackMenu(self):
+        playbackMenu = self.menuBar.addMenu('Воспроизведение')
+
+        self.playAction = QtWidgets.QAction('Воспроизвести', self)
+        self.playAction.triggered.connect(self.togglePlayback)
+        stopAction = QtWidgets.QAction('Остановить', self)
+        stopAction.triggered.connect(self.stopPlayback)
+        playbackMenu.addAction(self.playAction)
+        playbackMenu.addAction(stopAction)
+
+        speedMenu = playbackMenu.addMenu('Скорость')
+        speedGroup = QtWidgets.QActionGroup(self)
+        for title, speed in self.PLAYBACK_SPEEDS:
+            action = QtWidgets.QAction(title, self, checkable=True)
+            action.setChecked(speed == self.glWidget.playback.speed)
+            action.triggered.connect(lambda checked, speed=speed: self.glWidget.playback.set_speed(speed))
+            speedGroup.addAction(action)
+            speedMenu.addAction(action)
+
+        self.glWidget.playback.cursorChanged.connect(self.onPlaybackCursor)
+        self.glWidget.playback.finished.connect(lambda: self.playAction.setText('Воспроизвести'))
+
+    def togglePlayback(self):
+        if self.glWidget.playback.is_playing():
+            self.glWidget.pause_events()
+            self.playAction.setText('Воспроизвести')
+        else:
+            self.glWidget.play_events()
+            self.playAction.setText('Пауза')
+
+    def stopPlayback(self):
+        self.glWidget.stop_events()
+        self.playAction.setText('Воспроизвести')
+        self.statusBar().clearMessage()
+
+    def onPlaybackCursor(self, cursor):
+        try:
+            text = datetime.fromtimestamp(cursor).strftime('%Y-%m-%d %H:%M:%S')
+        except (OverflowError, OSError, ValueError):
+            text = f"{cursor:.0f} с"
+        self.statusBar().showMessage(text)
+
+    def saveFrameProfile(self):
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Журнал кадров", "frames.csv",
+                                                        "CSV (*.csv);;JSON (*.json)")
+        if not path:
+            return
+        frames = self.glWidget.save_profile(path)
+        self.statusBar().showMessage(f"Сохранено кадров: {frames}")
+
+    def clearMeshCache(self):
+        removed = self.glWidget.clear_mesh_cache()
+        QtWidgets.QMessageBox.information(self, "Кэш моделей", f"Удалено записей: {removed}")
     def initToolBar(self):
         self.menuToolBar = QtWidgets.QToolBar('Меню с иконками')
         self.menuToolBar.setMovable(False)
@@ -149,10 +295,3 @@ class MainWindow(QtWidgets.QMainWindow):
 
 
         gui_layout.addLayout(right_layout, 3)
-
-    def initTimer(self):
-        timer = QtCore.QTimer(self)
-        timer.setInterval(20)  # 20 мс
-        timer.timeout.connect(self.glWidget.updateGL)
-        timer.start()
-
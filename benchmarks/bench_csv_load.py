@@ -0,0 +1,60 @@
+import argparse
+import csv
+import math
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import write_events_csv
+from object_constructors import event_colors, event_scale, event_color
+from project_loader import read_events_csv
+
+
+def load_events_legacy(file_path):
+    # row by row reference : csv.reader, a float() per field and per-event scaling
+    fx = lambda x: float(x.replace(',', '.'))
+    positions, scales, colors = [], [], []
+    with open(file_path, newline='') as f:
+        for row in csv.reader(f, delimiter=';', quotechar='|'):
+            positions.append((fx(row[1]), fx(row[3]), fx(row[2])))
+            scales.append(math.fabs(math.log(fx(row[5]))) * 10)
+            colors.append(event_color(row[-1]))
+    return np.array(positions), np.array(scales), np.array(colors, dtype=np.float32)
+
+
+def load_events_columns(file_path):
+    columns = read_events_csv(file_path)
+    positions = np.column_stack([columns['x'], columns['y'], columns['z']])
+    return positions, event_scale(columns['energy']), event_colors(columns['type'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="events.csv ingestion throughput")
+    parser.add_argument("--events", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for events in args.events:
+            path = os.path.join(tmp, f"events_{events}.csv")
+            write_events_csv(path, events)
+
+            t = time.perf_counter()
+            new_result = load_events_columns(path)
+            new_time = time.perf_counter() - t
+            line = f"{events:>10} events  columnar {events / new_time:>12,.0f} rows/s ({new_time:.3f} s)"
+
+            if not args.skip_legacy:
+                t = time.perf_counter()
+                old_result = load_events_legacy(path)
+                old_time = time.perf_counter() - t
+                same = all(np.allclose(a, b) for a, b in zip(old_result, new_result))
+                line += f"  legacy {events / old_time:>12,.0f} rows/s ({old_time:.3f} s)" \
+                        f"  speedup x{old_time / new_time:.1f}  identical={same}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
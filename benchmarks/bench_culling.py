@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import headless
+
+import numpy as np
+from OpenGL import GL as gl
+
+from benchmarks.bench_gpu_picking import build_scene
+
+
+# camera (arm length as a share of the model size, rotX, rotY) : the whole site, then closer views of a part of it
+VIEWS = [("overview", 1.5, 0.5, 1.0), ("close", 0.25, 0.5, 1.0), ("stope", 0.05, 2.0, 1.3)]
+
+
+def frame(widget, width, height):
+    t = time.perf_counter()
+    widget.paintGL()
+    gl.glFinish()
+    elapsed = time.perf_counter() - t
+    image = np.frombuffer(gl.glReadPixels(0, 0, width, height, gl.GL_RGB, gl.GL_UNSIGNED_BYTE), np.uint8)
+    return elapsed, image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="frame time with and without view frustum culling")
+    parser.add_argument("--faces", type=int, default=1000000)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--size", type=int, nargs=2, default=[800, 600])
+    parser.add_argument("--renderer", choices=["legacy", "core"], default="legacy")
+    args = parser.parse_args()
+
+    width, height = args.size
+    with tempfile.TemporaryDirectory() as tmp:
+        widget = headless.offscreen_widget(width, height)
+        widget.set_renderer(args.renderer)
+        build_scene(widget, args.faces, args.events, os.path.join(tmp, "model.dxf"))
+        obj = widget.viewTarget
+        size = float(np.max(np.array(obj.collision.pointEnd) - np.array(obj.collision.pointBegin)))
+
+        for name, arm, rot_x, rot_y in VIEWS:
+            widget.armLength, widget.rotX, widget.rotY = arm * size, rot_x, rot_y
+            times = {}
+            images = {}
+            for culling in (False, True):
+                widget.ENABLE_CULLING = culling
+                frame(widget, width, height)
+                samples = [frame(widget, width, height) for _ in range(args.frames)]
+                times[culling] = min(elapsed for elapsed, image in samples)
+                images[culling] = samples[-1][1]
+
+            stats = widget.cullingStats
+            print(f"{name:>9}  no culling {times[False] * 1e3:>8.1f} ms  culling {times[True] * 1e3:>8.1f} ms"
+                  f"  mesh chunks {stats['mesh_chunks_drawn']}/{stats['mesh_chunks_drawn'] + stats['mesh_chunks_culled']}"
+                  f"  event chunks {stats['instance_chunks_drawn']}/"
+                  f"{stats['instance_chunks_drawn'] + stats['instance_chunks_culled']}"
+                  f"  same image {np.array_equal(images[False], images[True])}")
+
+
+if __name__ == '__main__':
+    main()
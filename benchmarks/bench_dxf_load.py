@@ -0,0 +1,77 @@
+import argparse
+import os
+import tempfile
+import time
+
+import ezdxf
+import numpy as np
+
+from benchmarks.synthetic import write_dxf_model
+from object_constructors import load_dxf_vertices
+
+
+def load_dxf_vertices_legacy(file_path, scale=1.0):
+    # per-face reference implementation the bulk loader replaced
+    doc = ezdxf.readfile(file_path)
+    msp = doc.modelspace()
+
+    vertices = []
+    indices_faces_t = []
+    indices_faces_q = []
+    indices_edges = []
+    index_offset = 0
+    for e in msp.query('3DFACE'):
+        pts = [(vertex.x, vertex.z, vertex.y) for vertex in e.wcs_vertices(False)]
+        pts = np.array(pts, dtype=np.float32) * scale
+        vertices.extend(pts)
+
+        n = len(pts)
+        if n == 3:
+            indices_faces_t.extend([index_offset, index_offset + 1, index_offset + 2])
+            indices_edges.extend([index_offset, index_offset + 1, index_offset + 1, index_offset + 2, index_offset + 2, index_offset])
+        elif n == 4:
+            indices_faces_q.extend([index_offset, index_offset + 1, index_offset + 2, index_offset + 3])
+            indices_edges.extend([index_offset, index_offset + 1, index_offset + 1, index_offset + 2, index_offset + 2, index_offset + 3, index_offset + 3, index_offset])
+        index_offset += n
+
+    return (np.array(vertices, dtype=np.float32), np.array(indices_faces_t, dtype=np.uint32),
+            np.array(indices_faces_q, dtype=np.uint32), np.array(indices_edges, dtype=np.uint32))
+
+
+def measure(loader, path, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = loader(path)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="3DFACE ingestion throughput of load_dxf_vertices")
+    parser.add_argument("--faces", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--quad-ratio", type=float, default=0.25)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for faces in args.faces:
+            path = os.path.join(tmp, f"model_{faces}.dxf")
+            faces = write_dxf_model(path, faces, args.quad_ratio)
+
+            new_time, new_result = measure(load_dxf_vertices, path, args.repeat)
+            line = f"{faces:>10} faces  bulk {faces / new_time:>12,.0f} faces/s ({new_time:.3f} s)"
+
+            if not args.skip_legacy:
+                old_time, old_result = measure(load_dxf_vertices_legacy, path, args.repeat)
+                same = all(np.array_equal(a, b) for a, b in zip(old_result, new_result))
+                line += f"  legacy {faces / old_time:>12,.0f} faces/s ({old_time:.3f} s)" \
+                        f"  speedup x{old_time / new_time:.1f}  identical={same}"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
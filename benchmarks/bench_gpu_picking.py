@@ -0,0 +1,81 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import headless
+
+import numpy as np
+from OpenGL import GL as gl
+
+from benchmarks.synthetic import write_dxf_model
+
+
+def build_scene(widget, faces, events, path, seed=0):
+    write_dxf_model(path, faces, seed=seed)
+    widget.add_object_dxf(path)
+    obj = widget.viewTarget
+    rng = np.random.default_rng(seed)
+    center = obj.location + obj.origin
+    extent = np.array(obj.collision.pointEnd) - np.array(obj.collision.pointBegin)
+    positions = center + rng.uniform(-0.5, 0.5, (events, 3)) * extent
+    widget.add_events({'x': positions[:, 0], 'y': positions[:, 1], 'z': positions[:, 2],
+                       'type': np.array(['explosion'] * events), 'energy': 10.0 ** rng.uniform(1.0, 5.0, events)})
+    widget.armLength = float(np.max(extent)) * 1.5
+    widget.rotX, widget.rotY = 0.5, 1.0
+    widget.paintGL()
+
+
+def time_hovers(widget, mode, positions):
+    widget.pickingMode = mode
+    picks = []
+    t = time.perf_counter()
+    for position in positions:
+        widget.mousePos = position
+        if mode == "gpu":
+            widget.check_collision_gpu()
+        else:
+            widget.check_collision()
+        picks.append((widget.hoveredObject, widget.hoveredInstance))
+    gl.glFinish()
+    return (time.perf_counter() - t) / len(positions), picks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="hover picking : CPU ray tests against the GPU id buffer")
+    parser.add_argument("--faces", type=int, default=200000)
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--hovers", type=int, default=200)
+    parser.add_argument("--size", type=int, nargs=2, default=[800, 600])
+    args = parser.parse_args()
+
+    width, height = args.size
+    rng = np.random.default_rng(1)
+    positions = [tuple(p) for p in np.column_stack([rng.integers(0, width, args.hovers),
+                                                    rng.integers(0, height, args.hovers)]).tolist()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        widget = headless.offscreen_widget(width, height)
+        for events in args.events:
+            for obj_id in list(widget.objects):
+                widget.remove_object(obj_id)
+            widget.eventCatalog.clear()
+            widget.instanceSets["event"].clear()
+            build_scene(widget, args.faces, events, os.path.join(tmp, "model.dxf"))
+
+            cpu_time, cpu_picks = time_hovers(widget, "ray", positions)
+
+            widget.pickingBuffer.key = None
+            t = time.perf_counter()
+            widget.update_picking_buffer()
+            gl.glFinish()
+            redraw_time = time.perf_counter() - t
+            gpu_time, gpu_picks = time_hovers(widget, "gpu", positions)
+
+            same = sum(a == b for a, b in zip(cpu_picks, gpu_picks)) / len(positions)
+            print(f"{events:>8} events  ray {cpu_time * 1e3:>8.2f} ms/hover  id buffer {gpu_time * 1e3:>6.2f} ms/hover"
+                  f" + {redraw_time * 1e3:.1f} ms per camera change  same pick {same:.0%}")
+
+
+if __name__ == '__main__':
+    main()
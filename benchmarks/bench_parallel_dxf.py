@@ -0,0 +1,49 @@
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic import write_dxf_model
+from project_loader import DxfBatchParser
+
+
+def parse_all(paths, workers):
+    parser = DxfBatchParser(paths, workers)
+    parser.start()
+    faces = 0
+    for path, arrays, error in parser.results():
+        if error is not None:
+            raise error
+        faces += len(arrays['faces_t']) // 3 + len(arrays['faces_q']) // 4
+    return faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of parallel multi-DXF parsing with the pool size")
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--faces", type=int, default=50000)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, cores} & set(range(1, cores + 1)) | {cores})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(tmp, f"level_{i}.dxf")
+            write_dxf_model(path, args.faces, quad_ratio=0.25, seed=i)
+            paths.append(path)
+
+        baseline = None
+        for n in workers:
+            t = time.perf_counter()
+            faces = parse_all(paths, n)
+            elapsed = time.perf_counter() - t
+            baseline = baseline or elapsed
+            print(f"workers {n:>3}  {args.files} files  {faces:>10} faces  {elapsed:8.3f} s  "
+                  f"{faces / elapsed:>12,.0f} faces/s  speedup x{baseline / elapsed:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import surface_grid
+from bvh import BoundsBVH, TriangleBVH, ray_boxes, ray_triangles
+
+
+def pick_brute_force(box_min, box_max, origin, direction, t_min, t_max):
+    # reference : slab test against every box, as check_collision did per object
+    hit, near = ray_boxes(origin, direction, box_min, box_max, t_min, t_max)
+    if not np.any(hit):
+        return -1, -1.0
+    best = np.flatnonzero(hit)[np.argmin(near[hit])]
+    return int(best), float(near[best])
+
+
+def random_boxes(count, rng, extent=10000.0):
+    centers = rng.uniform(0.0, extent, (count, 3))
+    sizes = rng.uniform(5.0, 40.0, (count, 1))
+    return centers - sizes / 2.0, centers + sizes / 2.0
+
+
+def random_rays(count, rng, extent=10000.0):
+    origins = rng.uniform(-0.2 * extent, 1.2 * extent, (count, 3))
+    directions = rng.normal(size=(count, 3))
+    return origins, directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+def surface_triangles(faces):
+    grid, side = surface_grid(faces)
+    row = side + 1
+    i, j = np.meshgrid(np.arange(side), np.arange(side), indexing='ij')
+    a = (i * row + j).ravel()
+    b, c, d = a + row, a + row + 1, a + 1
+    triangles = np.concatenate([np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)])
+    return grid.reshape(-1, 3), triangles, side * 5.0
+
+
+def bench_surface(faces, rays, rng):
+    vertices, triangles, extent = surface_triangles(faces)
+    t = time.perf_counter()
+    bvh = TriangleBVH(vertices, triangles)
+    build_time = time.perf_counter() - t
+
+    origins = np.column_stack([rng.uniform(0.0, extent, (rays, 2)), np.full(rays, 500.0)])
+    directions = np.column_stack([rng.normal(0.0, 0.3, (rays, 2)), -np.ones(rays)])
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+    t = time.perf_counter()
+    picked = [bvh.ray_nearest(o, d, 1.0, 1e6)[0] for o, d in zip(origins, directions)]
+    bvh_time = (time.perf_counter() - t) / rays
+
+    corners = bvh.vertices[bvh.triangles].astype(np.float64)
+    t = time.perf_counter()
+    expected = []
+    for o, d in zip(origins, directions):
+        hit, dist = ray_triangles(o, d, corners[:, 0], corners[:, 1], corners[:, 2], 1.0, 1e6)
+        expected.append(int(np.flatnonzero(hit)[np.argmin(dist[hit])]) if np.any(hit) else -1)
+    brute_time = (time.perf_counter() - t) / rays
+
+    print(f"{len(triangles):>10} triangles  build {build_time:.3f} s  pick {bvh_time * 1e6:>9.1f} us"
+          f"  brute force {brute_time * 1e6:>10.1f} us  speedup x{brute_time / bvh_time:.0f}"
+          f"  identical={picked == expected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ray picking against many object boxes and mesh triangles")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--rays", type=int, default=200)
+    parser.add_argument("--moves", type=int, default=100)
+    parser.add_argument("--triangles", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for count in args.boxes:
+        box_min, box_max = random_boxes(count, rng)
+        origins, directions = random_rays(args.rays, rng)
+
+        t = time.perf_counter()
+        bvh = BoundsBVH(box_min, box_max)
+        bvh.build()
+        build_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        picked = [bvh.ray_nearest(o, d, 1.0, 1e6) for o, d in zip(origins, directions)]
+        bvh_time = (time.perf_counter() - t) / args.rays
+
+        t = time.perf_counter()
+        expected = [pick_brute_force(box_min, box_max, o, d, 1.0, 1e6) for o, d in zip(origins, directions)]
+        brute_time = (time.perf_counter() - t) / args.rays
+
+        moved = rng.integers(0, count, args.moves)
+        new_min, new_max = random_boxes(args.moves, rng)
+        bvh.update(moved, new_min, new_max)
+        t = time.perf_counter()
+        bvh.update(moved, new_min, new_max)
+        update_time = time.perf_counter() - t
+
+        print(f"{count:>10} boxes  build {build_time:.3f} s  pick {bvh_time * 1e6:>9.1f} us"
+              f"  brute force {brute_time * 1e6:>10.1f} us  speedup x{brute_time / bvh_time:.0f}"
+              f"  refit {args.moves} {update_time * 1e3:.2f} ms  identical={picked == expected}")
+
+    for faces in args.triangles:
+        bench_surface(faces, args.rays, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+
+import numpy as np
+from pyglm import glm
+from pyglm.glm import sin, cos
+
+from transforms import model_matrices, look_at, perspective
+from utilities import screen_pos_to_vector
+
+
+def calculate_matrix_legacy(location, rotation, scale):
+    # the per-object glm matrix SceneObject.calculate_matrix built after every change
+    a, b, c = rotation
+    x, y, z = location
+    R = glm.mat4(cos(b) * cos(c), sin(a) * sin(b) * cos(c) - cos(a) * sin(c), cos(a) * sin(b) * cos(c) + sin(a) * sin(c), x,
+                 cos(b) * sin(c), sin(a) * sin(b) * sin(c) + cos(a) * cos(c), cos(a) * sin(b) * sin(c) - sin(a) * cos(c), y,
+                 -sin(b), sin(a) * cos(b), cos(a) * cos(b), z,
+                 0.0, 0.0, 0.0, 1.0)
+    S = glm.mat4(scale[0], 0.0, 0.0, 0.0,
+                 0.0, scale[1], 0.0, 0.0,
+                 0.0, 0.0, scale[2], 0.0,
+                 0.0, 0.0, 0.0, 1.0)
+    return glm.transpose(R) * S
+
+
+def screen_ray_legacy(x, y, width, height, view, projection):
+    # glm inverses and a Python matrix-vector loop per call, as screen_pos_to_vector did
+    inverse_projection = glm.inverse(glm.mat4(*projection.T.ravel()))
+    inverse_view = glm.inverse(glm.mat4(*view.T.ravel()))
+    points = []
+    for z in (-1.0, 0.0):
+        p = glm.vec4((x / width - 0.5) * 2.0, (y / height - 0.5) * 2.0, z, 1.0)
+        p = glm.vec4(*[sum(inverse_projection[j][i] * p[j] for j in range(4)) for i in range(4)])
+        p /= p.w
+        p = glm.vec4(*[sum(inverse_view[j][i] * p[j] for j in range(4)) for i in range(4)])
+        points.append(p / p.w)
+    return glm.normalize(glm.vec3(points[1] - points[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="model matrices and mouse rays")
+    parser.add_argument("--objects", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--rays", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for count in args.objects:
+        locations = rng.uniform(-1000.0, 1000.0, (count, 3))
+        rotations = rng.uniform(-180.0, 180.0, (count, 3))
+        scales = rng.uniform(0.5, 2.0, (count, 3))
+
+        t = time.perf_counter()
+        for location, rotation, scale in zip(locations.tolist(), rotations.tolist(), scales.tolist()):
+            calculate_matrix_legacy(location, rotation, scale)
+        legacy_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        model_matrices(locations, rotations, scales)
+        batch_time = time.perf_counter() - t
+        print(f"{count:>8} objects  per object {legacy_time * 1e3:>9.2f} ms  batched {batch_time * 1e3:>7.2f} ms"
+              f"  speedup x{legacy_time / batch_time:.0f}")
+
+    view = look_at((300.0, 400.0, 500.0), (0.0, 0.0, 0.0))
+    projection = perspective(60.0, 4.0 / 3.0, 1.0, 1e6)
+    pixels = rng.uniform(0.0, 1.0, (args.rays, 2)) * [800, 600]
+
+    t = time.perf_counter()
+    for x, y in pixels:
+        screen_ray_legacy(x, y, 800, 600, view, projection)
+    legacy_time = (time.perf_counter() - t) / args.rays
+
+    t = time.perf_counter()
+    inverse_view_projection = np.linalg.inv(projection @ view)
+    for x, y in pixels:
+        screen_pos_to_vector(x, y, 800, 600, inverse_view_projection)
+    cached_time = (time.perf_counter() - t) / args.rays
+    print(f"mouse ray  per call inverses {legacy_time * 1e6:.1f} us  cached matrix {cached_time * 1e6:.1f} us")
+
+
+if __name__ == '__main__':
+    main()
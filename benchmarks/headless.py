@@ -0,0 +1,3 @@
+# the offscreen GL helpers live in offscreen.py next to the app (render_report.py uses them too),
+# imported from here by the benchmark scripts before anything else so the GL platform is chosen first
+from offscreen import BACKEND, egl_context, gl_info, load_project, offscreen_framebuffer, offscreen_widget
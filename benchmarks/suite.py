@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import headless
+
+import numpy as np
+from OpenGL import GL as gl
+
+from benchmarks.bench_culling import VIEWS
+from benchmarks.bench_gpu_picking import time_hovers
+from benchmarks.synthetic import write_detectors_csv, write_dxf_model, write_events_csv, write_project
+from object_constructors import load_dxf_vertices
+from project_loader import read_detectors_csv, read_events_csv
+
+
+# Every benchmark of the app in one run, results written as JSON : one flat record per measurement, so runs of
+# different commits can be compared with --compare.
+# python -m benchmarks.suite --out results.json [--compare previous.json]
+
+
+def measure(function, *args, repeat=1):
+    # best time of repeat calls, peak of the memory allocated through Python (NumPy included) during the first
+    tracemalloc.start()
+    t = time.perf_counter()
+    result = function(*args)
+    best = time.perf_counter() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    for _ in range(repeat - 1):
+        t = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, peak / 2 ** 20, result
+
+
+def bench_dxf(tmp, faces_list, repeat):
+    for faces in faces_list:
+        path = os.path.join(tmp, f"model_{faces}.dxf")
+        faces = write_dxf_model(path, faces, 0.25)
+        seconds, peak, result = measure(load_dxf_vertices, path, repeat=repeat)
+        yield {"benchmark": "dxf_load", "faces": faces, "seconds": seconds, "faces_per_s": faces / seconds,
+               "peak_mb": peak, "file_mb": os.path.getsize(path) / 2 ** 20}
+
+
+def bench_csv(tmp, events_list, detectors, repeat):
+    for events in events_list:
+        path = os.path.join(tmp, f"events_{events}.csv")
+        write_events_csv(path, events)
+        seconds, peak, columns = measure(read_events_csv, path, repeat=repeat)
+        yield {"benchmark": "events_csv", "rows": events, "seconds": seconds, "rows_per_s": events / seconds,
+               "peak_mb": peak, "file_mb": os.path.getsize(path) / 2 ** 20}
+
+    path = os.path.join(tmp, "detectors.csv")
+    write_detectors_csv(path, detectors)
+    seconds, peak, columns = measure(read_detectors_csv, path, repeat=repeat)
+    yield {"benchmark": "detectors_csv", "rows": detectors, "seconds": seconds, "rows_per_s": detectors / seconds,
+           "peak_mb": peak}
+
+
+def frame_times(widget, frames):
+    times = []
+    for _ in range(frames):
+        t = time.perf_counter()
+        widget.paintGL()
+        gl.glFinish()
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def bench_scene(tmp, args):
+    width, height = args.size
+    folder = write_project(os.path.join(tmp, "project"), args.scene_faces, args.scene_events, args.detectors,
+                           args.models)
+    widget = headless.offscreen_widget(width, height)
+    # the cache would turn the second run into a cache read
+    widget.meshCache = None
+    seconds, peak, result = measure(headless.load_project, widget, folder)
+    yield {"benchmark": "project_load", "models": args.models, "faces": args.scene_faces * args.models,
+           "events": args.scene_events, "seconds": seconds, "peak_mb": peak}
+
+    widget.viewTarget = next(iter(widget.objects.values()))
+    obj = widget.viewTarget
+    size = float(np.max(np.array(obj.collision.pointEnd) - np.array(obj.collision.pointBegin))) * args.models
+    info = headless.gl_info()
+
+    for renderer in ("legacy", "core"):
+        widget.set_renderer(renderer)
+        for name, arm, rot_x, rot_y in VIEWS:
+            widget.armLength, widget.rotX, widget.rotY = arm * size, rot_x, rot_y
+            frame_times(widget, 1)
+            times = frame_times(widget, args.frames)
+            # phase breakdown from the frame profiler, over frames of their own so it can't slow the ones above
+            widget.set_profiling(True)
+            frame_times(widget, args.frames)
+            widget.set_profiling(False)
+            widget.profiler.collect()
+            phases = {key: value for key, value in widget.profiler.summary(args.frames).items()
+                      if key.startswith(("cpu_", "gpu_")) or key in ("draw_calls", "primitives")}
+            widget.profiler.log.clear()
+            yield dict({"benchmark": "frame", "renderer": widget.rendererName, "view": name,
+                        "frame_ms_min": min(times) * 1e3, "frame_ms_median": float(np.median(times)) * 1e3,
+                        "gl_renderer": info["renderer"]}, **phases)
+
+    rng = np.random.default_rng(1)
+    positions = [tuple(p) for p in np.column_stack([rng.integers(0, width, args.hovers),
+                                                    rng.integers(0, height, args.hovers)]).tolist()]
+    widget.set_renderer("legacy")
+    widget.armLength, widget.rotX, widget.rotY = VIEWS[0][1] * size, VIEWS[0][2], VIEWS[0][3]
+    widget.paintGL()
+    ray_time, ray_picks = time_hovers(widget, "ray", positions)
+    widget.pickingBuffer.key = None
+    t = time.perf_counter()
+    widget.update_picking_buffer()
+    gl.glFinish()
+    redraw_time = time.perf_counter() - t
+    gpu_time, gpu_picks = time_hovers(widget, "gpu", positions)
+    yield {"benchmark": "picking", "hovers": len(positions), "ray_ms": ray_time * 1e3, "gpu_ms": gpu_time * 1e3,
+           "id_buffer_ms": redraw_time * 1e3,
+           "same_pick": sum(a == b for a, b in zip(ray_picks, gpu_picks)) / len(positions)}
+
+
+def max_rss_mb():
+    # peak resident memory of this process, None where the resource module is missing (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux and the BSDs
+    return max_rss / 2 ** 20 if sys.platform == 'darwin' else max_rss / 2 ** 10
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+def record_key(record):
+    # what a record measures, the numbers aside
+    return tuple((key, value) for key, value in record.items() if isinstance(value, str) or key in
+                 ("faces", "rows", "events", "models", "hovers"))
+
+
+def compare(results, previous):
+    # ratio new / old of every number two runs share, lower is better for times and memory, higher for *_per_s
+    old = {record_key(record): record for record in previous["results"]}
+    for record in results["results"]:
+        before = old.get(record_key(record))
+        if before is None:
+            continue
+        label = " ".join(str(value) for key, value in record_key(record))
+        for key, value in record.items():
+            if key in before and isinstance(value, float) and before[key]:
+                print(f"{label:<40} {key:<22} {before[key]:>12.3f} -> {value:>12.3f}  x{value / before[key]:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="loading, memory, picking and frame time benchmarks, as JSON")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--dxf-faces", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--csv-events", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--detectors", type=int, default=500)
+    parser.add_argument("--scene-faces", type=int, default=100000)
+    parser.add_argument("--scene-events", type=int, default=20000)
+    parser.add_argument("--models", type=int, default=2)
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--hovers", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--size", type=int, nargs=2, default=[800, 600])
+    parser.add_argument("--skip", nargs="*", default=[], choices=["dxf", "csv", "scene"])
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "arguments": vars(args), "results": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmarks = [("dxf", lambda: bench_dxf(tmp, args.dxf_faces, args.repeat)),
+                      ("csv", lambda: bench_csv(tmp, args.csv_events, args.detectors, args.repeat)),
+                      ("scene", lambda: bench_scene(tmp, args))]
+        for name, run in benchmarks:
+            if name in args.skip:
+                continue
+            for record in run():
+                print(json.dumps(record))
+                results["results"].append(record)
+            if name == "scene":
+                results["environment"]["gl"] = headless.gl_info()
+
+    rss = max_rss_mb()
+    if rss is not None:
+        results["environment"]["max_rss_mb"] = rss
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
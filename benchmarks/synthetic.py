@@ -0,0 +1,94 @@
+import os
+
+import ezdxf
+import numpy as np
+
+
+def surface_grid(faces, faces_per_cell=2.0, seed=0):
+    # a rolling heightfield close to a triangulated pit / level surface
+    side = max(1, int(np.ceil(np.sqrt(faces / faces_per_cell))) + 1)
+    rng = np.random.default_rng(seed)
+    xs, ys = np.meshgrid(np.arange(side + 1, dtype=np.float64) * 5.0,
+                         np.arange(side + 1, dtype=np.float64) * 5.0, indexing='ij')
+    zs = 50.0 * np.sin(xs / 150.0) * np.cos(ys / 200.0) + rng.normal(0.0, 0.5, xs.shape)
+    return np.stack([xs, ys, zs], axis=-1), side
+
+
+def write_dxf_model(path, faces, quad_ratio=0.0, seed=0, origin=(0.0, 0.0, 0.0)):
+    # origin : DXF coordinates of the first grid corner
+    grid, side = surface_grid(faces, 2.0 - quad_ratio, seed)
+    grid = grid + np.asarray(origin, dtype=np.float64)
+    rng = np.random.default_rng(seed + 1)
+
+    doc = ezdxf.new('R2010')
+    msp = doc.modelspace()
+    written = 0
+    for i in range(side):
+        for j in range(side):
+            a, b, c, d = grid[i, j], grid[i + 1, j], grid[i + 1, j + 1], grid[i, j + 1]
+            if rng.random() < quad_ratio:
+                msp.add_3dface([a, b, c, d])
+                written += 1
+            else:
+                msp.add_3dface([a, b, c])
+                msp.add_3dface([a, c, d])
+                written += 2
+            if written >= faces:
+                break
+        if written >= faces:
+            break
+    doc.saveas(path)
+    return written
+
+
+EVENT_TYPES = ('explosion', 'microseismic', 'rockburst')
+
+
+def _decimal_comma(values, precision):
+    return np.char.replace(np.char.mod(f'%.{precision}f', values), '.', ',')
+
+
+def write_events_csv(path, events, seed=0):
+    # time;x;z;y;magnitude;energy;location error;type, as exported by the monitoring system
+    rng = np.random.default_rng(seed)
+    columns = [
+        np.char.mod('%d', np.sort(rng.integers(1_600_000_000, 1_700_000_000, events))),
+        _decimal_comma(rng.uniform(0.0, 2000.0, events), 2),
+        _decimal_comma(rng.uniform(-800.0, 0.0, events), 2),
+        _decimal_comma(rng.uniform(0.0, 2000.0, events), 2),
+        _decimal_comma(rng.normal(0.5, 0.8, events), 2),
+        _decimal_comma(10.0 ** rng.uniform(1.0, 7.0, events), 1),
+        _decimal_comma(rng.uniform(1.0, 30.0, events), 1),
+        np.array(EVENT_TYPES)[rng.integers(0, len(EVENT_TYPES), events)],
+    ]
+    with open(path, 'w') as f:
+        for row in zip(*columns):
+            f.write(';'.join(row) + '\n')
+    return events
+
+
+def write_detectors_csv(path, detectors, seed=0):
+    # id;z;x;y, laid out on the same area as write_events_csv
+    rng = np.random.default_rng(seed)
+    columns = [
+        np.char.mod('%d', np.arange(1, detectors + 1)),
+        _decimal_comma(rng.uniform(-800.0, 0.0, detectors), 2),
+        _decimal_comma(rng.uniform(0.0, 2000.0, detectors), 2),
+        _decimal_comma(rng.uniform(0.0, 2000.0, detectors), 2),
+    ]
+    with open(path, 'w') as f:
+        for row in zip(*columns):
+            f.write(';'.join(row) + '\n')
+    return detectors
+
+
+def write_project(folder, faces, events, detectors, models=1, quad_ratio=0.0, seed=0):
+    # a project folder as AppWindow.openProject reads it : models side by side, events.csv and detectors.csv
+    os.makedirs(folder, exist_ok=True)
+    side = surface_grid(faces, 2.0 - quad_ratio)[1] * 5.0
+    for model in range(models):
+        write_dxf_model(os.path.join(folder, f"model_{model}.dxf"), faces, quad_ratio, seed + model,
+                        (model * side, 0.0, 0.0))
+    write_events_csv(os.path.join(folder, "events.csv"), events, seed)
+    write_detectors_csv(os.path.join(folder, "detectors.csv"), detectors, seed)
+    return folder
@@ -0,0 +1,245 @@
+import numpy as np
+
+
+LEAF_SIZE = 8
+# children per node, a wide tree keeps the number of NumPy steps per query low
+BRANCHING = 8
+# appended boxes are tested one by one until they outnumber this share of the indexed ones
+REBUILD_FRACTION = 0.25
+REBUILD_MIN = 1024
+
+
+def _spread_bits(v):
+    # 21 bits -> every third bit of a 63 bit code
+    v = v.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | v << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    v = (v | v << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    v = (v | v << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    v = (v | v << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | v << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_codes(points):
+    low = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - low, 1e-12)
+    cells = ((points - low) / extent * ((1 << 21) - 1)).astype(np.uint64)
+    return _spread_bits(cells[:, 0]) | _spread_bits(cells[:, 1]) << np.uint64(1) | \
+        _spread_bits(cells[:, 2]) << np.uint64(2)
+
+
+def ray_boxes(origin, direction, box_min, box_max, t_min, t_max):
+    # slab test of one ray against many boxes, returns (hit mask, entry distance)
+    inv = 1.0 / np.where(direction == 0.0, 1e-300, direction)
+    t1 = (box_min - origin) * inv
+    t2 = (box_max - origin) * inv
+    near = np.maximum(np.minimum(t1, t2).max(axis=1), t_min)
+    far = np.minimum(np.maximum(t1, t2).min(axis=1), t_max)
+    return near <= far, near
+
+
+def ray_triangles(origin, direction, v0, v1, v2, t_min, t_max):
+    # Moller-Trumbore against many triangles, both sides count, returns (hit mask, distance)
+    e1 = v1 - v0
+    e2 = v2 - v0
+    p = np.cross(direction, e2)
+    det = np.einsum('ij,ij->i', e1, p)
+    parallel = np.abs(det) < 1e-12
+    inv = 1.0 / np.where(parallel, 1.0, det)
+    s = origin - v0
+    u = np.einsum('ij,ij->i', s, p) * inv
+    q = np.cross(s, e1)
+    v = (q @ direction) * inv
+    t = np.einsum('ij,ij->i', e2, q) * inv
+    hit = ~parallel & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= t_min) & (t <= t_max)
+    return hit, t
+
+
+def _ranges(starts, lengths):
+    # concatenated arange(start, start + length) for every pair
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(int(lengths.sum()))
+
+
+# Bounding volume hierarchy over axis aligned boxes.
+# Boxes are sorted along a Morton curve and grouped LEAF_SIZE per leaf, the levels above group BRANCHING
+# neighbouring nodes, so node i of a level has children [i * BRANCHING, (i + 1) * BRANCHING) and the tree is
+# a list of (min, max) arrays, root level first.
+class BoundsBVH:
+    BEAM = 64
+    DTYPE = np.float64
+
+    def __init__(self, box_min=None, box_max=None, leaf_size=LEAF_SIZE, branching=BRANCHING):
+        self.leaf_size = leaf_size
+        self.branching = branching
+        self.box_min = np.empty((0, 3), dtype=self.DTYPE)
+        self.box_max = np.empty((0, 3), dtype=self.DTYPE)
+        self.levels = []
+        self.order = np.empty(0, dtype=np.int64)
+        self.rank = np.empty(0, dtype=np.int64)
+        self.indexed = 0
+        if box_min is not None:
+            self.append(box_min, box_max)
+
+    def __len__(self):
+        return len(self.box_min)
+
+    def build(self):
+        count = len(self.box_min)
+        self.indexed = count
+        if count == 0:
+            self.levels = []
+            return
+        self.order = np.argsort(morton_codes((self.box_min + self.box_max) * 0.5), kind='stable')
+        self.rank = np.empty(count, dtype=np.int64)
+        self.rank[self.order] = np.arange(count)
+
+        starts = np.arange(0, count, self.leaf_size)
+        levels = [(np.minimum.reduceat(self.box_min[self.order], starts, axis=0),
+                   np.maximum.reduceat(self.box_max[self.order], starts, axis=0))]
+        while len(levels[-1][0]) > 1:
+            level_min, level_max = levels[-1]
+            groups = np.arange(0, len(level_min), self.branching)
+            levels.append((np.minimum.reduceat(level_min, groups, axis=0),
+                           np.maximum.reduceat(level_max, groups, axis=0)))
+        self.levels = levels[::-1]
+
+    def append(self, box_min, box_max):
+        # returns the indices of the new boxes
+        begin = len(self.box_min)
+        self.box_min = np.concatenate([self.box_min, np.asarray(box_min, dtype=self.DTYPE).reshape(-1, 3)])
+        self.box_max = np.concatenate([self.box_max, np.asarray(box_max, dtype=self.DTYPE).reshape(-1, 3)])
+        if len(self.box_min) - self.indexed > max(REBUILD_MIN, self.indexed * REBUILD_FRACTION):
+            self.build()
+        return np.arange(begin, len(self.box_min))
+
+    def update(self, indices, box_min, box_max):
+        # moved boxes : only the leaves holding them and their ancestors are refitted
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        self.box_min[indices] = np.asarray(box_min, dtype=self.DTYPE).reshape(-1, 3)
+        self.box_max[indices] = np.asarray(box_max, dtype=self.DTYPE).reshape(-1, 3)
+        indices = indices[indices < self.indexed]
+        if len(indices) == 0 or not self.levels:
+            return
+
+        nodes = np.unique(self.rank[indices] // self.leaf_size)
+        starts = nodes * self.leaf_size
+        lengths = np.minimum(starts + self.leaf_size, self.indexed) - starts
+        boxes = self.order[_ranges(starts, lengths)]
+        offsets = np.cumsum(lengths) - lengths
+        level_min, level_max = self.levels[-1]
+        level_min[nodes] = np.minimum.reduceat(self.box_min[boxes], offsets, axis=0)
+        level_max[nodes] = np.maximum.reduceat(self.box_max[boxes], offsets, axis=0)
+
+        for depth in range(len(self.levels) - 2, -1, -1):
+            child_min, child_max = self.levels[depth + 1]
+            nodes = np.unique(nodes // self.branching)
+            starts = nodes * self.branching
+            lengths = np.minimum(starts + self.branching, len(child_min)) - starts
+            children = _ranges(starts, lengths)
+            offsets = np.cumsum(lengths) - lengths
+            level_min, level_max = self.levels[depth]
+            level_min[nodes] = np.minimum.reduceat(child_min[children], offsets, axis=0)
+            level_max[nodes] = np.maximum.reduceat(child_max[children], offsets, axis=0)
+
+    def _leaf_boxes(self, nodes):
+        starts = nodes * self.leaf_size
+        lengths = np.minimum(starts + self.leaf_size, self.indexed) - starts
+        return self.order[_ranges(starts, lengths)]
+
+    def _hit(self, boxes, origin, direction, t_min, t_max):
+        # exact test of the leaf items, subclasses test what the boxes are bounding
+        return ray_boxes(origin, direction, self.box_min[boxes], self.box_max[boxes], t_min, t_max)
+
+    def _nearest_in(self, boxes, origin, direction, t_min, t_max, mask):
+        if mask is not None:
+            boxes = boxes[mask[boxes]]
+        if len(boxes) == 0:
+            return -1, t_max
+        hit, near = self._hit(boxes, origin, direction, t_min, t_max)
+        if not np.any(hit):
+            return -1, t_max
+        best = np.flatnonzero(hit)[np.argmin(near[hit])]
+        return int(boxes[best]), float(near[best])
+
+    def ray_nearest(self, origin, direction, t_min, t_max, mask=None):
+        # nearest box hit by the ray : (index, distance) or (-1, -1.0), mask excludes boxes that are not pickable.
+        # one NumPy step per tree level, only the BEAM nearest nodes go down first, the others are kept on a stack
+        # and dropped once a closer hit is known
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+
+        best, best_t = self._nearest_in(np.arange(self.indexed, len(self.box_min)), origin, direction, t_min, t_max,
+                                        mask)
+        stack = [(0, np.zeros(1, dtype=np.int64))] if self.levels else []
+        while stack:
+            depth, nodes = stack.pop()
+            while len(nodes):
+                level_min, level_max = self.levels[depth]
+                hit, near = ray_boxes(origin, direction, level_min[nodes], level_max[nodes], t_min, best_t)
+                nodes, near = nodes[hit], near[hit]
+                if len(nodes) > self.BEAM:
+                    order = np.argsort(near)
+                    stack.append((depth, nodes[order[self.BEAM:]]))
+                    nodes = nodes[order[:self.BEAM]]
+                if depth + 1 == len(self.levels):
+                    index, t = self._nearest_in(self._leaf_boxes(nodes), origin, direction, t_min, best_t, mask)
+                    if index >= 0:
+                        best, best_t = index, t
+                    break
+                depth += 1
+                nodes = (nodes[:, None] * self.branching + np.arange(self.branching)).ravel()
+                nodes = nodes[nodes < len(self.levels[depth][0])]
+
+        return (best, best_t) if best >= 0 else (-1, -1.0)
+
+    def ray_all(self, origin, direction, t_min, t_max, mask=None):
+        # every item hit by the ray : (indices, distances) sorted by distance
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+
+        items = [np.arange(self.indexed, len(self.box_min))]
+        nodes = np.zeros(1, dtype=np.int64) if self.levels else np.empty(0, dtype=np.int64)
+        for depth in range(len(self.levels)):
+            level_min, level_max = self.levels[depth]
+            hit, near = ray_boxes(origin, direction, level_min[nodes], level_max[nodes], t_min, t_max)
+            nodes = nodes[hit]
+            if depth + 1 < len(self.levels):
+                nodes = (nodes[:, None] * self.branching + np.arange(self.branching)).ravel()
+                nodes = nodes[nodes < len(self.levels[depth + 1][0])]
+        if self.levels:
+            items.append(self._leaf_boxes(nodes))
+
+        items = np.concatenate(items)
+        if mask is not None:
+            items = items[mask[items]]
+        hit, near = self._hit(items, origin, direction, t_min, t_max)
+        items, near = items[hit], near[hit]
+        order = np.argsort(near, kind='stable')
+        return items[order], near[order]
+
+
+# Triangles of one mesh : the boxes bound the triangles and the leaves are tested exactly.
+# Built once, the mesh does not change, single precision boxes keep multi-million triangle models small
+class TriangleBVH(BoundsBVH):
+    DTYPE = np.float32
+
+    def __init__(self, vertices, triangles, leaf_size=LEAF_SIZE, branching=BRANCHING):
+        super().__init__(leaf_size=leaf_size, branching=branching)
+        self.vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        corners = self.vertices[self.triangles]
+        self.box_min = corners.min(axis=1)
+        self.box_max = corners.max(axis=1)
+        self.build()
+
+    def _hit(self, boxes, origin, direction, t_min, t_max):
+        corners = self.vertices[self.triangles[boxes]].astype(np.float64)
+        return ray_triangles(origin, direction, corners[:, 0], corners[:, 1], corners[:, 2], t_min, t_max)
+
+    def ray_nearest_point(self, origin, direction, t_min, t_max):
+        # (hit point, triangle index, distance) or None
+        triangle, t = self.ray_nearest(origin, direction, t_min, t_max)
+        if triangle < 0:
+            return None
+        return np.asarray(origin, dtype=np.float64) + t * np.asarray(direction, dtype=np.float64), triangle, t
@@ -0,0 +1,284 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.GL import shaders
+
+from culling import draw_elements
+from frame_profiler import DRAW_COUNTERS
+
+
+# Attribute locations shared by every program, so a vertex array can be drawn by any of them
+POSITION = 0
+COLOR = 1
+INSTANCE_POSITION = 2
+INSTANCE_SCALE = 3
+INSTANCE_COLOR = 4
+
+MESH_VERTEX_SHADER = """
+#version 330 core
+
+layout(location = 0) in vec3 position;
+layout(location = 1) in vec4 color;
+
+uniform mat4 viewProjection;
+uniform mat4 model;
+uniform int useVertexColor;
+uniform vec4 uniformColor;
+
+out vec4 fragmentColor;
+
+void main()
+{
+    gl_Position = viewProjection * model * vec4(position, 1.0);
+    fragmentColor = useVertexColor != 0 ? color : uniformColor;
+}
+"""
+
+INSTANCE_VERTEX_SHADER = """
+#version 330 core
+
+layout(location = 0) in vec3 position;
+layout(location = 2) in vec3 instancePosition;
+layout(location = 3) in float instanceScale;
+layout(location = 4) in vec4 instanceColor;
+
+uniform mat4 viewProjection;
+uniform vec3 meshOrigin;
+uniform int useInstanceColor;
+uniform int hoveredInstance;
+uniform vec4 hoverColor;
+uniform vec4 uniformColor;
+
+out vec4 fragmentColor;
+
+void main()
+{
+    vec3 p = instancePosition + (position - meshOrigin) * instanceScale;
+    gl_Position = viewProjection * vec4(p, 1.0);
+
+    if (gl_InstanceID == hoveredInstance)
+        fragmentColor = hoverColor;
+    else if (useInstanceColor != 0)
+        fragmentColor = instanceColor;
+    else
+        fragmentColor = uniformColor;
+}
+"""
+
+SPRITE_VERTEX_SHADER = """
+#version 330 core
+
+layout(location = 0) in vec3 position;
+layout(location = 3) in float instanceScale;
+layout(location = 4) in vec4 instanceColor;
+
+uniform mat4 viewProjection;
+uniform vec3 cameraPosition;
+uniform float pixelScale;
+uniform float maxPixels;
+
+out vec4 fragmentColor;
+
+void main()
+{
+    // same rule as the compatibility sprite shader in instancing.py
+    float size = instanceScale * pixelScale / max(distance(position, cameraPosition), 1e-6);
+    if (size >= maxPixels)
+        gl_Position = vec4(2.0, 2.0, 2.0, 1.0);
+    else
+        gl_Position = viewProjection * vec4(position, 1.0);
+    gl_PointSize = max(size, 1.0);
+    fragmentColor = instanceColor;
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 330 core
+
+in vec4 fragmentColor;
+out vec4 outColor;
+
+void main()
+{
+    outColor = fragmentColor;
+}
+"""
+
+SPRITE_FRAGMENT_SHADER = """
+#version 330 core
+
+in vec4 fragmentColor;
+out vec4 outColor;
+
+void main()
+{
+    vec2 p = gl_PointCoord * 2.0 - 1.0;
+    if (dot(p, p) > 1.0)
+        discard;
+    outColor = fragmentColor;
+}
+"""
+
+
+def _compile(vertex, fragment):
+    return shaders.compileProgram(shaders.compileShader(vertex, gl.GL_VERTEX_SHADER),
+                                  shaders.compileShader(fragment, gl.GL_FRAGMENT_SHADER),
+                                  validate=False)
+
+
+def _attribute(location, buffer, size, offset=0, divisor=0):
+    # buffer : a PyOpenGL VBO, bound here so pending data is uploaded first
+    buffer.bind()
+    gl.glEnableVertexAttribArray(location)
+    gl.glVertexAttribPointer(location, size, gl.GL_FLOAT, gl.GL_FALSE, 0, ctypes.c_void_p(offset))
+    gl.glVertexAttribDivisor(location, divisor)
+
+
+# Draws with programmable shaders and vertex array objects only, no client state, matrix stack or glColor.
+# Matrices come from the widget's NumPy camera and SceneObject.gl_matrix as uniforms.
+# Needs OpenGL 3.3, raises from the constructor otherwise
+class CoreRenderer:
+    def __init__(self):
+        self.meshProgram = _compile(MESH_VERTEX_SHADER, FRAGMENT_SHADER)
+        self.instanceProgram = _compile(INSTANCE_VERTEX_SHADER, FRAGMENT_SHADER)
+        self.spriteProgram = _compile(SPRITE_VERTEX_SHADER, SPRITE_FRAGMENT_SHADER)
+        # gl_PointCoord needs GL_POINT_SPRITE in a compatibility context, the enum does not exist in a core one
+        self.compatibility = bool(gl.glGetIntegerv(gl.GL_CONTEXT_PROFILE_MASK) &
+                                  gl.GL_CONTEXT_COMPATIBILITY_PROFILE_BIT)
+
+        self.viewProjection = np.identity(4, dtype=np.float32)
+        self._locations = {}
+        self._program = None
+        self._framePrograms = set()
+
+    def _uniform(self, name):
+        key = (self._program, name)
+        if key not in self._locations:
+            self._locations[key] = gl.glGetUniformLocation(self._program, name)
+        return self._locations[key]
+
+    def _use(self, program):
+        if program != self._program:
+            gl.glUseProgram(program)
+            self._program = program
+        if program not in self._framePrograms:
+            gl.glUniformMatrix4fv(self._uniform("viewProjection"), 1, gl.GL_FALSE, self.viewProjection)
+            self._framePrograms.add(program)
+
+    def begin_frame(self, view_projection):
+        self.viewProjection = np.ascontiguousarray(np.asarray(view_projection).T, dtype=np.float32)
+        self._framePrograms = set()
+
+    def end_frame(self):
+        gl.glBindVertexArray(0)
+        gl.glUseProgram(0)
+        self._program = None
+
+    @staticmethod
+    def _vertex_array(owner, kind, key, buffers, setup):
+        # one vertex array per owner and kind of draw, its pointers are specified again only when key changes.
+        # The buffers are bound every time anyway, a VBO uploads data set since the last draw on bind
+        entry = owner.vaos.get(kind)
+        vao = gl.glGenVertexArrays(1) if entry is None else entry[0]
+        gl.glBindVertexArray(vao)
+        for buffer in buffers:
+            buffer.bind()
+        DRAW_COUNTERS.bind(*buffers)
+        if entry is None or entry[1] != key:
+            setup()
+            owner.vaos[kind] = (vao, key)
+
+    def _mesh_vertex_array(self, mesh, kind, colors, size, elements):
+        # size : components per color, 4 for the faces and 3 for the edges as in GLWidget.draw_object
+        def setup():
+            _attribute(POSITION, mesh.verticesVBO, 3)
+            if colors is not None:
+                _attribute(COLOR, colors, size)
+            else:
+                gl.glDisableVertexAttribArray(COLOR)
+
+        buffers = [b for b in (mesh.verticesVBO, colors) if b is not None] + [elements]
+        self._vertex_array(mesh, kind, id(colors), buffers, setup)
+
+    def draw_mesh(self, mesh, gl_matrix, hovered, enable_faces, enable_edges, id_color=None, ranges=None):
+        # ranges : {kind: (offsets, counts)} index ranges drawn instead of the whole faces / edges,
+        # same rules as GLWidget.draw_mesh
+        ranges = ranges or {}
+        self._use(self.meshProgram)
+        gl.glUniformMatrix4fv(self._uniform("model"), 1, gl.GL_FALSE, gl_matrix)
+
+        if enable_faces and mesh.facesVBO is not None and mesh.enableFaces:
+            colors, color = (mesh.colorsFacesVBO, mesh.colorFaces) if id_color is None else (None, id_color)
+            self._mesh_vertex_array(mesh, "faces", colors, 4, mesh.facesVBO)
+            self._set_color(colors, color)
+            draw_elements(gl.GL_TRIANGLES, len(mesh.facesTriangles), ranges.get('faces'))
+
+        if (hovered or enable_edges and mesh.enableEdges) and mesh.edgesVBO is not None:
+            hovered = hovered and id_color is None
+            colors, color = mesh.edge_colors(hovered) if id_color is None else (None, id_color)
+            self._mesh_vertex_array(mesh, "hovered" if hovered else "edges", colors, 3, mesh.edgesVBO)
+            self._set_color(colors, color)
+            draw_elements(gl.GL_LINES, len(mesh.edges), ranges.get('edges'))
+
+    def _set_color(self, colors, color):
+        gl.glUniform1i(self._uniform("useVertexColor"), int(colors is not None))
+        if colors is None:
+            rgba = np.ones(4, dtype=np.float32)
+            rgba[:len(color)] = color
+            gl.glUniform4fv(self._uniform("uniformColor"), 1, rgba)
+
+    def draw_instance_points(self, instances, colors, camera, pixel_scale, max_pixels, first, count):
+        self._use(self.spriteProgram)
+        gl.glUniform3f(self._uniform("cameraPosition"), *camera)
+        gl.glUniform1f(self._uniform("pixelScale"), pixel_scale * instances.extent)
+        gl.glUniform1f(self._uniform("maxPixels"), min(max_pixels, 1e30))
+
+        def setup():
+            _attribute(POSITION, instances.positionsVBO, 3)
+            _attribute(INSTANCE_SCALE, instances.scalesVBO, 1)
+            _attribute(INSTANCE_COLOR, colors, 4)
+
+        self._vertex_array(instances, ("points", id(colors)), None,
+                           (instances.positionsVBO, instances.scalesVBO, colors), setup)
+        gl.glEnable(gl.GL_PROGRAM_POINT_SIZE)
+        if self.compatibility:
+            gl.glEnable(gl.GL_POINT_SPRITE)
+        gl.glDrawArrays(gl.GL_POINTS, first, count)
+        DRAW_COUNTERS.draw(gl.GL_POINTS, count)
+        if self.compatibility:
+            gl.glDisable(gl.GL_POINT_SPRITE)
+        gl.glDisable(gl.GL_PROGRAM_POINT_SIZE)
+
+    def draw_instance_mesh(self, instances, buffers, first, count, hovered, enable_faces, enable_edges, ids=False):
+        mesh = instances.mesh
+        positions, scales, colors = buffers
+        self._use(self.instanceProgram)
+        gl.glUniform3f(self._uniform("meshOrigin"), *instances.origin)
+        gl.glUniform1i(self._uniform("hoveredInstance"), hovered)
+        gl.glUniform4fv(self._uniform("hoverColor"), 1, np.asarray(mesh.colorHovered, dtype=np.float32))
+
+        def vertex_array(kind, elements):
+            def setup():
+                _attribute(POSITION, mesh.verticesVBO, 3)
+                _attribute(INSTANCE_POSITION, positions, 3, first * 12, 1)
+                _attribute(INSTANCE_SCALE, scales, 1, first * 4, 1)
+                _attribute(INSTANCE_COLOR, colors, 4, first * 16, 1)
+
+            # one vertex array per set of buffers (all, near ones of a sprite frame, ids), the draw range only
+            # moves the instance attributes of it
+            self._vertex_array(instances, (kind, id(positions), id(colors)), first,
+                               (mesh.verticesVBO, positions, scales, colors, elements), setup)
+
+        if enable_faces and mesh.enableFaces and mesh.facesVBO is not None:
+            vertex_array("faces", mesh.facesVBO)
+            gl.glUniform1i(self._uniform("useInstanceColor"), 1)
+            gl.glDrawElementsInstanced(gl.GL_TRIANGLES, len(mesh.facesTriangles), gl.GL_UNSIGNED_INT, None, count)
+            DRAW_COUNTERS.draw(gl.GL_TRIANGLES, len(mesh.facesTriangles), count)
+
+        if enable_edges and mesh.enableEdges and mesh.edgesVBO is not None:
+            vertex_array("edges", mesh.edgesVBO)
+            gl.glUniform1i(self._uniform("useInstanceColor"), int(ids))
+            gl.glUniform4fv(self._uniform("uniformColor"), 1, np.asarray(mesh.colorEdges, dtype=np.float32))
+            gl.glDrawElementsInstanced(gl.GL_LINES, len(mesh.edges), gl.GL_UNSIGNED_INT, None, count)
+            DRAW_COUNTERS.draw(gl.GL_LINES, len(mesh.edges), count)
@@ -0,0 +1,60 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+from frame_profiler import DRAW_COUNTERS
+
+
+# names of the per-frame counters kept in GLWidget.cullingStats
+CULLING_COUNTERS = ('objects_drawn', 'objects_culled', 'mesh_chunks_drawn', 'mesh_chunks_culled',
+                    'instance_chunks_drawn', 'instance_chunks_culled')
+
+
+def frustum_planes(view_projection):
+    # (6, 4) planes of a column-vector view-projection matrix, a x + b y + c z + d >= 0 inside each of them
+    m = np.asarray(view_projection, dtype=np.float64)
+    planes = np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def local_planes(planes, matrix):
+    # the same planes in the coordinates of a model matrix, plane . (M p) = (plane M) . p
+    return planes @ matrix
+
+
+def boxes_in_frustum(planes, box_min, box_max):
+    # conservative : a box is culled only when it is fully outside one of the planes
+    box_min = np.asarray(box_min)
+    box_max = np.asarray(box_max)
+    inside = np.ones(len(box_min), dtype=bool)
+    for plane in planes:
+        normal = plane[:3]
+        corner = np.where(normal >= 0.0, box_max, box_min)
+        inside &= corner @ normal + plane[3] >= 0.0
+    return inside
+
+
+def visible_ranges(offsets, counts, visible):
+    # contiguous chunks -> (offsets, counts) of the runs of visible ones, neighbours merged into one range
+    steps = np.diff(np.concatenate([[0], visible.astype(np.int8), [0]]))
+    begin = np.flatnonzero(steps == 1)
+    end = np.flatnonzero(steps == -1) - 1
+    return offsets[begin], offsets[end] + counts[end] - offsets[begin]
+
+
+def draw_elements(mode, count, ranges=None):
+    # draws the bound uint32 index buffer, ranges : (offsets, counts) in indices, one call for all of them
+    if ranges is None:
+        gl.glDrawElements(mode, count, gl.GL_UNSIGNED_INT, None)
+        DRAW_COUNTERS.draw(mode, count)
+        return
+    offsets, counts = ranges
+    if len(offsets) and DRAW_COUNTERS.enabled:
+        DRAW_COUNTERS.draw(mode, int(np.sum(counts)))
+    if len(offsets) == 1:
+        gl.glDrawElements(mode, int(counts[0]), gl.GL_UNSIGNED_INT, ctypes.c_void_p(int(offsets[0]) * 4))
+    elif len(offsets):
+        pointers = (ctypes.c_void_p * len(offsets))(*(int(offset) * 4 for offset in offsets))
+        gl.glMultiDrawElements(mode, np.asarray(counts, dtype=np.int32), gl.GL_UNSIGNED_INT, pointers,
+                               len(offsets))
@@ -0,0 +1,118 @@
+import numpy as np
+
+from scene_objects import SceneEvent
+
+
+# Seismic events stored column by column, row i of every column is event i.
+# Range queries go through sorted indexes : (order, values[order]), rebuilt lazily after new events arrive
+class EventCatalog:
+    COLUMNS = {'time': np.float64, 'x': np.float64, 'y': np.float64, 'z': np.float64,
+               'magnitude': np.float64, 'energy': np.float64, 'location_error': np.float64, 'L': np.float64,
+               'type': str}
+
+    def __init__(self, indexes=('time', 'magnitude', 'energy')):
+        self.count = 0
+        self.columns = {name: np.empty(0, dtype=dtype) for name, dtype in self.COLUMNS.items()}
+        self.indexed = tuple(indexes)
+        self._indexes = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def extend(self, columns):
+        # columns missing from the table are filled with NaN ("Unknown" for the type)
+        count = len(next(iter(columns.values()))) if columns else 0
+        for name, dtype in self.COLUMNS.items():
+            if name in columns:
+                values = np.asarray(columns[name])
+                values = values.astype(dtype) if dtype is not str else values.astype(str)
+            elif dtype is str:
+                values = np.full(count, "Unknown")
+            else:
+                values = np.full(count, np.nan)
+            if len(values) != count:
+                raise ValueError(f"column {name} has {len(values)} rows, expected {count}")
+            self.columns[name] = np.concatenate([self.columns[name], values])
+
+        begin = self.count
+        self.count += count
+        self._indexes = {}
+        return np.arange(begin, self.count)
+
+    def clear(self):
+        self.__init__(self.indexed)
+
+    def index(self, name):
+        # NaN sorts last, so it never falls inside a range
+        if name not in self._indexes:
+            order = np.argsort(self.columns[name], kind='stable')
+            self._indexes[name] = (order, self.columns[name][order])
+        return self._indexes[name]
+
+    def _index_range(self, name, low, high):
+        order, values = self.index(name)
+        begin = 0 if low is None else np.searchsorted(values, low, 'left')
+        end = np.searchsorted(values, np.inf if high is None else high, 'right')
+        return order[begin:end]
+
+    def _range_mask(self, name, low, high, rows=None):
+        values = self.columns[name] if rows is None else self.columns[name][rows]
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    def query(self, as_mask=False, **ranges):
+        # ranges : name=(low, high), both ends included, None for an open end,
+        # e.g. query(time=(t0, t1), magnitude=(2.0, None)).
+        # returns ascending event indices, or a boolean mask over the catalog when as_mask is True
+        ranges = {name: bounds for name, bounds in ranges.items() if bounds is not None}
+        for name in ranges:
+            if name not in self.columns or self.COLUMNS[name] is str:
+                raise KeyError(f"no numeric column {name}")
+
+        if not ranges:
+            rows = None
+        else:
+            # the narrowest indexed range gives the candidates, the other ranges only filter those
+            indexed = [name for name in ranges if name in self.indexed]
+            rows = None
+            if indexed:
+                candidates = [self._index_range(name, *ranges[name]) for name in indexed]
+                best = int(np.argmin([len(c) for c in candidates]))
+                rows = np.sort(candidates[best])
+                ranges.pop(indexed[best])
+            for name, (low, high) in ranges.items():
+                if rows is None:
+                    rows = np.flatnonzero(self._range_mask(name, low, high))
+                else:
+                    rows = rows[self._range_mask(name, low, high, rows)]
+
+        if not as_mask:
+            return np.arange(self.count) if rows is None else rows
+        if rows is None:
+            return np.ones(self.count, dtype=bool)
+        mask = np.zeros(self.count, dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def time_window(self, begin=None, end=None, as_mask=False):
+        return self.query(as_mask, time=(begin, end))
+
+    def magnitude_range(self, low=None, high=None, as_mask=False):
+        return self.query(as_mask, magnitude=(low, high))
+
+    def event(self, index):
+        return SceneEvent(self, index)
+
+    def time_range(self):
+        order, values = self.index('time')
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return None
+        return float(values[0]), float(values[-1])
@@ -0,0 +1,277 @@
+import contextlib
+import csv
+import ctypes
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+
+
+# vertices per primitive of the draw modes the app uses
+PRIMITIVE_VERTICES = {gl.GL_TRIANGLES: 3, gl.GL_LINES: 2, gl.GL_POINTS: 1}
+
+
+# Draw calls, primitives and buffer bytes bound during a frame, counted by the draw helpers.
+# Counting is skipped while no profiler is recording
+class DrawCounters:
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.drawCalls = 0
+        self.primitives = 0
+        self.bytesBound = 0
+
+    def draw(self, mode, count, instances=1):
+        # count : vertices / indices of one instance
+        if self.enabled:
+            self.drawCalls += 1
+            self.primitives += count // PRIMITIVE_VERTICES.get(mode, 1) * instances
+
+    def bind(self, *buffers):
+        # buffers : PyOpenGL VBOs (None skipped), counted with their whole size
+        if self.enabled:
+            for buffer in buffers:
+                if buffer is not None:
+                    self.bytesBound += buffer.size
+
+
+DRAW_COUNTERS = DrawCounters()
+
+
+def timer_queries_available():
+    # needs the current GL context, GL_TIMESTAMP queries are core in OpenGL 3.3 (ARB_timer_query before)
+    try:
+        return bool(gl.glQueryCounter) and gl.glGetQueryiv(gl.GL_TIMESTAMP, gl.GL_QUERY_COUNTER_BITS) > 0
+    except gl.GLError:
+        return False
+
+
+def _query_result(query):
+    # PyOpenGL's wrapper of glGetQueryObjectui64v has no 64 bit output type, the raw function is called instead
+    result = ctypes.c_uint64()
+    glGetQueryObjectui64v(query, gl.GL_QUERY_RESULT, ctypes.byref(result))
+    return result.value
+
+
+# Profiled frames appended to a file as JSON lines, one record per line, for sessions longer than LOG_FRAMES.
+# Once the file holds max_frames records or max_bytes bytes it is renamed to path.1 (path.1 to path.2 ... up to
+# path.<backups>, the oldest dropped) and a new one is started. None disables either limit
+class RollingFrameLog:
+    def __init__(self, path, max_bytes=64 << 20, max_frames=None, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.backups = backups
+        self._file = None
+        self._frames = 0
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._frames = 0
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._frames += 1
+        if (self.max_frames is not None and self._frames >= self.max_frames) or \
+                (self.max_bytes is not None and self._file.tell() >= self.max_bytes):
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if not self.backups:
+            os.remove(self.path)
+        self._open()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Per-phase CPU times of the frames drawn by GLWidget.paintGL, GPU times of the same phases from timestamp
+# queries read back a few frames later (they are never waited for), and the draw counters of the frame.
+# The last LOG_FRAMES frames are kept as flat records for the overlay and for save(), set_log() also appends every
+# record to a RollingFrameLog once its GPU times are in. While disabled, phase() is a shared empty context and
+# nothing is recorded
+class FrameProfiler:
+    LOG_FRAMES = 600
+    # frames the overlay averages over
+    SUMMARY_FRAMES = 30
+    # GPU results not back after this many frames are waited for, so the queries can't pile up
+    MAX_PENDING = 8
+
+    def __init__(self, enabled=False):
+        self.enabled = False
+        self.overlay = False
+        self.log = deque(maxlen=self.LOG_FRAMES)
+        self.frames = 0
+        self.gpuTimers = None
+        # RollingFrameLog of set_log, None keeps the records in memory only
+        self.fileLog = None
+
+        self._record = None
+        self._start = 0.0
+        self._queries = []
+        self._frameQueries = []
+        # (record, [(phase, begin query, end query)]) of frames whose GPU times are not read yet
+        self._pending = deque()
+        self.set_enabled(enabled)
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        DRAW_COUNTERS.enabled = enabled
+
+    def set_log(self, path=None, **limits):
+        # path : file the records are appended to, limits : max_bytes / max_frames / backups of RollingFrameLog,
+        # None stops writing
+        if self.fileLog is not None:
+            self.fileLog.close()
+        self.fileLog = RollingFrameLog(path, **limits) if path is not None else None
+
+    def _complete(self, record):
+        if self.fileLog is not None:
+            self.fileLog.write(record)
+
+    def begin_frame(self):
+        # needs the current GL context, GPU results of earlier frames are collected even when disabled
+        if self._pending:
+            self.collect()
+        if not self.enabled:
+            return
+        if self.gpuTimers is None:
+            self.gpuTimers = timer_queries_available()
+        DRAW_COUNTERS.reset()
+        self._record = {'frame': self.frames, 'time': time.time()}
+        self._frameQueries = []
+        self._start = time.perf_counter()
+
+    def phase(self, name):
+        # with profiler.phase("objects"): ... adds the time spent inside to that phase of the frame
+        if self._record is None:
+            return contextlib.nullcontext()
+        return self._phase(name)
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        begin = self._timestamp()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            key = f"cpu_{name}_ms"
+            self._record[key] = self._record.get(key, 0.0) + (time.perf_counter() - start) * 1000.0
+            if begin is not None:
+                self._frameQueries.append((name, begin, self._timestamp()))
+
+    def _timestamp(self):
+        if not self.gpuTimers:
+            return None
+        query = self._queries.pop() if self._queries else gl.glGenQueries(1)[0]
+        gl.glQueryCounter(query, gl.GL_TIMESTAMP)
+        return query
+
+    def end_frame(self, stats=None):
+        # stats : other numbers of the frame (culling counters ...) stored with it
+        if self._record is None:
+            return
+        record, self._record = self._record, None
+        record['cpu_total_ms'] = (time.perf_counter() - self._start) * 1000.0
+        record['draw_calls'] = DRAW_COUNTERS.drawCalls
+        record['primitives'] = DRAW_COUNTERS.primitives
+        record['bytes_bound'] = DRAW_COUNTERS.bytesBound
+        record.update(stats or {})
+        self.log.append(record)
+        self.frames += 1
+        if self._frameQueries:
+            self._pending.append((record, self._frameQueries))
+            self._frameQueries = []
+        else:
+            self._complete(record)
+
+    def collect(self):
+        # reads the GPU times that came back, needs the current GL context
+        while self._pending:
+            record, queries = self._pending[0]
+            available = gl.glGetQueryObjectiv(queries[-1][2], gl.GL_QUERY_RESULT_AVAILABLE)
+            if not available and len(self._pending) <= self.MAX_PENDING:
+                return
+            self._pending.popleft()
+            first = last = None
+            for name, begin, end in queries:
+                begin_ns, end_ns = _query_result(begin), _query_result(end)
+                key = f"gpu_{name}_ms"
+                record[key] = record.get(key, 0.0) + (end_ns - begin_ns) / 1e6
+                first = begin_ns if first is None else min(first, begin_ns)
+                last = end_ns if last is None else max(last, end_ns)
+                self._queries += [begin, end]
+            record['gpu_total_ms'] = (last - first) / 1e6
+            self._complete(record)
+
+    def release(self):
+        # needs the GL context the queries were made in
+        queries = self._queries + [q for record, frame in self._pending for name, b, e in frame for q in (b, e)]
+        if queries:
+            gl.glDeleteQueries(len(queries), queries)
+        self._queries = []
+        # written without the GPU times that did not come back
+        for record, frame in self._pending:
+            self._complete(record)
+        self._pending.clear()
+
+    def summary(self, frames=SUMMARY_FRAMES):
+        # mean of every number over the last frames, a GPU time over the frames it is already known for
+        records = list(self.log)[-frames:]
+        values = {}
+        for record in records:
+            for key, value in record.items():
+                if key not in ('frame', 'time'):
+                    values.setdefault(key, []).append(value)
+        return {key: float(np.mean(v)) for key, v in values.items()}
+
+    def overlay_lines(self):
+        summary = self.summary()
+        if not summary:
+            return []
+        # GPU times are NaN until their queries came back, or without timer queries
+        gpu = lambda name: summary.get(f'gpu_{name}_ms', float('nan'))
+        lines = [f"frame  cpu {summary['cpu_total_ms']:6.2f} ms  gpu {gpu('total'):6.2f} ms"]
+        phases = [key[4:-3] for key in summary if key.startswith('cpu_') and key != 'cpu_total_ms']
+        for name in phases:
+            lines.append(f"{name:<11}{summary[f'cpu_{name}_ms']:6.2f}  {gpu(name):6.2f}")
+        lines.append(f"draws {summary['draw_calls']:.0f}  primitives {summary['primitives']:.0f}  "
+                     f"bound {summary['bytes_bound'] / 2 ** 20:.1f} MB")
+        if 'objects_drawn' in summary:
+            lines.append(f"objects {summary['objects_drawn']:.0f}/"
+                         f"{summary['objects_drawn'] + summary['objects_culled']:.0f}  "
+                         f"chunks {summary['mesh_chunks_drawn']:.0f}/"
+                         f"{summary['mesh_chunks_drawn'] + summary['mesh_chunks_culled']:.0f}  "
+                         f"event chunks {summary['instance_chunks_drawn']:.0f}/"
+                         f"{summary['instance_chunks_drawn'] + summary['instance_chunks_culled']:.0f}")
+        return lines
+
+    def save(self, path):
+        # the kept frames as JSON (a list of records) for a .json path, CSV otherwise
+        records = list(self.log)
+        if path.lower().endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=1)
+            return len(records)
+        columns = []
+        for record in records:
+            columns += [key for key in record if key not in columns]
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(records)
+        return len(records)
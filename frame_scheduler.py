@@ -0,0 +1,68 @@
+import time
+
+from PyQt5 import QtCore
+
+
+# Repaints the widget only when something asked for it : camera input, scene changes, hover changes, playback.
+# Requests made before the next frame starts are merged into that frame, and frames are spaced so drawing stays
+# under MAX_LOAD of the time, nothing runs while the view is idle
+class FrameScheduler(QtCore.QObject):
+    # frame interval aimed for, in ms
+    FRAME_BUDGET = 16
+    # share of the time a frame may spend drawing, slower frames are spaced further apart
+    MAX_LOAD = 0.75
+    MAX_INTERVAL = 250
+    # weight of the newest frame in the average frame time
+    SMOOTHING = 0.2
+
+    def __init__(self, widget, budget=FRAME_BUDGET, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.budget = budget
+
+        self.interval = budget
+        self.frameTime = 0.0
+        self.frames = 0
+        self.requests = 0
+        self.painting = False
+
+        self._last_frame = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.widget.update)
+
+    def set_budget(self, budget):
+        self.budget = budget
+        self._adapt()
+
+    def request(self):
+        # requests from the frame being drawn are already part of it
+        self.requests += 1
+        if self.painting or self._timer.isActive():
+            return
+        wait = 0.0
+        if self._last_frame is not None:
+            wait = self._last_frame + self.interval / 1000.0 - time.perf_counter()
+        self._timer.start(max(0, int(wait * 1000.0)))
+
+    def is_pending(self):
+        return self._timer.isActive()
+
+    def begin_frame(self):
+        # a frame drawn for any reason (expose, resize) also answers the pending request
+        self._timer.stop()
+        self.painting = True
+        return time.perf_counter()
+
+    def end_frame(self, start):
+        now = time.perf_counter()
+        self.painting = False
+        self._last_frame = now
+        self.frames += 1
+        elapsed = (now - start) * 1000.0
+        self.frameTime = elapsed if self.frames == 1 else \
+            self.frameTime + self.SMOOTHING * (elapsed - self.frameTime)
+        self._adapt()
+
+    def _adapt(self):
+        self.interval = min(self.MAX_INTERVAL, max(self.budget, self.frameTime / self.MAX_LOAD))
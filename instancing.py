@@ -0,0 +1,646 @@
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.GL import shaders
+from OpenGL.arrays import vbo
+
+from bvh import BoundsBVH, morton_codes
+from culling import boxes_in_frustum, visible_ranges
+from frame_profiler import DRAW_COUNTERS
+from picking import encode_ids
+
+
+INSTANCE_VERTEX_SHADER = """
+#version 120
+#extension GL_ARB_draw_instanced : enable
+
+attribute vec3 instancePosition;
+attribute float instanceScale;
+attribute vec4 instanceColor;
+
+uniform vec3 meshOrigin;
+uniform int useInstanceColor;
+uniform int hoveredInstance;
+uniform vec4 hoverColor;
+
+void main()
+{
+    vec3 p = instancePosition + (gl_Vertex.xyz - meshOrigin) * instanceScale;
+    gl_Position = gl_ModelViewProjectionMatrix * vec4(p, 1.0);
+
+    if (gl_InstanceIDARB == hoveredInstance)
+        gl_FrontColor = hoverColor;
+    else if (useInstanceColor != 0)
+        gl_FrontColor = instanceColor;
+    else
+        gl_FrontColor = gl_Color;
+}
+"""
+
+INSTANCE_FRAGMENT_SHADER = """
+#version 120
+
+void main()
+{
+    gl_FragColor = gl_Color;
+}
+"""
+
+SPRITE_VERTEX_SHADER = """
+#version 120
+
+attribute float instanceScale;
+attribute vec4 instanceColor;
+
+uniform vec3 cameraPosition;
+uniform float pixelScale;
+uniform float maxPixels;
+
+void main()
+{
+    // projected diameter in pixels, the same formula InstancedMeshSet._near_rows uses
+    float size = instanceScale * pixelScale / max(distance(gl_Vertex.xyz, cameraPosition), 1e-6);
+    if (size >= maxPixels)
+        gl_Position = vec4(2.0, 2.0, 2.0, 1.0);   // drawn as a mesh this frame, clipped away here
+    else
+        gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+    gl_PointSize = max(size, 1.0);
+    gl_FrontColor = instanceColor;
+}
+"""
+
+SPRITE_FRAGMENT_SHADER = """
+#version 120
+
+void main()
+{
+    vec2 p = gl_PointCoord * 2.0 - 1.0;
+    if (dot(p, p) > 1.0)
+        discard;
+    gl_FragColor = gl_Color;
+}
+"""
+
+_PROGRAM = None
+_SPRITE_PROGRAM = None
+
+
+def instance_program():
+    # compiled once per process on first draw, None when the driver can't do instancing
+    global _PROGRAM
+    if _PROGRAM is None:
+        try:
+            if not bool(gl.glDrawElementsInstanced) or not bool(gl.glVertexAttribDivisor):
+                raise RuntimeError("instanced drawing is not supported")
+            _PROGRAM = shaders.compileProgram(
+                shaders.compileShader(INSTANCE_VERTEX_SHADER, gl.GL_VERTEX_SHADER),
+                shaders.compileShader(INSTANCE_FRAGMENT_SHADER, gl.GL_FRAGMENT_SHADER))
+        except Exception as e:
+            print(f"Instanced rendering disabled: {e}")
+            _PROGRAM = False
+    return _PROGRAM or None
+
+
+def sprite_program():
+    # GLSL 1.20 and gl_PointCoord only, also available in software GL (llvmpipe)
+    global _SPRITE_PROGRAM
+    if _SPRITE_PROGRAM is None:
+        try:
+            _SPRITE_PROGRAM = shaders.compileProgram(
+                shaders.compileShader(SPRITE_VERTEX_SHADER, gl.GL_VERTEX_SHADER),
+                shaders.compileShader(SPRITE_FRAGMENT_SHADER, gl.GL_FRAGMENT_SHADER))
+        except Exception as e:
+            print(f"Point sprites disabled: {e}")
+            _SPRITE_PROGRAM = False
+    return _SPRITE_PROGRAM or None
+
+
+# Many copies of one shared mesh, each with its own position, uniform scale and color
+class InstancedMeshSet:
+    INITIAL_CAPACITY = 1024
+    # instances culled together, consecutive in drawn order
+    CHUNK_SIZE = 1024
+
+    def __init__(self, mesh, collision, origin, obj_type="misc"):
+        self.mesh = mesh
+        self.collision = collision
+        self.origin = np.asarray(origin, dtype=np.float32)
+        self.obj_type = obj_type
+        self.enabled = True
+
+        self.count = 0
+        self.positions = np.zeros((self.INITIAL_CAPACITY, 3), dtype=np.float32)
+        self.scales = np.zeros(self.INITIAL_CAPACITY, dtype=np.float32)
+        self.colors = np.zeros((self.INITIAL_CAPACITY, 4), dtype=np.float32)
+        self.data = {}
+
+        self.hovered = -1
+        # buffer order of all instances : every added batch along a Morton curve, so CHUNK_SIZE neighbours in the
+        # buffers are close in space too
+        self.order = np.empty(0, dtype=np.int64)
+        # indices of the drawn instances in buffer order, None draws all
+        self.visible = None
+        # (begin, end) slice of that order actually drawn, moved without touching the buffers
+        self.drawRange = None
+
+        self.positionsVBO = None
+        self.scalesVBO = None
+        self.colorsVBO = None
+        self.dirty = True
+        # bumped whenever what is drawn changes, see GLWidget picking
+        self.version = 0
+
+        # point sprites : instances projected under pointSpritePixels are drawn as one round point each,
+        # above pointSpriteCount drawn instances all of them are. None disables either rule
+        self.pointSpritePixels = None
+        self.pointSpriteCount = None
+        self.extent = float(np.max(np.array(collision.pointEnd) - np.array(collision.pointBegin)))
+        self._nearRows = None
+        self._nearRowsFrame = None
+        self._nearVBOs = None
+        # bumped when the rows of drawn() or their positions change, not by set_draw_range
+        self._rowsVersion = 0
+        # position in drawn() of every instance, -1 when not drawn, see _drawn_hovered
+        self._drawnInverse = None
+        self._drawnInverseKey = None
+        # [key, lo, hi, positions in drawn() of the instances big enough for the mesh, measured over [lo, hi)]
+        self._nearCache = None
+        # (key, near) of the last sprite frame, a frame with the same camera, range, hovered instance and frustum
+        # reuses it as it is
+        self._nearFrame = None
+
+        # instance boxes for picking, kept in step with add / move
+        self.bvh = BoundsBVH()
+        self._pickMask = None
+        self._pickMaskKey = None
+        # id colors for the picking buffer, (base, length) of the uploaded ids
+        self.idsVBO = None
+        self._idsKey = None
+        self._nearIdsVBO = None
+        # vertex arrays of the core renderer, see CoreRenderer
+        self.vaos = {}
+        # boxes of CHUNK_SIZE instances in drawn order, rebuilt with the buffers
+        self._chunkBounds = None
+        # chunks of the last draw
+        self.chunksDrawn = 0
+        self.chunksCulled = 0
+
+    def _reserve(self, count):
+        capacity = len(self.scales)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        self.positions = np.resize(self.positions, (capacity, 3))
+        self.scales = np.resize(self.scales, capacity)
+        self.colors = np.resize(self.colors, (capacity, 4))
+
+    def add(self, positions, scales, colors, **data):
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        n = len(positions)
+        begin, end = self.count, self.count + n
+        self._reserve(end)
+
+        self.positions[begin:end] = positions
+        self.scales[begin:end] = scales
+        self.colors[begin:end] = colors
+        for name, column in data.items():
+            column = np.asarray(column)
+            if name in self.data:
+                self.data[name] = np.concatenate([self.data[name], column])
+            else:
+                self.data[name] = column
+
+        self.count = end
+        self.order = np.concatenate([self.order, begin + np.argsort(morton_codes(positions), kind='stable')])
+        self.dirty = True
+        self.version += 1
+        self._rowsVersion += 1
+        self.bvh.append(*self.bounds(slice(begin, end)))
+        return np.arange(begin, end)
+
+    def move(self, indices, positions):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        self.positions[indices] = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        self.dirty = True
+        self.version += 1
+        self._rowsVersion += 1
+        self.bvh.update(indices, *self.bounds(indices))
+
+    def clear(self):
+        self.count = 0
+        self.order = self.order[:0]
+        self.data = {}
+        self.bvh = BoundsBVH()
+        self.hovered = -1
+        self.visible = None
+        self.drawRange = None
+        self.dirty = True
+        self.version += 1
+        self._rowsVersion += 1
+
+    def set_visible(self, visible=None):
+        # indices in any order (e.g. sorted by time), the buffers are uploaded in that order,
+        # or a boolean mask, the buffer order of all instances is kept then
+        if visible is not None:
+            visible = np.asarray(visible)
+            if visible.dtype == bool:
+                order = self.order[self.order < len(visible)]
+                visible = order[visible[order]]
+            visible = visible[visible < self.count]
+        self.visible = visible
+        self.drawRange = None
+        self.dirty = True
+        self.version += 1
+        self._rowsVersion += 1
+
+    def set_draw_range(self, begin=None, end=None):
+        # draws only drawn()[begin:end], the attribute pointers are offset instead of re-uploading
+        self.drawRange = None if begin is None else (begin, end)
+        self.version += 1
+
+    def drawn(self):
+        if self.visible is None:
+            return self.order
+        return self.visible
+
+    def _range(self):
+        count = self.count if self.visible is None else len(self.visible)
+        if self.drawRange is None:
+            return 0, count
+        begin, end = self.drawRange
+        end = min(count, end)
+        return min(begin, end), end
+
+    def drawn_rows(self):
+        begin, end = self._range()
+        return self.drawn()[begin:end]
+
+    def drawn_count(self):
+        begin, end = self._range()
+        return end - begin
+
+    def row_at(self, position):
+        # instance index of a position in the buffers, as drawn into the picking buffer
+        return int(self.drawn()[position])
+
+    def on_hover(self, index):
+        self.hovered = index
+
+    def on_unhover(self):
+        self.hovered = -1
+
+    def bounds(self, rows=None):
+        # per-instance axis aligned boxes, placed the same way as in the shader
+        rows = slice(0, self.count) if rows is None else rows
+        scales = self.scales[rows, None]
+        positions = self.positions[rows]
+        local_min = np.array(self.collision.pointBegin, dtype=np.float32) - self.origin
+        local_max = np.array(self.collision.pointEnd, dtype=np.float32) - self.origin
+        return positions + local_min * scales, positions + local_max * scales
+
+    def _drawn_mask(self):
+        # None when every instance is drawn, rebuilt only when the visible set or the range changes
+        if self.visible is None and self.drawRange is None:
+            return None
+        key = (self.visible, self._range(), self.count)
+        if self._pickMaskKey is None or self._pickMaskKey[0] is not key[0] or self._pickMaskKey[1:] != key[1:]:
+            self._pickMask = np.zeros(self.count, dtype=bool)
+            self._pickMask[self.drawn_rows()] = True
+            self._pickMaskKey = key
+        return self._pickMask
+
+    def pick(self, origin, direction, t_min, t_max):
+        # nearest drawn instance box on the ray, returns (index, distance) or (-1, -1.0)
+        if not self.enabled or self.drawn_count() == 0 or not self.collision.enabled:
+            return -1, -1.0
+        return self.bvh.ray_nearest(origin, direction, t_min, t_max, self._drawn_mask())
+
+    def _sync_buffers(self):
+        if not self.dirty:
+            return
+        rows = self.drawn()
+        if self.positionsVBO is None:
+            self.positionsVBO = vbo.VBO(self.positions[rows])
+            self.scalesVBO = vbo.VBO(self.scales[rows])
+            self.colorsVBO = vbo.VBO(self.colors[rows])
+        else:
+            self.positionsVBO.set_array(self.positions[rows])
+            self.scalesVBO.set_array(self.scales[rows])
+            self.colorsVBO.set_array(self.colors[rows])
+        self._chunkBounds = None
+        self.dirty = False
+
+    def _chunk_boxes(self):
+        if self._chunkBounds is None:
+            box_min, box_max = self.bounds(self.drawn())
+            starts = np.arange(0, len(box_min), self.CHUNK_SIZE)
+            self._chunkBounds = (np.minimum.reduceat(box_min, starts, axis=0),
+                                 np.maximum.reduceat(box_max, starts, axis=0))
+        return self._chunkBounds
+
+    def _visible_runs(self, planes, first, count):
+        # [(first, count)] runs of buffer positions of [first, first + count) in chunks inside the frustum
+        if planes is None:
+            return [(first, count)]
+        box_min, box_max = self._chunk_boxes()
+        begin, end = first // self.CHUNK_SIZE, (first + count - 1) // self.CHUNK_SIZE + 1
+        visible = boxes_in_frustum(planes, box_min[begin:end], box_max[begin:end])
+        self.chunksDrawn = int(np.count_nonzero(visible))
+        self.chunksCulled = len(visible) - self.chunksDrawn
+
+        offsets = np.arange(begin, end) * self.CHUNK_SIZE
+        starts, lengths = visible_ranges(offsets, np.full(end - begin, self.CHUNK_SIZE), visible)
+        runs = []
+        for start, length in zip(starts.tolist(), lengths.tolist()):
+            run_first, run_end = max(start, first), min(start + length, first + count)
+            runs.append((run_first, run_end - run_first))
+        return runs
+
+    def _drawn_inverse(self):
+        # position in drawn() of every instance, -1 for the ones not drawn, rebuilt only when the rows change
+        if self._drawnInverseKey != self._rowsVersion:
+            drawn = self.drawn()
+            self._drawnInverse = np.full(self.count, -1, dtype=np.int64)
+            self._drawnInverse[drawn] = np.arange(len(drawn))
+            self._drawnInverseKey = self._rowsVersion
+        return self._drawnInverse
+
+    def _drawn_hovered(self):
+        # the shader sees instances in drawn order
+        if not 0 <= self.hovered < self.count:
+            return -1
+        begin, end = self._range()
+        position = int(self._drawn_inverse()[self.hovered])
+        return position - begin if begin <= position < end else -1
+
+    def _bind_attribute(self, program, name, buffer, size, first=0, divisor=1):
+        location = gl.glGetAttribLocation(program, name)
+        if location < 0:
+            return None
+        buffer.bind()
+        DRAW_COUNTERS.bind(buffer)
+        gl.glEnableVertexAttribArray(location)
+        gl.glVertexAttribPointer(location, size, gl.GL_FLOAT, gl.GL_FALSE, 0, buffer + first * size * 4)
+        gl.glVertexAttribDivisor(location, divisor)
+        buffer.unbind()
+        return location
+
+    @staticmethod
+    def _unbind_attributes(locations):
+        for location in locations:
+            if location is not None:
+                gl.glVertexAttribDivisor(location, 0)
+                gl.glDisableVertexAttribArray(location)
+
+    def _measure_near(self, camera, pixel_scale, begin, end):
+        # positions in drawn() of [begin, end) projected at least pointSpritePixels high
+        rows = self.drawn()[begin:end]
+        distance = np.linalg.norm(self.positions[rows] - np.asarray(camera, dtype=np.float32), axis=1)
+        pixels = self.scales[rows] * np.float32(pixel_scale * self.extent) / np.maximum(distance, 1e-6)
+        return begin + np.flatnonzero(pixels >= self.pointSpritePixels)
+
+    def _near_positions(self, camera, pixel_scale):
+        # the big enough instances of the drawn range, in drawn order. Kept for the camera and the drawn rows, a
+        # range overlapping or touching the measured one only measures the rows it adds (playback steps), any
+        # other range starts over (a seek)
+        begin, end = self._range()
+        key = (self._rowsVersion, tuple(float(c) for c in camera), pixel_scale, self.pointSpritePixels)
+        if self._nearCache is None or self._nearCache[0] != key or end < self._nearCache[1] \
+                or begin > self._nearCache[2]:
+            self._nearCache = [key, begin, begin, np.empty(0, dtype=np.int64)]
+        cache = self._nearCache
+        if begin < cache[1]:
+            cache[3] = np.concatenate([self._measure_near(camera, pixel_scale, begin, cache[1]), cache[3]])
+            cache[1] = begin
+        if end > cache[2]:
+            cache[3] = np.concatenate([cache[3], self._measure_near(camera, pixel_scale, cache[2], end)])
+            cache[2] = end
+        near = cache[3]
+        return near[np.searchsorted(near, begin):np.searchsorted(near, end)] - begin
+
+    def _near_rows(self, camera, pixel_scale, count):
+        # positions in drawn order of the instances still big enough on screen for the mesh, the hovered one included
+        if self.pointSpriteCount is not None and count > self.pointSpriteCount:
+            near = np.empty(0, dtype=np.int64)
+        elif self.pointSpritePixels is None:
+            return None
+        else:
+            near = self._near_positions(camera, pixel_scale)
+        hovered = self._drawn_hovered()
+        if hovered >= 0 and hovered not in near:
+            near = np.sort(np.append(near, hovered))
+        return near
+
+    def _id_buffer(self, id_base):
+        # ids follow the buffer order, so they only change when the buffers are uploaded again
+        key = (id_base, len(self.drawn()))
+        if self._idsKey != key:
+            ids = encode_ids(id_base + np.arange(key[1]))
+            if self.idsVBO is None:
+                self.idsVBO = vbo.VBO(ids)
+            else:
+                self.idsVBO.set_array(ids)
+            self._idsKey = key
+        return self.idsVBO
+
+    def _near_id_buffer(self, ids):
+        if self._nearIdsVBO is None:
+            self._nearIdsVBO = vbo.VBO(encode_ids(ids))
+        else:
+            self._nearIdsVBO.set_array(encode_ids(ids))
+        return self._nearIdsVBO
+
+    def _near_frame(self, camera, pixel_scale, count, planes):
+        # _near_rows of the frame with the instances outside the frustum dropped, None without sprites
+        key = (self._rowsVersion, tuple(float(c) for c in camera), pixel_scale, self.pointSpritePixels,
+               self.pointSpriteCount, self._range(), self._drawn_hovered(),
+               None if planes is None else np.asarray(planes).tobytes())
+        if self._nearFrame is not None and self._nearFrame[0] == key:
+            return self._nearFrame[1:]
+        near = self._near_rows(camera, pixel_scale, count)
+        culled = near
+        if near is not None and len(near) < count and planes is not None and len(near):
+            culled = near[boxes_in_frustum(planes, *self.bounds(self.drawn_rows()[near]))]
+        self._nearFrame = (key, near, culled)
+        return near, culled
+
+    def _near_buffers(self, near):
+        # mesh instances of a sprite frame, uploaded again only when that set changes
+        if near is self._nearRowsFrame:
+            return self._nearVBOs
+        rows = self.drawn_rows()[near]
+        if self._nearRows is None or not np.array_equal(self._nearRows, rows):
+            arrays = (self.positions[rows], self.scales[rows], self.colors[rows])
+            if self._nearVBOs is None:
+                self._nearVBOs = tuple(vbo.VBO(array) for array in arrays)
+            else:
+                for buffer, array in zip(self._nearVBOs, arrays):
+                    buffer.set_array(array)
+            self._nearRows = rows
+        self._nearRowsFrame = near
+        return self._nearVBOs
+
+    def draw(self, enable_faces=True, enable_edges=True, camera=None, pixel_scale=None, id_base=None, renderer=None,
+             planes=None):
+        # camera / pixel_scale (viewport height / (2 tan(fov / 2))) are needed for point sprites,
+        # with id_base every instance is drawn in the color of id_base + its position in the buffers,
+        # with a CoreRenderer its programs and vertex arrays are used instead of the ones below,
+        # planes : view frustum, chunks of instances outside it are skipped
+        self.chunksDrawn = self.chunksCulled = 0
+        count = self.drawn_count()
+        if not self.enabled or count == 0:
+            return
+        program = instance_program() if renderer is None else renderer.instanceProgram
+        if program is None:
+            self.draw_fallback(enable_faces, enable_edges, id_base)
+            return
+
+        self._sync_buffers()
+        colors = self.colorsVBO if id_base is None else self._id_buffer(id_base)
+        buffers = (self.positionsVBO, self.scalesVBO, colors)
+        first = self._range()[0]
+        hovered = self._drawn_hovered() if id_base is None else -1
+        runs = self._visible_runs(planes, first, count)
+
+        sprites = None
+        if camera is not None:
+            sprites = sprite_program() if renderer is None else renderer.spriteProgram
+        near, culled = self._near_frame(camera, pixel_scale, count, planes) if sprites is not None else (None, None)
+        if near is not None and len(near) < count:
+            forced = self.pointSpriteCount is not None and count > self.pointSpriteCount
+            max_pixels = np.inf if forced else self.pointSpritePixels
+            for run_first, run_count in runs:
+                if renderer is None:
+                    self._draw_points(sprites, colors, camera, pixel_scale, max_pixels, run_first, run_count)
+                else:
+                    renderer.draw_instance_points(self, colors, camera, pixel_scale, max_pixels, run_first, run_count)
+            near = culled
+            if len(near) == 0:
+                return
+            buffers = self._near_buffers(near)
+            if id_base is not None:
+                buffers = buffers[:2] + (self._near_id_buffer(id_base + first + near),)
+            position = int(np.searchsorted(near, hovered))
+            hovered = position if hovered >= 0 and position < len(near) and near[position] == hovered else -1
+            runs = [(0, len(near))]
+            first = 0
+
+        for run_first, run_count in runs:
+            # the shader compares the hovered position with gl_InstanceID, counted from the run
+            run_hovered = first + hovered - run_first
+            if hovered < 0 or not 0 <= run_hovered < run_count:
+                run_hovered = -1
+            if renderer is None:
+                self._draw_mesh(program, buffers, run_first, run_count, run_hovered, enable_faces, enable_edges,
+                                id_base is not None)
+            else:
+                renderer.draw_instance_mesh(self, buffers, run_first, run_count, run_hovered, enable_faces,
+                                            enable_edges, id_base is not None)
+
+    def _draw_points(self, program, colors, camera, pixel_scale, max_pixels, first, count):
+        gl.glUseProgram(program)
+        gl.glUniform3f(gl.glGetUniformLocation(program, "cameraPosition"), *camera)
+        gl.glUniform1f(gl.glGetUniformLocation(program, "pixelScale"), pixel_scale * self.extent)
+        gl.glUniform1f(gl.glGetUniformLocation(program, "maxPixels"), min(max_pixels, 1e30))
+
+        locations = [self._bind_attribute(program, "instanceScale", self.scalesVBO, 1, divisor=0),
+                     self._bind_attribute(program, "instanceColor", colors, 4, divisor=0)]
+
+        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        gl.glEnable(gl.GL_VERTEX_PROGRAM_POINT_SIZE)
+        gl.glEnable(gl.GL_POINT_SPRITE)
+        self.positionsVBO.bind()
+        gl.glVertexPointer(3, gl.GL_FLOAT, 0, self.positionsVBO)
+        gl.glDrawArrays(gl.GL_POINTS, first, count)
+        DRAW_COUNTERS.bind(self.positionsVBO)
+        DRAW_COUNTERS.draw(gl.GL_POINTS, count)
+        self.positionsVBO.unbind()
+        gl.glDisable(gl.GL_POINT_SPRITE)
+        gl.glDisable(gl.GL_VERTEX_PROGRAM_POINT_SIZE)
+
+        self._unbind_attributes(locations)
+        gl.glUseProgram(0)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+
+    def _draw_mesh(self, program, buffers, first, count, hovered, enable_faces, enable_edges, ids=False):
+        mesh = self.mesh
+        positions, scales, colors = buffers
+
+        gl.glUseProgram(program)
+        gl.glUniform3f(gl.glGetUniformLocation(program, "meshOrigin"), *self.origin)
+        gl.glUniform1i(gl.glGetUniformLocation(program, "hoveredInstance"), hovered)
+        gl.glUniform4f(gl.glGetUniformLocation(program, "hoverColor"), *mesh.colorHovered)
+
+        locations = [self._bind_attribute(program, "instancePosition", positions, 3, first),
+                     self._bind_attribute(program, "instanceScale", scales, 1, first),
+                     self._bind_attribute(program, "instanceColor", colors, 4, first)]
+
+        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        mesh.verticesVBO.bind()
+        gl.glVertexPointer(3, gl.GL_FLOAT, 0, mesh.verticesVBO)
+        DRAW_COUNTERS.bind(mesh.verticesVBO)
+
+        use_color = gl.glGetUniformLocation(program, "useInstanceColor")
+        if enable_faces and mesh.enableFaces and mesh.facesVBO is not None:
+            gl.glUniform1i(use_color, 1)
+            mesh.facesVBO.bind()
+            gl.glDrawElementsInstanced(gl.GL_TRIANGLES, len(mesh.facesTriangles), gl.GL_UNSIGNED_INT, None,
+                                       count)
+            DRAW_COUNTERS.bind(mesh.facesVBO)
+            DRAW_COUNTERS.draw(gl.GL_TRIANGLES, len(mesh.facesTriangles), count)
+            mesh.facesVBO.unbind()
+
+        if enable_edges and mesh.enableEdges and mesh.edgesVBO is not None:
+            # ids are per instance for the edges too
+            gl.glUniform1i(use_color, int(ids))
+            gl.glColor4f(*mesh.colorEdges)
+            mesh.edgesVBO.bind()
+            gl.glDrawElementsInstanced(gl.GL_LINES, len(mesh.edges), gl.GL_UNSIGNED_INT, None, count)
+            DRAW_COUNTERS.bind(mesh.edgesVBO)
+            DRAW_COUNTERS.draw(gl.GL_LINES, len(mesh.edges), count)
+            mesh.edgesVBO.unbind()
+
+        mesh.verticesVBO.unbind()
+        self._unbind_attributes(locations)
+        gl.glUseProgram(0)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+
+    def draw_fallback(self, enable_faces=True, enable_edges=True, id_base=None):
+        # no shaders : still one shared mesh, but one draw per instance
+        mesh = self.mesh
+        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        mesh.verticesVBO.bind()
+        gl.glVertexPointer(3, gl.GL_FLOAT, 0, mesh.verticesVBO)
+
+        begin, end = self._range()
+        ids = encode_ids(id_base + np.arange(begin, end)) if id_base is not None else None
+        for position, i in enumerate(self.drawn_rows().tolist()):
+            if ids is not None:
+                face_color = edge_color = ids[position]
+            elif i == self.hovered:
+                face_color = edge_color = mesh.colorHovered
+            else:
+                face_color, edge_color = self.colors[i], mesh.colorEdges
+
+            gl.glPushMatrix()
+            gl.glTranslate(*self.positions[i])
+            gl.glScale(self.scales[i], self.scales[i], self.scales[i])
+            gl.glTranslate(*(-self.origin))
+
+            if enable_faces and mesh.enableFaces and mesh.facesVBO is not None:
+                gl.glColor4f(*face_color)
+                mesh.facesVBO.bind()
+                gl.glDrawElements(gl.GL_TRIANGLES, len(mesh.facesTriangles), gl.GL_UNSIGNED_INT, None)
+                DRAW_COUNTERS.draw(gl.GL_TRIANGLES, len(mesh.facesTriangles))
+                mesh.facesVBO.unbind()
+
+            if enable_edges and mesh.enableEdges and mesh.edgesVBO is not None:
+                gl.glColor4f(*edge_color)
+                mesh.edgesVBO.bind()
+                gl.glDrawElements(gl.GL_LINES, len(mesh.edges), gl.GL_UNSIGNED_INT, None)
+                DRAW_COUNTERS.draw(gl.GL_LINES, len(mesh.edges))
+                mesh.edgesVBO.unbind()
+            gl.glPopMatrix()
+
+        mesh.verticesVBO.unbind()
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
@@ -5,9 +5,6 @@ from PyQt5 import QtOpenGL  # provides QGLWidget, a special OpenGL QWidget
 import OpenGL.GL as gl  # python wrapping of OpenGL
 from OpenGL import GLU  # OpenGL Utility Library, extends OpenGL functionality
 
-from OpenGL.arrays import vbo
-from ezdxf.entities import Face3d
-
 from pyglm import glm
 
 import numpy as np
@@ -16,8 +13,20 @@ from AppWindow import MainWindow
 import math
 import sys  # we'll need this later to run our Qt application
 
-from object_constructors import create_cube, create_dxf_object, create_sphere, create_pyramid, create_detector, \
-    create_event
+from bvh import BoundsBVH
+from core_renderer import CoreRenderer
+from culling import CULLING_COUNTERS, boxes_in_frustum, draw_elements, frustum_planes, local_planes
+from event_catalog import EventCatalog
+from frame_profiler import DRAW_COUNTERS, FrameProfiler
+from frame_scheduler import FrameScheduler
+from mesh_cache import MeshCache
+from picking import PickingBuffer, object_id_color, instance_id_base
+from playback import EventPlayback
+from static_batch import EMPTY_RANGES, build_batches, concat_ranges
+from transforms import TRANSFORMS, look_at, perspective
+from object_constructors import create_dxf_object, create_sphere, create_pyramid, create_dxf_object_from_data, \
+    create_event_instances, create_detector_instances, event_colors, event_scale, DETECTOR_SCALE, DETECTOR_COLOR, \
+    release_mesh, MESHES
 from utilities import screen_pos_to_vector
 
 
@@ -41,9 +50,40 @@ class GLWidget(QtOpenGL.QGLWidget):
     ENABLE_EDGES = True
     ENABLE_FACES = True
     ENABLE_HOVER = False
+    # objects, large mesh chunks and instance chunks outside the view are not drawn
+    ENABLE_CULLING = True
+    # DXF objects with the same colors are merged into a few buffers once a project is loaded, see build_static_batches
+    ENABLE_STATIC_BATCHING = True
+    STATIC_BATCH_VERTICES = 1 << 22
+    # ray against the mesh triangles instead of the collision box, for objects with faces
+    EXACT_PICKING = True
+    # "ray" : BVH ray tests on the CPU, "gpu" : ids drawn into an offscreen buffer, one pixel read per hover test
+    PICKING_MODES = ("ray", "gpu")
+    PICKING_MODE = "ray"
+    # "legacy" : fixed function matrices and client arrays, "core" : shaders and vertex arrays only (OpenGL 3.3),
+    # the legacy path stays as the fallback when the core one can't be created
+    RENDERERS = ("legacy", "core")
+    RENDERER = "legacy"
+    ENABLE_MESH_CACHE = True
+    # None keeps the per-face vertices as they are in the file, see set_dxf_welding
+    DXF_WELD_TOLERANCE = None
+    # weld grid step of DXF files opened once welding is turned on in the settings, vertices snapped to the same
+    # grid point are merged (see mesh_processing.weld_vertices)
+    DXF_WELD_GRID = 1e-3
+    # simplified levels built per DXF mesh, a level is drawn while its cells stay under LOD_PIXEL_ERROR pixels
+    DXF_LOD_LEVELS = 3
+    LOD_PIXEL_ERROR = 2.0
+    # events smaller than this many pixels are drawn as point sprites, and all of them above EVENT_SPRITE_COUNT
+    EVENT_SPRITE_PIXELS = 16.0
+    EVENT_SPRITE_COUNT = 200000
+    # per-phase CPU / GPU frame times and draw counters, see set_profiling
+    ENABLE_PROFILER = False
+    # file every profiled frame is appended to (rotated, see FrameProfiler.set_log), None keeps the last frames only
+    PROFILE_LOG = None
 
     def __init__(self, parent=None):
         self.parent = parent
+        self.meshCache = MeshCache() if self.ENABLE_MESH_CACHE else None
 
         self.armLength = 20
 
@@ -53,10 +93,53 @@ class GLWidget(QtOpenGL.QGLWidget):
         self.camX = 0.0
         self.camY = 0.0
         self.camZ = 0.0
+        # view / projection as NumPy matrices, shared by drawing and picking, rebuilt only when they change
+        self.viewMatrix = np.identity(4)
+        self.projectionMatrix = np.identity(4)
+        self.inverseViewProjection = np.identity(4)
 
         self.objects = {}
+        # world boxes of self.objects for picking, rebuilt when objects are added or removed
+        self.objectBVH = None
+        self.objectIds = []
+        # obj_id -> its box in objectBVH
+        self.objectIndex = {}
+        # DXF objects, the ones static batches are built from
+        self.staticObjects = set()
+        self.staticBatches = []
+        # obj_id -> (batch, position of the object in the batch)
+        self.batchedObjects = {}
+        # events and detectors : one shared mesh per type, drawn with a single instanced call
+        self.instanceSets = {"event": create_event_instances(),
+                             "detector": create_detector_instances()}
+        # event attributes, row i is instance i of instanceSets["event"]
+        self.instanceSets["event"].pointSpritePixels = self.EVENT_SPRITE_PIXELS
+        self.instanceSets["event"].pointSpriteCount = self.EVENT_SPRITE_COUNT
+        self.eventCatalog = EventCatalog()
+        self.eventFilter = {}
+        self.pendingUploads = []
         self.pickedObjects = []
         self.hoveredObject = -1
+        self.hoveredInstance = None
+        # last clicked surface point : (obj_id, hit point, face, distance), see pick_surface
+        self.pickedPoint = None
+        self.pickingMode = self.PICKING_MODE
+        self.pickingBuffer = PickingBuffer()
+        self.pickingMouse = None
+        # bumped when objects are added, removed or moved, part of the picking buffer key
+        self.sceneVersion = 0
+        self.rendererName = self.RENDERER
+        # CoreRenderer, created in the GL context on the first core frame, None while drawing the legacy way
+        self.coreRenderer = None
+        self.renderer = None
+        # planes of the view frustum of the current frame, None draws everything
+        self.frustumPlanes = None
+        self.visibleObjects = None
+        # drawn / culled objects and chunks of the last frame, see CULLING_COUNTERS
+        self.cullingStats = dict.fromkeys(CULLING_COUNTERS, 0)
+        self.profiler = FrameProfiler(self.ENABLE_PROFILER)
+        if self.PROFILE_LOG is not None:
+            self.profiler.set_log(self.PROFILE_LOG)
         self.viewTarget = None
 
         self.mousePos = (0, 0)
@@ -66,20 +149,35 @@ class GLWidget(QtOpenGL.QGLWidget):
 
         QtOpenGL.QGLWidget.__init__(self, parent)
 
+        # frames are drawn on request only, see request_frame
+        self.scheduler = FrameScheduler(self, parent=self)
+        # buffers are swapped in paintGL, see _swap_buffers
+        self.setAutoBufferSwap(False)
+        # hover follows the mouse without a button held, see update_hover
+        self.setMouseTracking(self.ENABLE_HOVER)
+        # removed with the widget, the store is shared by every widget of the process
+        listener = TRANSFORMS.add_listener(self.request_frame)
+        self.destroyed.connect(lambda: TRANSFORMS.remove_listener(listener))
+
+        self.playback = EventPlayback(self.eventCatalog, self.instanceSets["event"], parent=self)
+        self.playback.cursorChanged.connect(lambda cursor: self.request_frame())
+
     def initializeGL(self):
-        self.qglClearColor(QtGui.QColor(152, 221, 250))
+        # plain GL instead of qglClearColor, so the widget also renders in a context Qt did not create
+        gl.glClearColor(152 / 255, 221 / 255, 250 / 255, 1.0)
         gl.glEnable(gl.GL_DEPTH_TEST)
 
         #self._init_geometry("../korkino_model.dxf")
-        gl.glPushMatrix()
 
     def resizeGL(self, width, height):
         gl.glViewport(0, 0, width, height)
-        gl.glMatrixMode(gl.GL_PROJECTION)
-        gl.glLoadIdentity()
-        self.ASPECT_RATIO = width / float(height)
+        self.ASPECT_RATIO = width / float(max(height, 1))
+        self.projectionMatrix = perspective(self.FIELD_OF_VIEW, self.ASPECT_RATIO, self.RENDER_DISTANCE_NEAR,
+                                            self.RENDER_DISTANCE_FAR)
+        self.inverseViewProjection = np.linalg.inv(self.projectionMatrix @ self.viewMatrix)
 
-        GLU.gluPerspective(self.FIELD_OF_VIEW, self.ASPECT_RATIO, self.RENDER_DISTANCE_NEAR, self.RENDER_DISTANCE_FAR)
+        gl.glMatrixMode(gl.GL_PROJECTION)
+        gl.glLoadMatrixd(self.projectionMatrix.T)
         gl.glMatrixMode(gl.GL_MODELVIEW)
 
     def mousePressEvent(self, a0):
@@ -99,6 +197,8 @@ class GLWidget(QtOpenGL.QGLWidget):
                 self.addRotX(dx)
                 self.addRotY(dy)
                 self.mousePrevEvent = (a0.x(), a0.y())
+        elif self.ENABLE_HOVER:
+            self.update_hover()
 
     def mouseReleaseEvent(self, a0):
         clicked = self.mousePrevEvent == self.mouseCapturedEvent
@@ -113,58 +213,226 @@ class GLWidget(QtOpenGL.QGLWidget):
         # print("Released", a0.x(), a0.y())
 
     def mouseClickEvent(self, a0):
-        pass
+        self.pickedPoint = self.pick_surface()
 
     def wheelEvent(self, a0):
         da = a0.angleDelta().y() / 15 / 8 * self.SENSITIVITY_ARM
         self.armLength = max(self.ARM_MIN, min(self.ARM_MAX, int(self.armLength - max(da * 0.02 * self.armLength, da / 5, key=math.fabs))))
+        self.request_frame()
+
+    def request_frame(self):
+        # asks for a repaint, merged with the other requests made before it is drawn
+        self.scheduler.request()
+
+    def update_hover(self):
+        # hover under the mouse against the last drawn frame, a frame is requested only when it changes
+        if self.pickingMode == "gpu":
+            if self.pickingBuffer.key is None:
+                self.request_frame()
+                return
+            self.makeCurrent()
+            self.check_collision_gpu()
+        else:
+            self.check_collision()
 
-    def check_collision_object(self, direction, obj):
-        tMin = self.RENDER_DISTANCE_NEAR
-        tMax = self.RENDER_DISTANCE_FAR
-        obj_pos = glm.vec3([obj.matrix[3].x, obj.matrix[3].y, obj.matrix[3].z])
-        loc = glm.vec3([self.camX, self.camY, self.camZ])
-        delta = obj_pos - loc
-
-        pts_beg = obj.collision.pointBegin
-        pts_end = obj.collision.pointEnd
-        for i in range(3):
-            axis = glm.vec3([obj.matrix[i].x, obj.matrix[i].y, obj.matrix[i].z])
-            e = glm.dot(axis, delta)
-            f = glm.dot(direction, axis)
-
-            if math.fabs(f) > 0:
-                t1 = (e + pts_beg[i]) / f
-                t2 = (e + pts_end[i] * obj.scale[i]) / f
-
-                if t1 > t2:
-                    t1, t2 = t2, t1
-                if t2 < tMax:
-                    tMax = t2
-                if t1 > tMin:
-                    tMin = t1
-                if tMax < tMin:
-                    return -1.0
-            else:
-                if -e + pts_beg[i] > 0.0 or -e + pts_end[i] < 0.0:
-                    return -1.0
-        return tMin
+    def _object_bvh(self):
+        if self.objectBVH is None:
+            self.objectIds = list(self.objects)
+            self.objectIndex = {obj_id: index for index, obj_id in enumerate(self.objectIds)}
+            bounds = [self.objects[obj_id].world_bounds() for obj_id in self.objectIds]
+            self.objectBVH = BoundsBVH([b[0] for b in bounds], [b[1] for b in bounds])
+            self.objectBVH.build()
+        return self.objectBVH
+
+    def update_transforms(self):
+        # matrices of every object moved since the last frame in one pass, their picking boxes are refitted
+        TRANSFORMS.update()
+        moved = [obj.id for obj in TRANSFORMS.take_moved() if self.objects.get(obj.id) is obj]
+        if not moved:
+            return
+        self.sceneVersion += 1
+        for obj_id in moved:
+            self._unbatch(obj_id)
+        if self.objectBVH is not None:
+            bounds = [self.objects[obj_id].world_bounds() for obj_id in moved]
+            self.objectBVH.update([self.objectIndex[obj_id] for obj_id in moved],
+                                  [b[0] for b in bounds], [b[1] for b in bounds])
+
+    def _mouse_ray(self):
+        # widget y grows downwards
+        direction = screen_pos_to_vector(self.mousePos[0], self.height() - self.mousePos[1], self.width(),
+                                         self.height(), self.inverseViewProjection)
+        return np.array([self.camX, self.camY, self.camZ]), direction
+
+    def _pick_objects(self, origin, direction):
+        # nearest object on the ray : (obj_id, distance, hit point, face) or None,
+        # face is the source face of the hit triangle (the 3DFACE index of a DXF model, see ObjectMesh.source_face)
+        # for exact picks and -1 when only the collision box was hit
+        bvh = self._object_bvh()
+        if not len(bvh):
+            return None
+        pickable = np.array([self.objects[i].enabled and self.objects[i].collision.enabled for i in self.objectIds])
+        indices, near = bvh.ray_all(origin, direction, self.RENDER_DISTANCE_NEAR, self.RENDER_DISTANCE_FAR,
+                                    pickable)
+
+        best = None
+        for index, box_dist in zip(indices, near):
+            if best is not None and box_dist >= best[1]:
+                break
+            obj = self.objects[self.objectIds[index]]
+            triangles = obj.mesh.triangle_bvh() if self.EXACT_PICKING and obj.mesh.enableFaces else None
+            if triangles is None:
+                best = (obj.id, float(box_dist), origin + box_dist * direction, -1)
+                continue
+            local_origin, local_direction = obj.ray_to_local(origin, direction)
+            hit = triangles.ray_nearest_point(local_origin, local_direction, self.RENDER_DISTANCE_NEAR,
+                                              self.RENDER_DISTANCE_FAR if best is None else best[1])
+            if hit is not None:
+                best = (obj.id, hit[2], origin + hit[2] * direction, obj.mesh.source_face(hit[1]))
+        return best
+
+    def pick_surface(self):
+        # object surface under the mouse : (obj_id, hit point, face, distance) or None
+        if self.viewTarget is None:
+            return None
+        hit = self._pick_objects(*self._mouse_ray())
+        if hit is None:
+            return None
+        obj_id, dist, point, face = hit
+        return obj_id, point, face, dist
+
+    def distance_to_event(self, index, point=None):
+        # from a surface point (the last clicked one by default) to an event of the catalog
+        if point is None:
+            if self.pickedPoint is None:
+                return None
+            point = self.pickedPoint[1]
+        return float(np.linalg.norm(self.eventCatalog.event(index).location - point))
 
     def check_collision(self):
-        cam = glm.vec3([self.camX, self.camY, self.camZ])
-        direction = screen_pos_to_vector(self.mousePos[0], self.mousePos[1], self.width(), self.height(), cam,
-                                         glm.vec3(self.viewTarget.location))
+        origin, direction = self._mouse_ray()
 
         obj_id = -1
         dist = self.RENDER_DISTANCE_FAR * 2
 
-        for obj in self.objects:
-            if self.objects[obj].enabled and self.objects[obj].collision.enabled:
-                cur = self.check_collision_object(direction, self.objects[obj])
-                if 0.0 < cur < dist:
-                    obj_id = obj
-                    dist = cur
-
+        hit = self._pick_objects(origin, direction)
+        if hit is not None:
+            obj_id, dist = hit[0], hit[1]
+
+        instance = None
+        for name, instances in self.instanceSets.items():
+            index, cur = instances.pick(origin, direction, self.RENDER_DISTANCE_NEAR, dist)
+            if index >= 0 and 0.0 < cur < dist:
+                instance = (name, index)
+                dist = cur
+        if instance is not None:
+            obj_id = -1
+
+        self._set_hover(obj_id, instance)
+
+    def set_picking_mode(self, mode):
+        if mode not in self.PICKING_MODES:
+            raise ValueError(f"unknown picking mode {mode}")
+        self.pickingMode = mode
+        self.request_frame()
+
+    def set_renderer(self, name):
+        if name not in self.RENDERERS:
+            raise ValueError(f"unknown renderer {name}")
+        self.rendererName = name
+        self.request_frame()
+
+    def _select_renderer(self):
+        # needs the current GL context
+        self.renderer = None
+        if self.rendererName != "core":
+            return
+        if self.coreRenderer is None:
+            try:
+                self.coreRenderer = CoreRenderer()
+            except Exception as e:
+                print(f"Core profile renderer disabled: {e}")
+                self.rendererName = "legacy"
+                return
+        self.renderer = self.coreRenderer
+        self.renderer.begin_frame(self.projectionMatrix @ self.viewMatrix)
+
+    def _picking_key(self):
+        # everything the id buffer depends on, the matrices are the ones this frame is drawn with. The enabled flags
+        # are plain attributes that do not bump sceneVersion, so they are part of the key themselves
+        return (self.viewMatrix.tobytes(), self.projectionMatrix.tobytes(), self.width(), self.height(), self.sceneVersion,
+                tuple((obj.enabled, obj.mesh.enabled, obj.collision.enabled) for obj in self.objects.values()),
+                tuple((instances.enabled, instances.version) for instances in self.instanceSets.values()))
+
+    def _draw_ids(self):
+        if self.renderer is None:
+            gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        for obj in self.objects.values():
+            if obj.id in self.batchedObjects:
+                continue
+            if self.visibleObjects is not None and obj.id not in self.visibleObjects:
+                continue
+            if obj.enabled and obj.mesh.enabled and obj.collision.enabled:
+                self.draw_object(obj, object_id_color(obj.id))
+        for batch in self.staticBatches:
+            self.draw_batch(batch, ids=True)
+
+        camera = (self.camX, self.camY, self.camZ)
+        pixel_scale = self.height() / (2.0 * math.tan(math.radians(self.FIELD_OF_VIEW) / 2.0))
+        for set_index, instances in enumerate(self.instanceSets.values()):
+            if instances.collision.enabled:
+                instances.draw(self.ENABLE_FACES, self.ENABLE_EDGES, camera, pixel_scale, instance_id_base(set_index),
+                               self.renderer, self.frustumPlanes)
+        if self.renderer is None:
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+
+    def update_picking_buffer(self):
+        # needs the current GL context, redraws only when the view or the scene changed since the last time.
+        # returns True when it was redrawn
+        key = self._picking_key()
+        if key == self.pickingBuffer.key:
+            return False
+        self.pickingBuffer.begin(self.width(), self.height())
+        self._draw_ids()
+        self.pickingBuffer.end(key)
+        return True
+
+    def pick_id(self, x, y):
+        # what is drawn at widget pixel (x, y) : ("object", obj_id), (instance set name, index) or None
+        picked = self.pickingBuffer.read(x, y)
+        if picked is None:
+            return None
+        if picked[0] == 'object':
+            return picked if picked[1] in self.objects else None
+        names = list(self.instanceSets)
+        if picked[1] >= len(names):
+            return None
+        return names[picked[1]], self.instanceSets[names[picked[1]]].row_at(picked[2])
+
+    def check_collision_gpu(self):
+        # the pixel is read again only when the mouse moved or the buffer was redrawn
+        if not self.update_picking_buffer() and self.pickingMouse == self.mousePos:
+            return
+        self.pickingMouse = self.mousePos
+        picked = self.pick_id(*self.mousePos)
+        if picked is None:
+            self._set_hover(-1, None)
+        elif picked[0] == 'object':
+            self._set_hover(picked[1], None)
+        else:
+            self._set_hover(-1, picked)
+
+    def _set_hover(self, obj_id, instance):
+        if obj_id != self.hoveredObject or instance != self.hoveredInstance:
+            self.request_frame()
+
+        if instance != self.hoveredInstance:
+            if self.hoveredInstance is not None:
+                self.instanceSets[self.hoveredInstance[0]].on_unhover()
+            if instance is not None:
+                self.instanceSets[instance[0]].on_hover(instance[1])
+            self.hoveredInstance = instance
 
         if obj_id == -1 and self.hoveredObject != -1:
             self.objects[self.hoveredObject].on_unhover()
@@ -177,43 +445,190 @@ class GLWidget(QtOpenGL.QGLWidget):
             self.hoveredObject = obj_id
             self.objects[obj_id].on_hover()
 
-    def draw_object(self, obj):
+    def select_lod(self, obj):
+        mesh = obj.mesh
+        if not mesh.lods:
+            return mesh
+
+        scale = float(np.max(np.abs(obj.scale)))
+        pts_beg = np.array(obj.collision.pointBegin)
+        pts_end = np.array(obj.collision.pointEnd)
+        center = obj.location + (pts_beg + pts_end) / 2.0 * obj.scale
+        radius = np.linalg.norm(pts_end - pts_beg) / 2.0 * scale
+
+        distance = np.linalg.norm(center - np.array([self.camX, self.camY, self.camZ])) - radius
+        distance = max(distance, self.RENDER_DISTANCE_NEAR)
+        pixels_per_unit = self.height() / (2.0 * distance * math.tan(math.radians(self.FIELD_OF_VIEW) / 2.0))
+
+        for cell_size, lod in mesh.lods:
+            if cell_size * scale * pixels_per_unit > self.LOD_PIXEL_ERROR:
+                break
+            mesh = lod
+        return mesh
+
+    @staticmethod
+    def _bind_color(buffer, color, size):
+        if buffer is not None:
+            gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+            buffer.bind()
+            DRAW_COUNTERS.bind(buffer)
+            gl.glColorPointer(size, gl.GL_FLOAT, 0, buffer)
+        else:
+            # uniform mesh color, no per-vertex buffer
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+            gl.glColor4f(*color)
+
+    @staticmethod
+    def _unbind_color(buffer):
+        if buffer is not None:
+            buffer.unbind()
+
+    def _index_ranges(self, obj, mesh, kind, count):
+        # visible index ranges of a chunked mesh, the chunks are counted in cullingStats when count is set
+        if self.frustumPlanes is None:
+            return None
+        ranges, drawn, culled = mesh.draw_ranges(kind, local_planes(self.frustumPlanes, obj.matrix))
+        if count:
+            self.cullingStats['mesh_chunks_drawn'] += drawn
+            self.cullingStats['mesh_chunks_culled'] += culled
+        return ranges
+
+    def _cull(self):
+        # frustum of this frame, kept for the id buffer drawn with the same matrices
+        self.cullingStats = dict.fromkeys(CULLING_COUNTERS, 0)
+        if not self.ENABLE_CULLING:
+            self.frustumPlanes = self.visibleObjects = None
+            return
+        self.frustumPlanes = frustum_planes(self.projectionMatrix @ self.viewMatrix)
+        self.visibleObjects = self._visible_objects(self.frustumPlanes)
+
+    def _visible_objects(self, planes):
+        # ids of the objects whose world box (from the collision box) is at least partly inside the frustum
+        bvh = self._object_bvh()
+        if not len(bvh):
+            return set()
+        inside = boxes_in_frustum(planes, bvh.box_min, bvh.box_max)
+        return {self.objectIds[index] for index in np.flatnonzero(inside)}
+
+    def draw_object(self, obj, id_color=None):
+        # id_color : draws faces and edges in that color only, for the picking buffer
+        mesh = self.select_lod(obj)
+        ranges = {kind: self._index_ranges(obj, mesh, kind, id_color is None) for kind in mesh.chunks}
+        self.draw_mesh(mesh, obj.gl_matrix, obj.hover, id_color, ranges)
+
+    def draw_mesh(self, mesh, gl_matrix, hovered=False, id_color=None, ranges=None):
+        # ranges : {kind: (offsets, counts)} index ranges drawn instead of the whole faces / edges
+        ranges = ranges or {}
+        if self.renderer is not None:
+            self.renderer.draw_mesh(mesh, gl_matrix, hovered, self.ENABLE_FACES, self.ENABLE_EDGES, id_color, ranges)
+            return
+
         gl.glPushMatrix()
+        gl.glMultMatrixf(gl_matrix)
 
-        gl.glTranslate(*obj.location)
-        gl.glRotatef(obj.rotation[0], 1.0, 0.0, 0.0)
-        gl.glRotatef(obj.rotation[1], 0.0, 1.0, 0.0)
-        gl.glRotatef(obj.rotation[2], 0.0, 0.0, 1.0)
-        gl.glScale(*obj.scale)
-        # gl.glTranslate(*(obj.origin * -1))
-        obj.mesh.verticesVBO.bind()
-        gl.glVertexPointer(3, gl.GL_FLOAT, 0, obj.mesh.verticesVBO)
+        mesh.verticesVBO.bind()
+        gl.glVertexPointer(3, gl.GL_FLOAT, 0, mesh.verticesVBO)
+        DRAW_COUNTERS.bind(mesh.verticesVBO)
 
+        if self.ENABLE_FACES and mesh.facesVBO is not None and mesh.enableFaces:
+            if id_color is None:
+                self._bind_color(mesh.colorsFacesVBO, mesh.colorFaces, 4)
+            else:
+                self._bind_color(None, id_color, 4)
 
-        if self.ENABLE_FACES and (obj.mesh.facesQuads is not None or obj.mesh.facesTriangles is not None) and obj.mesh.enableFaces:
-            obj.mesh.colorsFacesVBO.bind()
-            gl.glColorPointer(4, gl.GL_FLOAT, 0, obj.mesh.colorsFacesVBO)
+            mesh.facesVBO.bind()
+            DRAW_COUNTERS.bind(mesh.facesVBO)
+            draw_elements(gl.GL_TRIANGLES, len(mesh.facesTriangles), ranges.get('faces'))
+            mesh.facesVBO.unbind()
 
-            if obj.mesh.facesTriangles is not None:
-                gl.glDrawElements(gl.GL_TRIANGLES, len(obj.mesh.facesTriangles), gl.GL_UNSIGNED_INT,
-                                  obj.mesh.facesTriangles)
+            self._unbind_color(mesh.colorsFacesVBO if id_color is None else None)
 
-            if obj.mesh.facesQuads is not None:
-                gl.glDrawElements(gl.GL_QUADS, len(obj.mesh.facesQuads), gl.GL_UNSIGNED_INT,
-                                  obj.mesh.facesQuads)
+        if (hovered or self.ENABLE_EDGES and mesh.enableEdges) and mesh.edgesVBO is not None:
+            colors, color = mesh.edge_colors(hovered) if id_color is None else (None, id_color)
+            self._bind_color(colors, color, 3)
 
-            obj.mesh.colorsFacesVBO.unbind()
+            mesh.edgesVBO.bind()
+            DRAW_COUNTERS.bind(mesh.edgesVBO)
+            draw_elements(gl.GL_LINES, len(mesh.edges), ranges.get('edges'))
+            mesh.edgesVBO.unbind()
 
-        if obj.hover or self.ENABLE_EDGES and obj.mesh.edges is not None and obj.mesh.enableEdges:
-            obj.mesh.colorsEdgesActiveVBO.bind()
-            gl.glColorPointer(3, gl.GL_FLOAT, 0, obj.mesh.colorsEdgesActiveVBO)
-            gl.glDrawElements(gl.GL_LINES, len(obj.mesh.edges), gl.GL_UNSIGNED_INT, obj.mesh.edges)
-            obj.mesh.colorsEdgesActiveVBO.unbind()
+            self._unbind_color(colors)
 
-        obj.mesh.verticesVBO.unbind()
+        mesh.verticesVBO.unbind()
 
         gl.glPopMatrix()
 
+    def build_static_batches(self):
+        # merges the DXF objects drawn with the same colors into a few buffers, drawn with one call per kind.
+        # Objects moved or removed later leave their batch, calling this again compacts the batches
+        self.makeCurrent()
+        self.release_static_batches()
+        objects = [self.objects[obj_id] for obj_id in sorted(self.staticObjects)]
+        self.staticBatches = build_batches(objects, self.STATIC_BATCH_VERTICES)
+        for batch in self.staticBatches:
+            batch.upload()
+            for position, obj in enumerate(batch.objects):
+                self.batchedObjects[obj.id] = (batch, position)
+                # drawn from the batch, its own buffers are uploaded again if it is ever drawn alone
+                if obj.mesh in self.pendingUploads:
+                    self.pendingUploads.remove(obj.mesh)
+                obj.mesh.unload()
+        self.sceneVersion += 1
+        self.request_frame()
+        return len(self.staticBatches)
+
+    def release_static_batches(self):
+        # needs the GL context
+        for batch in self.staticBatches:
+            batch.release()
+        self.staticBatches = []
+        self.batchedObjects = {}
+        self.sceneVersion += 1
+
+    def _unbatch(self, obj_id):
+        batch, position = self.batchedObjects.pop(obj_id, (None, None))
+        if batch is None:
+            return
+        batch.remove(position)
+        if batch.is_empty():
+            self.makeCurrent()
+            batch.release()
+            self.staticBatches.remove(batch)
+
+    def draw_batch(self, batch, ids=False):
+        # one multi-draw per level of detail and kind for every drawn object of the batch,
+        # hovered edges are drawn on their own and the id buffer gets one draw per object
+        stats = self.cullingStats
+        levels = {}
+        for position, obj in batch.drawn_sources():
+            if not (obj.enabled and obj.mesh.enabled) or ids and not obj.collision.enabled:
+                continue
+            if self.visibleObjects is not None and obj.id not in self.visibleObjects:
+                stats['objects_culled'] += not ids
+                continue
+            stats['objects_drawn'] += not ids
+            level = batch.level_of(obj, self.select_lod(obj))
+            planes = None if self.frustumPlanes is None else local_planes(self.frustumPlanes, obj.matrix)
+            ranges, drawn, culled = batch.source_ranges(level, position, planes)
+            if not ids:
+                stats['mesh_chunks_drawn'] += drawn
+                stats['mesh_chunks_culled'] += culled
+            levels.setdefault(level, []).append((obj, ranges))
+
+        identity = np.identity(4, dtype=np.float32)
+        for level, sources in levels.items():
+            mesh = batch.levels[level]
+            if ids:
+                for obj, ranges in sources:
+                    self.draw_mesh(mesh, identity, False, object_id_color(obj.id), ranges)
+                continue
+            ranges = {'faces': concat_ranges(r['faces'] for obj, r in sources),
+                      'edges': concat_ranges(r['edges'] for obj, r in sources if not obj.hover)}
+            self.draw_mesh(mesh, identity, False, None, ranges)
+            for obj, r in sources:
+                if obj.hover:
+                    self.draw_mesh(mesh, identity, True, None, {'faces': EMPTY_RANGES, 'edges': r['edges']})
+
     def _compute_camera(self):
         if self.viewTarget is not None:
             x, y, z = self.viewTarget.location + self.viewTarget.origin
@@ -221,103 +636,306 @@ class GLWidget(QtOpenGL.QGLWidget):
             self.camY = y + self.armLength * math.cos(self.rotY)
             self.camZ = z + self.armLength * math.sin(self.rotY) * math.sin(self.rotX)
 
-    def _position_camera(self):
-        if self.viewTarget is not None:
-            x, y, z = self.viewTarget.location + self.viewTarget.origin
-            GLU.gluLookAt(self.camX, self.camY, self.camZ, x, y, z, 0.0, 1.0, 0.0)
+            view = look_at((self.camX, self.camY, self.camZ), (x, y, z))
+            if not np.array_equal(view, self.viewMatrix):
+                self.viewMatrix = view
+                self.inverseViewProjection = np.linalg.inv(self.projectionMatrix @ view)
 
     def paintGL(self):
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
-
-        self._compute_camera()
-        if self.ENABLE_HOVER:
-            self.check_collision()
-
-        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
-        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
-
-        for obj in self.objects:
-            if self.objects[obj].enabled and self.objects[obj].mesh.enabled:
-                self.draw_object(self.objects[obj])
-
-        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
-        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
-
-        gl.glPopMatrix()
-        gl.glPushMatrix()
-
-        self._position_camera()
+        start = self.scheduler.begin_frame()
+        self.profiler.begin_frame()
+        try:
+            self.draw_scene()
+            if self.profiler.overlay:
+                self.draw_profiler_overlay()
+            with self.profiler.phase("swap"):
+                self._swap_buffers()
+        finally:
+            self.profiler.end_frame(dict(self.cullingStats, frame_interval_ms=self.scheduler.interval))
+            self.scheduler.end_frame(start)
+
+    def _swap_buffers(self):
+        # auto swap is off so the swap is timed with the frame, a widget drawn offscreen has nothing to swap
+        if self.isVisible() and self.doubleBuffer():
+            self.swapBuffers()
+
+    def draw_scene(self):
+        profiler = self.profiler
+        with profiler.phase("clear"):
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+        with profiler.phase("uploads"):
+            self._upload_pending()
+        with profiler.phase("transforms"):
+            self.update_transforms()
+        with profiler.phase("camera"):
+            self._compute_camera()
+        with profiler.phase("culling"):
+            self._cull()
+        self._select_renderer()
+        if self.renderer is None:
+            gl.glLoadMatrixd(self.viewMatrix.T)
+        with profiler.phase("hover"):
+            if self.ENABLE_HOVER and self.pickingMode == "gpu":
+                self.check_collision_gpu()
+            elif self.ENABLE_HOVER:
+                self.check_collision()
+
+        if self.renderer is None:
+            gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+
+        stats = self.cullingStats
+        with profiler.phase("objects"):
+            for obj in self.objects:
+                if obj in self.batchedObjects:
+                    continue
+                if self.objects[obj].enabled and self.objects[obj].mesh.enabled:
+                    if self.visibleObjects is not None and obj not in self.visibleObjects:
+                        stats['objects_culled'] += 1
+                        continue
+                    stats['objects_drawn'] += 1
+                    self.draw_object(self.objects[obj])
+            for batch in self.staticBatches:
+                self.draw_batch(batch)
+
+        camera = (self.camX, self.camY, self.camZ)
+        pixel_scale = self.height() / (2.0 * math.tan(math.radians(self.FIELD_OF_VIEW) / 2.0))
+        with profiler.phase("instances"):
+            for instances in self.instanceSets.values():
+                instances.draw(self.ENABLE_FACES, self.ENABLE_EDGES, camera, pixel_scale, renderer=self.renderer,
+                               planes=self.frustumPlanes)
+                stats['instance_chunks_drawn'] += instances.chunksDrawn
+                stats['instance_chunks_culled'] += instances.chunksCulled
+
+        if self.renderer is None:
+            gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+            gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        else:
+            self.renderer.end_frame()
+
+    def set_dxf_welding(self, enabled):
+        # applies to the DXF files loaded from now on, their cache entries are kept apart from unwelded ones
+        self.DXF_WELD_TOLERANCE = self.DXF_WELD_GRID if enabled else None
+
+    def set_profiling(self, enabled, overlay=None):
+        # per-phase frame times and draw counters, see FrameProfiler, overlay : drawn on top of the view
+        self.profiler.set_enabled(enabled)
+        if overlay is not None:
+            self.profiler.overlay = overlay
+        self.request_frame()
+
+    def set_profile_log(self, path=None, **limits):
+        # profiled frames appended to path as JSON lines while profiling, see FrameProfiler.set_log
+        self.profiler.set_log(path, **limits)
+
+    def save_profile(self, path):
+        # the last FrameProfiler.LOG_FRAMES profiled frames, CSV or JSON by the extension of path
+        return self.profiler.save(path)
+
+    def draw_profiler_overlay(self):
+        # renderText paints with Qt, so it needs the widget's own context and is skipped offscreen
+        if not self.isVisible():
+            return
+        font = QtGui.QFont("Monospace", 9)
+        font.setStyleHint(QtGui.QFont.TypeWriter)
+        gl.glColor3f(0.0, 0.0, 0.0)
+        for row, line in enumerate(self.profiler.overlay_lines()):
+            self.renderText(8, 16 + 14 * row, line, font)
 
     def add_object_dxf(self, filepath):
-        obj = create_dxf_object(filepath, False)
+        obj = create_dxf_object(filepath, False, self.meshCache, self.DXF_WELD_TOLERANCE, self.DXF_LOD_LEVELS)
+        self._add_dxf(obj)
+
+    def add_object_dxf_data(self, arrays):
+        obj = create_dxf_object_from_data(arrays)
+        self._add_dxf(obj)
+        self.pendingUploads.append(obj.mesh)
+        return obj
+
+    def add_objects_dxf_data(self, arrays_list):
+        # a batch of meshes from ProjectLoader, uploaded to the GPU together in the next frame
+        return [self.add_object_dxf_data(arrays) for arrays in arrays_list]
+
+    def _upload_pending(self):
+        # meshes that arrived since the last frame are copied to the GPU together
+        pending, self.pendingUploads = self.pendingUploads, []
+        for mesh in pending:
+            mesh.upload()
+
+    def _add_dxf(self, obj):
         obj.scale = np.array([1.0, 1.0, 1.0])
-        obj.calculate_matrix()
 
         self.objects[obj.id] = obj
+        self.staticObjects.add(obj.id)
+        self.objectBVH = None
+        self.sceneVersion += 1
         self.viewTarget = obj
+        self.request_frame()
+
+    def remove_object(self, obj_id):
+        obj = self.objects.pop(obj_id, None)
+        if obj is None:
+            return
+        self.staticObjects.discard(obj_id)
+        self._unbatch(obj_id)
+        self.objectBVH = None
+        self.sceneVersion += 1
+        if self.hoveredObject == obj_id:
+            self.hoveredObject = -1
+        if self.viewTarget is obj:
+            self.viewTarget = None
+        if obj.mesh in self.pendingUploads:
+            self.pendingUploads.remove(obj.mesh)
 
-    def add_object_detector(self, det_id, x, y, z):
-        obj = create_detector(det_id, x, y, z)
-        obj.scale = np.array([50.0, 50.0, 50.0])
-        obj.calculate_matrix()
+        # buffers are deleted in the context they were uploaded to
+        self.makeCurrent()
+        release_mesh(obj.mesh)
+        self.request_frame()
 
-        self.objects[obj.id] = obj
+    def mesh_stats(self):
+        # shared primitive meshes only, dxf meshes are unique per object
+        return MESHES.stats()
 
-    def add_object_event(self, x, y, z, event_type, energy):
-        obj = create_event(x, y, z, event_type)
-        s = math.fabs(math.log(energy)) * 10
-        obj.scale = np.array([s, s, s])
-        obj.calculate_matrix()
+    def clear_mesh_cache(self, filepath=None):
+        if self.meshCache is not None:
+            return self.meshCache.invalidate(filepath)
+        return 0
 
-        self.objects[obj.id] = obj
+    def add_object_detector(self, det_id, x, y, z):
+        self.add_detectors({'id': np.array([det_id]), 'x': np.array([x]), 'y': np.array([y]), 'z': np.array([z])})
+
+    def add_object_event(self, x, y, z, event_type, energy):
+        self.add_events({'x': np.array([x]), 'y': np.array([y]), 'z': np.array([z]),
+                         'type': np.array([event_type]), 'energy': np.array([energy])})
+
+    # columns : dicts of equally long NumPy arrays, as read by project_loader,
+    # source : integer the rows are tagged with (e.g. the project they belong to), see remove_tables
+    def add_detectors(self, columns, source=-1):
+        positions = np.column_stack([columns['x'], columns['y'], columns['z']])
+        self.instanceSets["detector"].add(positions, DETECTOR_SCALE, DETECTOR_COLOR, id=columns['id'],
+                                          source=np.full(len(positions), source, dtype=np.int64))
+        self.request_frame()
+
+    def add_events(self, columns, source=-1):
+        positions = np.column_stack([columns['x'], columns['y'], columns['z']])
+        self.eventCatalog.extend(columns)
+        self.instanceSets["event"].add(positions, event_scale(columns['energy']), event_colors(columns['type']),
+                                       source=np.full(len(positions), source, dtype=np.int64))
+        if self.eventFilter or self.playback.prepared:
+            self.set_event_filter(**self.eventFilter)
+        self.request_frame()
+
+    def remove_tables(self, source):
+        # detectors and events added with source : the rest is added again, so instance i stays catalog row i
+        detectors = self.instanceSets["detector"]
+        if detectors.count:
+            keep = detectors.data['source'] != source
+            positions = detectors.positions[:detectors.count][keep]
+            data = {name: column[keep] for name, column in detectors.data.items()}
+            detectors.clear()
+            if len(positions):
+                detectors.add(positions, DETECTOR_SCALE, DETECTOR_COLOR, **data)
+
+        events = self.instanceSets["event"]
+        if events.count:
+            keep = events.data['source'] != source
+            columns = {name: column[keep] for name, column in self.eventCatalog.columns.items()}
+            sources = events.data['source'][keep]
+            self.eventCatalog.clear()
+            events.clear()
+            if len(sources):
+                positions = np.column_stack([columns['x'], columns['y'], columns['z']])
+                self.eventCatalog.extend(columns)
+                events.add(positions, event_scale(columns['energy']), event_colors(columns['type']), source=sources)
+            if self.eventFilter or self.playback.prepared:
+                self.set_event_filter(**self.eventFilter)
+        self.hoveredInstance = None
+        self.request_frame()
+
+    def _event_mask(self):
+        return self.eventCatalog.query(as_mask=True, **self.eventFilter) if self.eventFilter else None
+
+    # e.g. set_event_filter(time=(t0, t1), magnitude=(1.5, None)), no ranges shows every event
+    def set_event_filter(self, **ranges):
+        self.eventFilter = {name: bounds for name, bounds in ranges.items() if bounds is not None}
+        if self.playback.prepared:
+            cursor = self.playback.cursor
+            self.playback.prepare(self._event_mask())
+            self.playback.seek(cursor)
+        else:
+            self.instanceSets["event"].set_visible(self._event_mask())
+        self.request_frame()
+
+    def play_events(self):
+        self.playback.start(self._event_mask())
+
+    def pause_events(self):
+        self.playback.pause()
+
+    def stop_events(self):
+        self.playback.stop()
+        self.set_event_filter(**self.eventFilter)
+
+    def hovered_event(self):
+        if self.hoveredInstance is None or self.hoveredInstance[0] != "event":
+            return None
+        return self.eventCatalog.event(self.hoveredInstance[1])
 
     def _init_geometry(self, filepath):
         obj1 = create_dxf_object(filepath, False)
         obj1.scale = np.array([1.0, 1.0, 1.0])
         obj1.location = np.array([0.0, 0.0, -50.00])
-        obj1.calculate_matrix()
 
         obj2 = create_pyramid()
         obj2.scale = np.array([1.0, 1.0, 1.0])
         obj2.location = np.array([2.0, 0.0, -50.0])
-        obj2.calculate_matrix()
         '''
         obj3 = create_sphere()
         obj3.scale = np.array([1.0, 1.0, 1.0])
-        obj3.location = np.array([4.0, 0.0, -50.0])
-        obj3.calculate_matrix()'''
+        obj3.location = np.array([4.0, 0.0, -50.0])'''
 
         self.objects = {obj1.id : obj1,
                         obj2.id : obj2,}
+        self.objectBVH = None
+        self.sceneVersion += 1
 
         self.viewTarget = obj1
 
     def set_perspective_top(self):
         self.rotX = 0.0
         self.rotY = self.ROT_Y_MIN
+        self.request_frame()
 
     def set_perspective_side(self, side=0):
         self.rotX = math.pi * side / 2
         self.rotY = math.pi / 2
+        self.request_frame()
 
     def set_perspective_bottom(self):
         self.rotX = 0.0
         self.rotY = self.ROT_Y_MAX
+        self.request_frame()
 
     def setRotX(self, val):
         self.rotX = math.pi * (val / 180)
+        self.request_frame()
 
     def setRotY(self, val):
         self.rotY = math.pi * (val / 360)
+        self.request_frame()
 
     def addRotX(self, val):
         self.rotX += math.pi * (val / self.SENSITIVITY_X)
+        self.request_frame()
 
     def addRotY(self, val):
         self.rotY = max(self.ROT_Y_MIN, min(self.ROT_Y_MAX, self.rotY - math.pi * (val / self.SENSITIVITY_Y)))
+        self.request_frame()
 
     def setArm(self, val):
         self.armLength = 20 + val
+        self.request_frame()
 
 
 
@@ -0,0 +1,251 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'geophys', 'meshes')
+CACHE_MAX_BYTES = 8 << 30
+
+# bump when the stored arrays change meaning, old entries are then never matched
+CACHE_FORMAT = 2
+
+HASH_BLOCK_SIZE = 1 << 22
+
+# new.* directories untouched for this long are left over from a process that stopped before moving them in
+STALE_SECONDS = 24 * 3600
+
+
+def file_content_hash(file_path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# The entries are shared by every process using the directory (the loader's parse pool, render_report workers ...):
+# index changes are made to the index as it is on disk, under a lock file. A cache hit only touches the mtime of
+# its entry directory, the LRU time evict() goes by
+class MeshCache:
+    INDEX_NAME = 'index.json'
+    LOCK_NAME = 'index.lock'
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, verify_content=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # when False the content hash is only recomputed if size or mtime changed
+        self.verify_content = verify_content
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.index = self._read_index()
+        self._purge_stale()
+
+    def _purge_stale(self):
+        # other processes may still be writing into recent ones
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith('new.') and now - os.path.getmtime(path) > STALE_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, self.INDEX_NAME)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return index if isinstance(index, dict) else {}
+
+    def _write_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, os.path.join(self.directory, self.INDEX_NAME))
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        with open(os.path.join(self.directory, self.LOCK_NAME), 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    try:
+                        # LK_LOCK gives up after 10 tries of a second each
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _update_index(self, change):
+        # change() edits self.index, re-read from disk first and written back while other processes wait
+        with self._index_lock():
+            self.index = self._read_index()
+            result = change()
+            self._write_index()
+        return result
+
+    @staticmethod
+    def entry_key(file_path, params=None):
+        ident = json.dumps([os.path.abspath(file_path), params or {}, CACHE_FORMAT], sort_keys=True)
+        return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _is_valid(self, entry, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return False
+        if entry['size'] != st.st_size:
+            return False
+        if entry['mtime'] == st.st_mtime_ns and not self.verify_content:
+            return True
+
+        # touched or copied but maybe the same bytes
+        if entry['hash'] != file_content_hash(file_path):
+            return False
+        entry['mtime'] = st.st_mtime_ns
+        return True
+
+    def load(self, file_path, params=None, mmap_mode='r'):
+        key = self.entry_key(file_path, params)
+        entry = self.index.get(key)
+        if entry is None:
+            # maybe added by another process since the index was read
+            self.index = self._read_index()
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+        mtime = entry['mtime']
+        if not self._is_valid(entry, file_path):
+            self._update_index(lambda: self._remove(key))
+            return None
+        if entry['mtime'] != mtime:
+            # same content under a new mtime, stored so the hash is not computed again
+            def change():
+                if key in self.index:
+                    self.index[key]['mtime'] = entry['mtime']
+            self._update_index(change)
+
+        arrays = {}
+        try:
+            for name in entry['arrays']:
+                path = os.path.join(self._entry_dir(key), name + '.npy')
+                # an empty array cannot be memory-mapped
+                arrays[name] = np.load(path, mmap_mode=mmap_mode if entry['arrays'][name] else None)
+        except (OSError, ValueError):
+            self._update_index(lambda: self._remove(key))
+            return None
+
+        try:
+            os.utime(self._entry_dir(key))
+        except OSError:
+            pass
+        return arrays
+
+    def new_entry_dir(self):
+        return tempfile.mkdtemp(dir=self.directory, prefix='new.')
+
+    def store(self, file_path, arrays, params=None):
+        tmp_dir = self.new_entry_dir()
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.ascontiguousarray(array))
+        self.adopt(file_path, tmp_dir, params)
+
+    # moves a directory of .npy files (written e.g. by a worker process) into the cache
+    def adopt(self, file_path, entry_dir, params=None):
+        st = os.stat(file_path)
+        key = self.entry_key(file_path, params)
+
+        sizes = {}
+        nbytes = 0
+        for file_name in os.listdir(entry_dir):
+            if file_name.endswith('.npy'):
+                array = np.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+                sizes[file_name[:-4]] = int(array.size)
+                nbytes += array.nbytes
+                del array
+
+        entry = {
+            'path': os.path.abspath(file_path),
+            'params': params or {},
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'hash': file_content_hash(file_path),
+            'arrays': sizes,
+            'bytes': nbytes,
+            'last_access': time.time(),
+        }
+
+        def change():
+            self._remove(key)
+            os.replace(entry_dir, self._entry_dir(key))
+            self.index[key] = entry
+            # never the entry just adopted, its caller loads it next
+            self._evict(self.max_bytes, keep=key)
+        self._update_index(change)
+
+    def _remove(self, key):
+        self.index.pop(key, None)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self.index.values())
+
+    def _last_access(self, key):
+        # the entry directory is touched on every hit
+        try:
+            return max(self.index[key]['last_access'], os.path.getmtime(self._entry_dir(key)))
+        except OSError:
+            return self.index[key]['last_access']
+
+    def _evict(self, limit, keep=None):
+        total = self.total_bytes()
+        for key in sorted(self.index, key=self._last_access):
+            if total <= limit:
+                break
+            if key == keep:
+                continue
+            total -= self.index[key]['bytes']
+            self._remove(key)
+
+    def evict(self, max_bytes=None):
+        self._update_index(lambda: self._evict(self.max_bytes if max_bytes is None else max_bytes))
+
+    def invalidate(self, file_path=None):
+        def change():
+            if file_path is None:
+                keys = list(self.index)
+            else:
+                path = os.path.abspath(file_path)
+                keys = [key for key, entry in self.index.items() if entry['path'] == path]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+        return self._update_index(change)
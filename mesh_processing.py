@@ -0,0 +1,113 @@
+import numpy as np
+
+from bvh import morton_codes
+
+
+def _grid_keys(vertices, tolerance):
+    # cell of a grid of step tolerance around every vertex (nearest grid point). A quantisation, not a distance
+    # test : two vertices closer than tolerance on either side of a cell boundary get different keys
+    cells = np.floor(vertices / tolerance + 0.5).astype(np.int64)
+    cells -= cells.min(axis=0)
+    extent = cells.max(axis=0) + 1
+
+    # one int64 key per cell when the grid fits, unique rows otherwise
+    if np.prod(extent.astype(np.float64)) < 2.0 ** 62:
+        return (cells[:, 0] * extent[1] + cells[:, 1]) * extent[2] + cells[:, 2]
+    return np.ascontiguousarray(cells).view(np.dtype((np.void, 24))).ravel()
+
+
+def unique_edges(edges):
+    pairs = np.sort(edges.reshape(-1, 2), axis=1)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    if len(pairs) == 0:
+        return edges[:0]
+    keys = pairs[:, 0].astype(np.uint64) << np.uint64(32) | pairs[:, 1].astype(np.uint64)
+    _, first = np.unique(keys, return_index=True)
+    return pairs[np.sort(first)].ravel().astype(edges.dtype)
+
+
+def weld_vertices(vertices, faces_t, faces_q, edges, tolerance=1e-3):
+    # merges the vertices snapped to the same point of a grid of step tolerance, see _grid_keys : exact duplicates
+    # (the shared corners DXF 3DFACEs repeat) always merge, vertices merely close may not
+    if len(vertices) == 0:
+        return vertices, faces_t, faces_q, edges, 1.0
+
+    keys = _grid_keys(vertices, tolerance)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    # keep the welded vertices in order of first use, it keeps neighbouring faces close in memory
+    order = np.argsort(first)
+    remap = np.empty(len(order), dtype=np.uint32)
+    remap[order] = np.arange(len(order), dtype=np.uint32)
+    remap = remap[inverse.ravel()]
+
+    welded = np.ascontiguousarray(vertices[first[order]])
+    ratio = len(vertices) / len(welded)
+    return welded, remap[faces_t], remap[faces_q], unique_edges(remap[edges]), ratio
+
+
+def quads_to_triangles(faces_q):
+    quads = faces_q.reshape(-1, 4)
+    return quads[:, [0, 1, 2, 0, 2, 3]].ravel()
+
+
+def cluster_mesh(vertices, triangles, edges, cell_size):
+    # vertex clustering : every grid cell collapses to the mean of its vertices
+    keys = _grid_keys(vertices, cell_size)
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel().astype(np.uint32)
+
+    counts = np.bincount(inverse).astype(np.float64)
+    clustered = np.empty((len(counts), 3), dtype=np.float32)
+    for axis in range(3):
+        clustered[:, axis] = np.bincount(inverse, weights=vertices[:, axis]) / counts
+
+    tris = inverse[triangles].reshape(-1, 3)
+    tris = tris[(tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) & (tris[:, 2] != tris[:, 0])]
+    if len(tris):
+        _, first = np.unique(np.sort(tris, axis=1), axis=0, return_index=True)
+        tris = tris[np.sort(first)]
+
+    return clustered, tris.ravel(), unique_edges(inverse[edges])
+
+
+LOD_GRID_RESOLUTION = (256, 64, 16)
+LOD_MIN_REDUCTION = 0.7
+
+
+def build_lods(vertices, faces_t, faces_q, edges, resolutions=LOD_GRID_RESOLUTION):
+    # returns [(cell_size, vertices, triangles, edges)] from finest to coarsest
+    if len(vertices) == 0:
+        return []
+    triangles = np.concatenate([faces_t, quads_to_triangles(faces_q)])
+    extent = float((vertices.max(axis=0) - vertices.min(axis=0)).max())
+    if extent <= 0.0:
+        return []
+
+    lods = []
+    previous = len(triangles)
+    for resolution in resolutions:
+        cell_size = extent / resolution
+        lod = cluster_mesh(vertices, triangles, edges, cell_size)
+        if len(lod[1]) > previous * LOD_MIN_REDUCTION:
+            continue
+        lods.append((cell_size,) + lod)
+        previous = len(lod[1])
+    return lods
+
+
+def chunk_elements(vertices, indices, per_element, chunk_size):
+    # elements (triangles, edges) reordered along a Morton curve of their centers and cut every chunk_size of them,
+    # returns (indices, (offsets, counts, box_min, box_max), order) with offsets / counts in indices and order the
+    # element of the input at every element of the output
+    elements = indices.reshape(-1, per_element)
+    corners = vertices[elements]
+    order = np.argsort(morton_codes(corners.mean(axis=1)), kind='stable')
+    elements = elements[order]
+    corners = corners[order]
+
+    starts = np.arange(0, len(elements), chunk_size)
+    box_min = np.minimum.reduceat(corners.min(axis=1), starts, axis=0)
+    box_max = np.maximum.reduceat(corners.max(axis=1), starts, axis=0)
+    counts = np.diff(np.append(starts, len(elements))) * per_element
+    return elements.ravel(), (starts * per_element, counts, box_min, box_max), order
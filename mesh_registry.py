@@ -0,0 +1,43 @@
+# Meshes shared between scene objects, keyed by the parameters they were built from
+class MeshRegistry:
+    def __init__(self):
+        self._meshes = {}
+        self._counts = {}
+        self._keys = {}
+
+    def acquire(self, key, build):
+        # build() is only called when no live mesh exists for the key
+        mesh = self._meshes.get(key)
+        if mesh is None:
+            mesh = build()
+            self._meshes[key] = mesh
+            self._counts[key] = 0
+            self._keys[id(mesh)] = key
+        self._counts[key] += 1
+        return mesh
+
+    def owns(self, mesh):
+        return id(mesh) in self._keys
+
+    def release(self, mesh):
+        # returns True when this was the last reference and the GPU buffers were freed
+        key = self._keys.get(id(mesh))
+        if key is None:
+            raise KeyError("mesh is not in the registry")
+        self._counts[key] -= 1
+        if self._counts[key] > 0:
+            return False
+
+        del self._meshes[key], self._counts[key], self._keys[id(mesh)]
+        mesh.release()
+        return True
+
+    def references(self, key):
+        return self._counts.get(key, 0)
+
+    def stats(self):
+        return {
+            'meshes': len(self._meshes),
+            'references': sum(self._counts.values()),
+            'bytes': sum(mesh.nbytes() for mesh in self._meshes.values()),
+        }
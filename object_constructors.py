@@ -1,3 +1,5 @@
+import os
+
 import ezdxf
 import numpy as np
 from OpenGL.arrays import vbo
@@ -5,66 +7,276 @@ from pyglm import glm
 import OpenGL.GL as gl
 
 from collisions import CollisionBox
+from instancing import InstancedMeshSet
+from mesh_processing import weld_vertices, build_lods, LOD_GRID_RESOLUTION
+from mesh_registry import MeshRegistry
 from object_meshes import ObjectMesh
 from scene_objects import SceneObject
 
 
-def load_dxf_vertices(file_path, scale=1.0, normalize=False):
+DXF_CHUNK_SIZE = 1 << 24
+
+# uniform colors are kept as one constant value instead of a tiled per-vertex VBO
+COMPACT_COLORS = True
+
+# corner order of the GL_LINES pairs for a triangle (padded to 8) and for a quad
+_EDGE_PATTERN_T = np.array([0, 1, 1, 2, 2, 0, 0, 0], dtype=np.uint32)
+_EDGE_PATTERN_Q = np.array([0, 1, 1, 2, 2, 3, 3, 0], dtype=np.uint32)
+
+
+def _take(values, indices):
+    if len(indices) == 0:
+        return np.empty(0, dtype='S1')
+    return np.array([values[i] for i in indices.tolist()])
+
+
+def _take_floats(values, indices):
+    return np.fromiter(map(float, [values[i] for i in indices.tolist()]), dtype=np.float64, count=len(indices))
+
+
+def _parse_3dface_tags(codes, values, in_entities):
+    # codes/values hold whole entities only, every entity starts with a group code 0 tag
+    starts = np.flatnonzero(codes == 0)
+    if len(starts) == 0:
+        return np.empty((0, 4, 3), dtype=np.float32), in_entities
+
+    names = np.char.strip(_take(values, starts))
+    section_names = np.char.strip(_take(values, np.minimum(starts + 1, len(values) - 1)))
+
+    # -1 : keep state, 0 : leave ENTITIES, 1 : enter ENTITIES
+    marks = np.full(len(starts), -1, dtype=np.int8)
+    marks[names == b'ENDSEC'] = 0
+    is_section = names == b'SECTION'
+    marks[is_section] = section_names[is_section] == b'ENTITIES'
+
+    last_mark = np.maximum.accumulate(np.where(marks >= 0, np.arange(len(starts)), -1))
+    inside = np.where(last_mark >= 0, marks[np.maximum(last_mark, 0)] == 1, in_entities)
+
+    entity_of_tag = np.cumsum(codes == 0) - 1
+    valid_tag = entity_of_tag >= 0
+    entity_of_tag = np.maximum(entity_of_tag, 0)
+
+    is_face = inside & (names == b'3DFACE')
+    # group code 67 == 1 marks paper space entities
+    paper = np.flatnonzero((codes == 67) & valid_tag & is_face[entity_of_tag])
+    if len(paper):
+        is_face[entity_of_tag[paper][np.char.strip(_take(values, paper)) == b'1']] = False
+
+    face_index = np.cumsum(is_face) - 1
+    corners = np.full((int(is_face.sum()), 4, 3), np.nan, dtype=np.float32)
+
+    coord = np.flatnonzero(valid_tag & is_face[entity_of_tag] & (codes >= 10) & (codes <= 33) & (codes % 10 <= 3))
+    coord_codes = codes[coord]
+    corners[face_index[entity_of_tag[coord]], coord_codes % 10, coord_codes // 10 - 1] = \
+        _take_floats(values, coord)
+
+    return corners, bool(inside[-1])
+
+
+def _scan_3dfaces_ascii(file_path, chunk_size=DXF_CHUNK_SIZE, progress=None):
+    parts = []
+    in_entities = False
+    tail = b''
+    file_size = max(1, os.path.getsize(file_path))
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if progress is not None:
+                progress(f.tell() / file_size)
+            data = tail + block.replace(b'\r', b'')
+            lines = data.split(b'\n')
+            # the last line may be incomplete
+            partial = lines.pop() if block else b''
+            pairs = len(lines) // 2
+            if pairs == 0:
+                if not block:
+                    break
+                tail = data
+                continue
+
+            # a code that is not an integer raises ValueError, the file then goes through ezdxf
+            codes = np.array(b' '.join(lines[0:2 * pairs:2]).split(), dtype=np.int32)
+            if len(codes) != pairs:
+                raise ValueError("malformed group code")
+            values = lines[1:2 * pairs:2]
+
+            # cut at the last entity start, the rest goes into the next chunk
+            cut = pairs
+            if block:
+                starts = np.flatnonzero(codes == 0)
+                cut = int(starts[-1]) if len(starts) else 0
+                if cut == 0:
+                    tail = data
+                    continue
+            tail = b'\n'.join(lines[2 * cut:] + [partial])
+
+            faces, in_entities = _parse_3dface_tags(codes[:cut], values[:cut], in_entities)
+            parts.append(faces)
+            if not block:
+                break
+
+    if not parts:
+        return np.empty((0, 4, 3), dtype=np.float32)
+    corners = np.concatenate(parts)
+    missing = np.isnan(corners[:, 3]).all(axis=1)
+    corners[missing, 3] = corners[missing, 2]
+    np.nan_to_num(corners, copy=False)
+    return corners
+
+
+def _collect_3dfaces_ezdxf(file_path):
     doc = ezdxf.readfile(file_path)
-    msp = doc.modelspace()
-
-    vertices = []
-    indices_faces_t = []
-    indices_faces_q = []
-    indices_edges = []
-    index_offset = 0
-    for e in msp.query('3DFACE'):
-        pts = [(vertex.x, vertex.z, vertex.y) for vertex in e.wcs_vertices(False)]
-
-        pts = np.array(pts, dtype=np.float32) * scale
-        # print(pts)
-        vertices.extend(pts)
-
-        n = len(pts)
-        if n == 3:
-            indices_faces_t.extend([index_offset, index_offset + 1, index_offset + 2])
-            indices_edges.extend([index_offset, index_offset + 1, index_offset + 1, index_offset + 2, index_offset + 2, index_offset])
-        elif n == 4:
-            indices_faces_q.extend([index_offset, index_offset + 1, index_offset + 2, index_offset + 3])
-            indices_edges.extend([index_offset, index_offset + 1, index_offset + 1, index_offset + 2, index_offset + 2, index_offset + 3, index_offset + 3, index_offset])
-        index_offset += n
-
-    vertices = np.array(vertices, dtype=np.float32)
+    faces = doc.modelspace().query('3DFACE')
+
+    def corner_values():
+        for e in faces:
+            dxf = e.dxf
+            vtx2 = dxf.vtx2
+            yield from dxf.vtx0
+            yield from dxf.vtx1
+            yield from vtx2
+            yield from dxf.get('vtx3') or vtx2
+
+    n = len(faces)
+    return np.fromiter(corner_values(), dtype=np.float32, count=n * 12).reshape(n, 4, 3)
+
+
+def _is_binary_dxf(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(22).startswith(b'AutoCAD Binary DXF')
+
+
+def load_dxf_corners(file_path, progress=None):
+    if not _is_binary_dxf(file_path):
+        try:
+            return _scan_3dfaces_ascii(file_path, progress=progress)
+        except ValueError:
+            pass
+    return _collect_3dfaces_ezdxf(file_path)
+
+
+def load_dxf_vertices(file_path, scale=1.0, normalize=False, progress=None):
+    corners = load_dxf_corners(file_path, progress)
+    # DXF is Z-up, the scene is Y-up
+    corners = corners[:, :, [0, 2, 1]]
+    if scale != 1.0:
+        corners *= scale
+
+    # same rule as Face3d.wcs_vertices : the face is a triangle when vtx3 == vtx2
+    is_quad = np.any(corners[:, 3] != corners[:, 2], axis=1)
+    counts = np.where(is_quad, 4, 3).astype(np.uint32)
+    offsets = np.zeros(len(corners), dtype=np.uint32)
+    np.cumsum(counts[:-1], out=offsets[1:])
+
+    used = np.ones((len(corners), 4), dtype=bool)
+    used[:, 3] = is_quad
+    vertices = corners[used]
 
     if normalize:
         min_coords = vertices.min(axis=0)
         max_coords = vertices.max(axis=0)
         vertices = (vertices - min_coords) / (max_coords - min_coords)
 
-    indices_faces_t = np.array(indices_faces_t, dtype=np.uint32)
-    indices_faces_q = np.array(indices_faces_q, dtype=np.uint32)
-    indices_edges = np.array(indices_edges, dtype=np.uint32)
+    indices_faces_t = (offsets[~is_quad, None] + np.arange(3, dtype=np.uint32)).ravel()
+    indices_faces_q = (offsets[is_quad, None] + np.arange(4, dtype=np.uint32)).ravel()
+
+    edges = offsets[:, None] + np.where(is_quad[:, None], _EDGE_PATTERN_Q, _EDGE_PATTERN_T)
+    used_edges = np.ones((len(corners), 8), dtype=bool)
+    used_edges[~is_quad, 6:] = False
+    indices_edges = edges[used_edges]
 
     return vertices, indices_faces_t, indices_faces_q, indices_edges
 
 
-def create_dxf_object(file_path, normalize=False):
-    vertices, indices_faces_t, indices_faces_q, indices_edges = load_dxf_vertices(file_path, 1.0, normalize)
+DXF_ARRAYS = ('vertices', 'faces_t', 'faces_q', 'edges', 'face_ids')
+LOD_ARRAYS = ('vertices', 'faces_t', 'edges')
 
-    colors = np.tile(np.array([0.3, 0.3, 0.3, 0.1], dtype=np.float32), (len(vertices), 1))
-    colors_edges = np.tile(np.array([1.0, 1.0, 1.0], dtype=np.float32), (len(vertices), 1))
-    colors_hovered = np.tile(np.array([1.0, 0.5, 0.0], dtype=np.float32), (len(vertices), 1))
 
-    vertVBO = vbo.VBO(vertices.flatten().astype(np.float32))
-    colorVBO = vbo.VBO(colors.flatten().astype(np.float32))
+def dxf_cache_params(scale=1.0, normalize=False, weld_tolerance=None, lod_levels=0):
+    return {'scale': scale, 'normalize': normalize, 'weld_tolerance': weld_tolerance, 'lod_levels': lod_levels}
+
+
+def dxf_face_ids(indices_faces_t, indices_faces_q):
+    # 3DFACE index of every triangle of ObjectMesh(faces_t, faces_q), from the indices load_dxf_vertices returns :
+    # the faces' vertices follow each other in file order, so a face is the rank of its first vertex
+    first_t = indices_faces_t[::3]
+    first_q = indices_faces_q[::4]
+    firsts = np.sort(np.concatenate([first_t, first_q]))
+    ids_t = np.searchsorted(firsts, first_t).astype(np.uint32)
+    ids_q = np.searchsorted(firsts, first_q).astype(np.uint32)
+    return np.concatenate([ids_t, np.repeat(ids_q, 2)])
+
+
+def build_dxf_arrays(file_path, scale=1.0, normalize=False, weld_tolerance=None, lod_levels=0, progress=None):
+    vertices, indices_faces_t, indices_faces_q, indices_edges = load_dxf_vertices(file_path, scale, normalize, progress)
+    # before welding, it shares the vertices of neighbouring faces
+    face_ids = dxf_face_ids(indices_faces_t, indices_faces_q)
+    if weld_tolerance is not None:
+        vertices, indices_faces_t, indices_faces_q, indices_edges, ratio = \
+            weld_vertices(vertices, indices_faces_t, indices_faces_q, indices_edges, weld_tolerance)
+
+    arrays = dict(zip(DXF_ARRAYS, (vertices, indices_faces_t, indices_faces_q, indices_edges, face_ids)))
+    if lod_levels:
+        lods = build_lods(vertices, indices_faces_t, indices_faces_q, indices_edges, LOD_GRID_RESOLUTION[:lod_levels])
+        arrays['lod_cells'] = np.array([lod[0] for lod in lods], dtype=np.float32)
+        for level, lod in enumerate(lods, 1):
+            for name, array in zip(LOD_ARRAYS, lod[1:]):
+                arrays[f'lod{level}_{name}'] = array
+    return arrays
+
+
+def load_dxf_mesh(file_path, scale=1.0, normalize=False, cache=None, progress=None, weld_tolerance=None, lod_levels=0):
+    params = dxf_cache_params(scale, normalize, weld_tolerance, lod_levels)
+    if cache is not None:
+        arrays = cache.load(file_path, params)
+        if arrays is not None:
+            return arrays
+
+    arrays = build_dxf_arrays(file_path, scale, normalize, weld_tolerance, lod_levels, progress)
+    if cache is not None:
+        cache.store(file_path, arrays, params)
+    return arrays
 
-    mesh = ObjectMesh(vertVBO, colorVBO, indices_faces_t, indices_faces_q, indices_edges)
 
-    mesh.colorsEdgesVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
-    mesh.colorsHoveredVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsSelectedVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsEdgesActiveVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
+def create_dxf_object(file_path, normalize=False, cache=None, weld_tolerance=None, lod_levels=0):
+    return create_dxf_object_from_data(load_dxf_mesh(file_path, 1.0, normalize, cache, None, weld_tolerance, lod_levels))
+
+
+def _color_source(colors, count):
+    # a single color (1-D) or per-vertex colors (2-D), returns a constant or a VBO
+    colors = np.asarray(colors, dtype=np.float32)
+    if COMPACT_COLORS:
+        if colors.ndim == 1:
+            return colors
+        if np.all(colors == colors[0]):
+            return colors[0]
+    if colors.ndim == 1:
+        colors = np.tile(colors, (count, 1))
+    return vbo.VBO(colors.flatten())
+
+
+def _set_colors(mesh, count, faces, edges, hovered):
+    mesh.set_colors(_color_source(faces, count), _color_source(edges, count),
+                    _color_source(hovered, count), _color_source(hovered, count))
+
+
+def _create_dxf_mesh(vertices, indices_faces_t, indices_faces_q, indices_edges, face_ids=None):
+    vertVBO = vbo.VBO(vertices.flatten().astype(np.float32))
+
+    mesh = ObjectMesh(vertVBO, None, indices_faces_t, indices_faces_q, indices_edges, face_ids=face_ids)
+    _set_colors(mesh, len(vertices), [0.3, 0.3, 0.3, 0.1], [1.0, 1.0, 1.0], [1.0, 0.5, 0.0])
     mesh.enableFaces = True
+    return mesh
+
+
+def create_dxf_object_from_data(arrays):
+    vertices = arrays['vertices']
+    mesh = _create_dxf_mesh(vertices, arrays['faces_t'], arrays['faces_q'], arrays['edges'], arrays.get('face_ids'))
+
+    for level, cell_size in enumerate(arrays.get('lod_cells', ()), 1):
+        lod = _create_dxf_mesh(arrays[f'lod{level}_vertices'], arrays[f'lod{level}_faces_t'], None,
+                               arrays[f'lod{level}_edges'])
+        mesh.lods.append((float(cell_size), lod))
 
     min_v = vertices.min(axis=0)
     max_v = vertices.max(axis=0)
@@ -77,7 +289,24 @@ def create_dxf_object(file_path, normalize=False):
     return obj
 
 
-def create_cube():
+# primitives with equal parameters share one mesh, see release_mesh
+MESHES = MeshRegistry()
+
+
+def release_mesh(mesh):
+    if MESHES.owns(mesh):
+        MESHES.release(mesh)
+    else:
+        mesh.release()
+
+
+def _unit_object(mesh):
+    collision = CollisionBox(glm.vec3([0.0, 0.0, 0.0]), glm.vec3([1.0, 1.0, 1.0]))
+    origin = np.array([0.5, 0.5, 0.5])
+    return SceneObject(mesh, collision, origin)
+
+
+def _cube_mesh():
     colors = np.array(
         [[0.0, 0.0, 0.0, 1.0],
          [1.0, 0.0, 0.0, 1.0],
@@ -87,11 +316,6 @@ def create_cube():
          [1.0, 0.0, 1.0, 1.0],
          [1.0, 1.0, 1.0, 1.0],
          [0.0, 1.0, 1.0, 1.0]])
-    colorVBO = vbo.VBO(np.reshape(colors,
-                                  (1, -1)).astype(np.float32))
-
-    colors_edges = np.tile(np.array([0.5, 0.13, 0.13], dtype=np.float32), (8, 1))
-    colors_hovered = np.tile(np.array([1.0, 0.5, 0.0], dtype=np.float32), (8, 1))
 
     vertices = np.array(
         [[0.0, 0.0, 0.0],
@@ -130,98 +354,58 @@ def create_cube():
          7, 4]
     )
 
-    mesh = ObjectMesh(vertVBO, colorVBO, indices_triangles, indices_quads, indices_edges)
-
-    mesh.colorsEdgesVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
-    mesh.colorsHoveredVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsSelectedVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsEdgesActiveVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
+    mesh = ObjectMesh(vertVBO, None, indices_triangles, indices_quads, indices_edges)
+    _set_colors(mesh, 8, colors, [0.5, 0.13, 0.13], [1.0, 0.5, 0.0])
 
     mesh.enableFaces = True
-    collision = CollisionBox(glm.vec3([0.0, 0.0, 0.0]), glm.vec3([1.0, 1.0, 1.0]))
-    origin = np.array([0.5, 0.5, 0.5])
+    return mesh
 
-    obj = SceneObject(mesh, collision, origin)
-    return obj
+
+def create_cube():
+    return _unit_object(MESHES.acquire(('cube',), _cube_mesh))
 
 
 # Я сделал это через DeepSeek и мне почти не стыдно
-def create_sphere(meridians=16, parallels=16, color=[1.0, 0.0, 0.0, 1.0]):
-    vertices = []
-    for i in range(parallels + 1):
-        theta = i * np.pi / parallels
-        for j in range(meridians):
-            phi = j * 2 * np.pi / meridians
-            x = np.sin(theta) * np.cos(phi)
-            y = np.sin(theta) * np.sin(phi)
-            z = np.cos(theta)
-            vertices.append([x, y, z])
-
-    vertices = np.array(vertices, dtype=np.float32)
+def _sphere_mesh(meridians, parallels, color):
+    theta = np.arange(parallels + 1) * np.pi / parallels
+    phi = np.arange(meridians) * 2 * np.pi / meridians
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.stack([np.sin(theta) * np.cos(phi),
+                         np.sin(theta) * np.sin(phi),
+                         np.cos(theta)], axis=-1).reshape(-1, 3).astype(np.float32)
 
     vertices = vertices / 2 + 0.5
 
     vertVBO = vbo.VBO(vertices.flatten().astype(np.float32))
 
-    colors = np.zeros((len(vertices), 4), dtype=np.float32)
-    for i in range(len(vertices)):
-        colors[i] = color
-    colorVBO = vbo.VBO(colors.flatten().astype(np.float32))
-
-    indices_triangles = []
-    for i in range(parallels):
-        for j in range(meridians):
-            a = i * meridians + j
-            b = i * meridians + (j + 1) % meridians
-            c = (i + 1) * meridians + j
-            d = (i + 1) * meridians + (j + 1) % meridians
-
-            indices_triangles.extend([a, b, c])
-            indices_triangles.extend([b, d, c])
-
-    indices_triangles = np.array(indices_triangles, dtype=np.uint32)
+    # a, b on parallel i and c, d on parallel i + 1, meridian j and the next one
+    i, j = np.meshgrid(np.arange(parallels, dtype=np.uint32), np.arange(meridians, dtype=np.uint32),
+                       indexing='ij')
+    a = i * meridians + j
+    b = i * meridians + (j + 1) % meridians
+    c = a + meridians
+    d = b + meridians
 
-    indices_edges = []
-    for i in range(parallels):
-        for j in range(meridians):
-            current = i * meridians + j
-            next_j = i * meridians + (j + 1) % meridians
-            next_i = (i + 1) * meridians + j if i < parallels - 1 else None
+    indices_triangles = np.stack([a, b, c, b, d, c], axis=-1).ravel()
 
-            indices_edges.extend([current, next_j])
+    # segments along the parallel, then down the meridian except on the last ring
+    indices_edges = np.concatenate([np.stack([a[:-1], b[:-1], a[:-1], c[:-1]], axis=-1).ravel(),
+                                    np.stack([a[-1], b[-1]], axis=-1).ravel()])
 
-            if next_i is not None:
-                indices_edges.extend([current, next_i])
-
-    indices_edges = np.array(indices_edges, dtype=np.uint32)
-
-    mesh = ObjectMesh(vertVBO, colorVBO, indices_triangles, None, indices_edges)
-
-    colors_edges = np.tile(np.array([1.0, 1.0, 1.0], dtype=np.float32), (len(vertices), 1))
-    colors_hovered = np.tile(np.array([1.0, 0.5, 0.0], dtype=np.float32), (len(vertices), 1))
-
-    mesh.colorsEdgesVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
-    mesh.colorsHoveredVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsSelectedVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsEdgesActiveVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
+    mesh = ObjectMesh(vertVBO, None, indices_triangles, None, indices_edges)
+    _set_colors(mesh, len(vertices), color, [1.0, 1.0, 1.0], [1.0, 0.5, 0.0])
 
     mesh.enableFaces = True
     mesh.enableEdges = False
+    return mesh
 
-    collision = CollisionBox(glm.vec3([0.0, 0.0, 0.0]), glm.vec3([1.0, 1.0, 1.0]))
-    origin = np.array([0.5, 0.5, 0.5])
-
-    obj = SceneObject(mesh, collision, origin)
-    return obj
 
+def create_sphere(meridians=16, parallels=16, color=[1.0, 0.0, 0.0, 1.0]):
+    key = ('sphere', meridians, parallels, tuple(color))
+    return _unit_object(MESHES.acquire(key, lambda: _sphere_mesh(meridians, parallels, color)))
 
-def create_pyramid():
-    colors = np.tile(np.array([1.0, 0.0, 1.0, 0.1], dtype=np.float32), (5, 1))
-    colorVBO = vbo.VBO(np.reshape(colors,(1, -1)).astype(np.float32))
-
-    colors_edges = np.tile(np.array([0.5, 0.13, 0.13], dtype=np.float32), (5, 1))
-    colors_hovered = np.tile(np.array([1.0, 0.5, 0.0], dtype=np.float32), (5, 1))
 
+def _pyramid_mesh():
     vertices = np.array(
         [[0.0, 0.0, 0.0],
          [1.0, 0.0, 0.0],
@@ -252,20 +436,39 @@ def create_pyramid():
          3, 4]
     )
 
-    mesh = ObjectMesh(vertVBO, colorVBO, indices_triangles, indices_quads, indices_edges)
-
-    mesh.colorsEdgesVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
-    mesh.colorsHoveredVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsSelectedVBO = vbo.VBO(colors_hovered.flatten().astype(np.float32))
-    mesh.colorsEdgesActiveVBO = vbo.VBO(colors_edges.flatten().astype(np.float32))
+    mesh = ObjectMesh(vertVBO, None, indices_triangles, indices_quads, indices_edges)
+    _set_colors(mesh, 5, [1.0, 0.0, 1.0, 0.1], [0.5, 0.13, 0.13], [1.0, 0.5, 0.0])
 
     mesh.enableFaces = True
+    return mesh
 
-    collision = CollisionBox(glm.vec3([0.0, 0.0, 0.0]), glm.vec3([1.0, 1.0, 1.0]))
-    origin = np.array([0.5, 0.5, 0.5])
 
-    obj = SceneObject(mesh, collision, origin)
-    return obj
+def create_pyramid():
+    return _unit_object(MESHES.acquire(('pyramid',), _pyramid_mesh))
+
+
+DETECTOR_SCALE = 50.0
+DETECTOR_COLOR = [1.0, 0.0, 1.0, 0.1]
+EVENT_COLORS = {"explosion": [1.0, 0.0, 0.0, 1.0]}
+EVENT_DEFAULT_COLOR = [1.0, 0.7, 0.0, 1.0]
+
+
+def event_color(event_type):
+    return EVENT_COLORS.get(event_type, EVENT_DEFAULT_COLOR)
+
+
+def event_colors(event_types):
+    # one vectorized comparison per known type instead of a lookup per event
+    event_types = np.asarray(event_types)
+    colors = np.empty((len(event_types), 4), dtype=np.float32)
+    colors[:] = EVENT_DEFAULT_COLOR
+    for name, color in EVENT_COLORS.items():
+        colors[event_types == name] = color
+    return colors
+
+
+def event_scale(energy):
+    return np.abs(np.log(energy)) * 10
 
 
 def create_detector(id, x, y, z):
@@ -277,13 +480,25 @@ def create_detector(id, x, y, z):
 
 
 def create_event(x, y, z, event_type):
-    if event_type == "explosion":
-        clr = [1.0, 0.0, 0.0, 1.0]
-    else:
-        clr = [1.0, 0.7, 0.0, 1.0]
-    obj = create_sphere(32, 32, clr)
+    obj = create_sphere(32, 32, event_color(event_type))
     obj.location = np.array([x, y, z])
     obj.obj_type = "event"
     obj.data["type"] = event_type
     return obj
 
+
+def _instances_of(mesh, obj_type):
+    # instances take their face color per instance, the rest must be constants
+    mesh.set_colors([1.0, 1.0, 1.0, 1.0], mesh.colorEdges if mesh.colorEdges is not None else [1.0, 1.0, 1.0],
+                    [1.0, 0.5, 0.0], [1.0, 0.5, 0.0])
+    template = _unit_object(mesh)
+    return InstancedMeshSet(mesh, template.collision, template.origin, obj_type)
+
+
+def create_detector_instances():
+    # own mesh : the instance colors must not leak into the shared pyramid
+    return _instances_of(_pyramid_mesh(), "detector")
+
+
+def create_event_instances():
+    return _instances_of(_sphere_mesh(32, 32, [1.0, 1.0, 1.0, 1.0]), "event")
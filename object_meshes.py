@@ -1,25 +1,153 @@
 import numpy as np
+import OpenGL.GL as gl
+from OpenGL.arrays import vbo
+
+from bvh import TriangleBVH
+from culling import boxes_in_frustum, visible_ranges
+from mesh_processing import chunk_elements, quads_to_triangles
+
+
+def _index_buffer(indices):
+    if indices is None or len(indices) == 0:
+        return None
+    return vbo.VBO(indices, usage='GL_STATIC_DRAW', target='GL_ELEMENT_ARRAY_BUFFER')
+
+
+# a color is either a per-vertex VBO or one constant RGBA value for the whole mesh
+def _split_color(color):
+    if color is None or isinstance(color, vbo.VBO):
+        return color, None
+    rgba = np.ones(4, dtype=np.float32)
+    rgba[:len(color)] = color
+    return None, rgba
+
 
 class ObjectMesh:
-    def __init__(self, vertices, colors, faces_t=None, faces_q=None, edges=None):
+    # meshes with more triangles / edges than two chunks of this many are culled chunk by chunk
+    CHUNK_ELEMENTS = 16384
+
+    # face_ids : the face of the source data (e.g. the 3DFACE of a DXF file) every triangle comes from, triangles of
+    # faces_t first then two per quad of faces_q
+    def __init__(self, vertices, colors, faces_t=None, faces_q=None, edges=None, chunked=True, face_ids=None):
         self.enableFaces = False
         self.enableEdges = True
 
+        # simplified versions of this mesh, [(cell_size, ObjectMesh)] from finest to coarsest
+        self.lods = []
+
         self.verticesVBO = vertices
-        self.colorsFacesVBO = colors
-        self.colorsEdgesVBO = colors
-        self.colorsHoveredVBO = colors
-        self.colorsSelectedVBO = colors
-        self.colorsEdgesActiveVBO = colors
+        self.colorsFacesVBO = self.colorFaces = None
+        self.colorsEdgesVBO = self.colorEdges = None
+        self.colorsHoveredVBO = self.colorHovered = None
+        self.colorsSelectedVBO = self.colorSelected = None
+        self.set_colors(colors, colors, colors, colors)
+
+        # quads are split once here, so the faces are a single triangle list
+        faces = [np.asarray(f, dtype=np.uint32).ravel() for f in (faces_t, faces_q) if f is not None]
+        if faces_q is not None:
+            faces[-1] = quads_to_triangles(faces[-1])
+        self.facesTriangles = np.concatenate(faces) if faces else None
+        self.edges = np.asarray(edges, dtype=np.uint32).ravel() if edges is not None else None
+        self.faceIds = np.asarray(face_ids) if face_ids is not None else None
+
+        # 'faces' / 'edges' -> (offsets, counts, box_min, box_max) of spatial chunks of the index array
+        self.chunks = {}
+        if chunked and self.facesTriangles is not None and len(self.facesTriangles) > 6 * self.CHUNK_ELEMENTS:
+            self.facesTriangles, self.chunks['faces'], order = self._chunk(self.facesTriangles, 3)
+            # kept without face ids too, so source_face answers with the triangle as it was passed in
+            self.faceIds = order if self.faceIds is None else self.faceIds[order]
+        if chunked and self.edges is not None and len(self.edges) > 4 * self.CHUNK_ELEMENTS:
+            self.edges, self.chunks['edges'], order = self._chunk(self.edges, 2)
 
-        self.facesQuads = faces_q
-        self.facesTriangles = faces_t
-        self.edges = edges
+        # index buffers live on the GPU, uploaded on first bind
+        self.facesVBO = _index_buffer(self.facesTriangles)
+        self.edgesVBO = _index_buffer(self.edges)
 
+        self._triangleBVH = None
+        # vertex arrays of the core renderer, kind -> (vao, key), see CoreRenderer
+        self.vaos = {}
         self.enabled = True
 
-    def on_hover(self):
-        self.colorsEdgesActiveVBO = self.colorsHoveredVBO
+    def _chunk(self, indices, per_element):
+        vertices = np.asarray(self.verticesVBO.data, dtype=np.float32).reshape(-1, 3)
+        return chunk_elements(vertices, indices, per_element, self.CHUNK_ELEMENTS)
+
+    def draw_ranges(self, kind, planes):
+        # index ranges of kind inside the frustum planes (in mesh coordinates) : (ranges, drawn, culled) chunks,
+        # ranges is None when the whole index buffer is drawn
+        chunks = self.chunks.get(kind)
+        if chunks is None or planes is None:
+            return None, 0, 0
+        offsets, counts, box_min, box_max = chunks
+        visible = boxes_in_frustum(planes, box_min, box_max)
+        drawn = int(np.count_nonzero(visible))
+        return visible_ranges(offsets, counts, visible), drawn, len(visible) - drawn
+
+    def set_colors(self, faces=None, edges=None, hovered=None, selected=None):
+        if faces is not None:
+            self.colorsFacesVBO, self.colorFaces = _split_color(faces)
+        if edges is not None:
+            self.colorsEdgesVBO, self.colorEdges = _split_color(edges)
+        if hovered is not None:
+            self.colorsHoveredVBO, self.colorHovered = _split_color(hovered)
+        if selected is not None:
+            self.colorsSelectedVBO, self.colorSelected = _split_color(selected)
+
+    # a mesh can be shared by many objects, so hover is drawn per object instead of stored here
+    def edge_colors(self, hovered=False):
+        if hovered:
+            return self.colorsHoveredVBO, self.colorHovered
+        return self.colorsEdgesVBO, self.colorEdges
+
+    def source_face(self, triangle):
+        # face of the source data a triangle of facesTriangles comes from, see face_ids
+        return int(self.faceIds[triangle]) if self.faceIds is not None else int(triangle)
+
+    # built on the first exact pick, triangle i is facesTriangles[3 * i:3 * i + 3]
+    def triangle_bvh(self):
+        if self._triangleBVH is None and self.facesTriangles is not None and len(self.facesTriangles):
+            self._triangleBVH = TriangleBVH(self.verticesVBO.data, self.facesTriangles)
+        return self._triangleBVH
+
+    def buffers(self):
+        unique = []
+        for buffer in (self.verticesVBO, self.colorsFacesVBO, self.colorsEdgesVBO, self.colorsHoveredVBO,
+                       self.colorsSelectedVBO, self.facesVBO, self.edgesVBO):
+            if buffer is not None and all(buffer is not b for b in unique):
+                unique.append(buffer)
+        return unique
+
+    def nbytes(self):
+        return sum(int(buffer.size) if buffer.size is not None else 0 for buffer in self.buffers())
+
+    # copies all buffers to the GPU, needs a current GL context
+    def upload(self):
+        for buffer in self.buffers():
+            buffer.bind()
+            buffer.unbind()
+        for cell_size, lod in self.lods:
+            lod.upload()
+
+    # frees the GPU copies but keeps the data, it is uploaded again on the next bind
+    def unload(self):
+        for buffer in self.buffers():
+            buffer.delete()
+            buffer.copied = False
+        self._delete_vaos()
+        for cell_size, lod in self.lods:
+            lod.unload()
+
+    def _delete_vaos(self):
+        if self.vaos:
+            gl.glDeleteVertexArrays(len(self.vaos), [vao for vao, key in self.vaos.values()])
+            self.vaos = {}
 
-    def on_unhover(self):
-        self.colorsEdgesActiveVBO = self.colorsEdgesVBO
\ No newline at end of file
+    # frees the GPU buffers, needs the GL context they were created in
+    def release(self):
+        for buffer in self.buffers():
+            buffer.delete()
+        self._delete_vaos()
+        for cell_size, lod in self.lods:
+            lod.release()
+        self._triangleBVH = None
+        self.enabled = False
@@ -0,0 +1,104 @@
+import ctypes
+import os
+import sys
+
+# "egl" : surfaceless Mesa context, no display at all. "xvfb" : the widget's own GLX context on the display
+# given by xvfb-run (or any X server), for drivers without surfaceless EGL
+BACKEND = os.environ.get("HEADLESS_GL", "egl")
+# Mesa's software rasterizer even where a GPU driver exists, so runs on different machines stay comparable
+os.environ.setdefault("LIBGL_ALWAYS_SOFTWARE", "1")
+# both have to be chosen before PyOpenGL / Qt are first imported
+if BACKEND == "egl":
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from OpenGL import GL as gl
+from PyQt5 import QtWidgets
+
+EGL_PLATFORM_SURFACELESS_MESA = 0x31DD
+
+# the widgets need a QApplication alive for as long as they are used
+_APP = None
+
+
+def egl_context(width, height):
+    # surfaceless EGL context (Mesa software GL works), drawing into a framebuffer object of the given size
+    from OpenGL import EGL
+    from OpenGL.EGL.EXT.platform_base import eglGetPlatformDisplayEXT
+
+    display = eglGetPlatformDisplayEXT(EGL_PLATFORM_SURFACELESS_MESA, EGL.EGL_DEFAULT_DISPLAY, None)
+    if not display or not EGL.eglInitialize(display, None, None):
+        raise RuntimeError("no EGL display")
+    attributes = (EGL.EGLint * 7)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                  EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                  EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_NONE)
+    config = EGL.EGLConfig()
+    count = EGL.EGLint()
+    EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+    if not context or not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context):
+        raise RuntimeError("no EGL OpenGL context")
+    offscreen_framebuffer(width, height)
+    return context
+
+
+def offscreen_framebuffer(width, height):
+    # color + depth framebuffer object bound for drawing and reading, in the current context
+    framebuffer = gl.glGenFramebuffers(1)
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, framebuffer)
+    color, depth = gl.glGenRenderbuffers(2)
+    gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, color)
+    gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+    gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, color)
+    gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, depth)
+    gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_DEPTH_COMPONENT24, width, height)
+    gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_DEPTH_ATTACHMENT, gl.GL_RENDERBUFFER, depth)
+    if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("offscreen framebuffer is incomplete")
+    return framebuffer
+
+
+def offscreen_widget(width, height):
+    # a GLWidget sized width x height whose GL calls go to an EGL context, call paintGL() directly to draw
+    from main import GLWidget
+
+    global _APP
+    _APP = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    widget = GLWidget()
+    widget.resize(width, height)
+    if BACKEND == "egl":
+        egl_context(width, height)
+    else:
+        # the window only provides the context, frames still go to a framebuffer object of the asked size
+        widget.show()
+        _APP.processEvents()
+        widget.makeCurrent()
+        offscreen_framebuffer(width, height)
+    widget.initializeGL()
+    widget.resizeGL(width, height)
+    return widget
+
+
+def load_project(widget, folder_path, workers=1):
+    # the folder read as AppWindow.openProject does, but before returning : meshes, tables, then the static batches
+    from project_loader import read_project
+
+    for kind, path, data in read_project(folder_path, widget.meshCache, workers, widget.DXF_WELD_TOLERANCE,
+                                         widget.DXF_LOD_LEVELS):
+        if kind == 'dxf':
+            widget.add_object_dxf_data(data)
+        elif kind == 'detectors':
+            widget.add_detectors(data)
+        elif kind == 'events':
+            widget.add_events(data)
+    if widget.ENABLE_STATIC_BATCHING:
+        widget.build_static_batches()
+
+
+def gl_info():
+    # needs the current context, stored with benchmark results so runs on different drivers are not mixed up
+    return {"backend": BACKEND,
+            "vendor": gl.glGetString(gl.GL_VENDOR).decode(),
+            "renderer": gl.glGetString(gl.GL_RENDERER).decode(),
+            "version": gl.glGetString(gl.GL_VERSION).decode()}
@@ -0,0 +1,106 @@
+import numpy as np
+import OpenGL.GL as gl
+
+
+# Ids are written as RGBA8 colors, 0 is the background.
+# Objects use SceneObject.id + 1, instance set k uses (k + 1) << INSTANCE_SHIFT plus the position of the instance
+# in the set's buffers, so up to 255 sets of 16M instances each
+INSTANCE_SHIFT = 24
+INSTANCE_MASK = (1 << INSTANCE_SHIFT) - 1
+
+
+def encode_ids(ids):
+    # uint32 ids -> float RGBA rows, k / 255 is stored exactly in an 8 bit channel
+    ids = np.asarray(ids, dtype=np.uint32).reshape(-1)
+    channels = np.stack([(ids >> np.uint32(shift)) & np.uint32(0xff) for shift in (0, 8, 16, 24)], axis=1)
+    return channels.astype(np.float32) / np.float32(255.0)
+
+
+def object_id_color(obj_id):
+    return encode_ids([obj_id + 1])[0]
+
+
+def instance_id_base(set_index):
+    return (set_index + 1) << INSTANCE_SHIFT
+
+
+def decode_id(pixel):
+    # RGBA bytes -> ('object', obj_id), ('instance', set index, buffer position) or None
+    r, g, b, a = (int(c) for c in pixel)
+    value = r | g << 8 | b << 16 | a << 24
+    if value == 0:
+        return None
+    if value >> INSTANCE_SHIFT:
+        return 'instance', (value >> INSTANCE_SHIFT) - 1, value & INSTANCE_MASK
+    return 'object', value - 1
+
+
+# Offscreen framebuffer the scene is drawn into with ids instead of colors.
+# It is drawn again only when its key (camera, viewport, scene state) changes, a hover test is then one pixel read
+class PickingBuffer:
+    def __init__(self):
+        self.framebuffer = None
+        self.renderbuffers = None
+        self.size = (0, 0)
+        self.key = None
+        self._previous = None
+
+    def _allocate(self, width, height):
+        if self.framebuffer is None:
+            self.framebuffer = gl.glGenFramebuffers(1)
+            self.renderbuffers = gl.glGenRenderbuffers(2)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.framebuffer)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.renderbuffers[0])
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER,
+                                     self.renderbuffers[0])
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.renderbuffers[1])
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_DEPTH_COMPONENT24, width, height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_DEPTH_ATTACHMENT, gl.GL_RENDERBUFFER,
+                                     self.renderbuffers[1])
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, 0)
+        if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("picking framebuffer is incomplete")
+        self.size = (width, height)
+
+    def begin(self, width, height):
+        # the widget may draw into a framebuffer of its own, it is bound again in end()
+        self._previous = (gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING), gl.glGetFloatv(gl.GL_COLOR_CLEAR_VALUE),
+                          gl.glIsEnabled(gl.GL_BLEND), gl.glIsEnabled(gl.GL_DITHER))
+        if self.framebuffer is None or self.size != (width, height):
+            self._allocate(width, height)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.framebuffer)
+        gl.glDisable(gl.GL_BLEND)
+        gl.glDisable(gl.GL_DITHER)
+        gl.glClearColor(0.0, 0.0, 0.0, 0.0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+    def end(self, key=None):
+        framebuffer, clear_color, blend, dither = self._previous
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, int(framebuffer))
+        gl.glClearColor(*clear_color)
+        if blend:
+            gl.glEnable(gl.GL_BLEND)
+        if dither:
+            gl.glEnable(gl.GL_DITHER)
+        self.key = key
+
+    def read(self, x, y):
+        # x, y in widget coordinates (y grows downwards)
+        width, height = self.size
+        if self.framebuffer is None or not (0 <= x < width and 0 <= y < height):
+            return None
+        previous = gl.glGetIntegerv(gl.GL_FRAMEBUFFER_BINDING)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.framebuffer)
+        pixel = gl.glReadPixels(int(x), int(height - 1 - y), 1, 1, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, int(previous))
+        return decode_id(np.frombuffer(pixel, dtype=np.uint8)[:4])
+
+    def release(self):
+        if self.framebuffer is not None:
+            gl.glDeleteRenderbuffers(2, self.renderbuffers)
+            gl.glDeleteFramebuffers(1, [self.framebuffer])
+        self.framebuffer = None
+        self.renderbuffers = None
+        self.size = (0, 0)
+        self.key = None
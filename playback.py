@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+from PyQt5 import QtCore
+
+
+# Replays events in time order : the event instances are uploaded once sorted by time,
+# every tick only moves the drawn range over that order, so a tick costs the same however many events are shown
+class EventPlayback(QtCore.QObject):
+    cursorChanged = QtCore.pyqtSignal(float)
+    finished = QtCore.pyqtSignal()
+
+    TICK_INTERVAL = 20
+    # catalog seconds per real second
+    DEFAULT_SPEED = 3600.0
+
+    def __init__(self, catalog, instances, speed=DEFAULT_SPEED, window=None, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.instances = instances
+        self.speed = speed
+        # seconds of activity kept on screen behind the cursor, None keeps everything since the start
+        self.window = window
+
+        self.times = np.empty(0)
+        self.cursor = 0.0
+        self.prepared = False
+
+        self._last_tick = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(self.TICK_INTERVAL)
+        self._timer.timeout.connect(self._tick)
+
+    def prepare(self, mask=None):
+        # mask : events allowed to appear, e.g. the current catalog filter
+        order = self.catalog.index('time')[0]
+        order = order[~np.isnan(self.catalog['time'][order])]
+        if mask is not None:
+            order = order[mask[order]]
+        self.times = self.catalog['time'][order]
+        self.instances.set_visible(order)
+        self.prepared = True
+        self.seek(self.times[0] if len(self.times) else 0.0)
+
+    def is_playing(self):
+        return self._timer.isActive()
+
+    def start(self, mask=None):
+        if not self.prepared:
+            self.prepare(mask)
+        if len(self.times) and self.cursor >= self.times[-1]:
+            self.seek(self.times[0])
+        self._last_tick = time.perf_counter()
+        self._timer.start()
+
+    def pause(self):
+        self._timer.stop()
+
+    def stop(self):
+        # back to showing every event, the caller restores its own filter
+        self._timer.stop()
+        self.prepared = False
+        self.instances.set_draw_range()
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def seek(self, cursor):
+        self.cursor = float(cursor)
+        end = int(np.searchsorted(self.times, self.cursor, 'right'))
+        begin = 0 if self.window is None else int(np.searchsorted(self.times, self.cursor - self.window, 'left'))
+        self.instances.set_draw_range(begin, end)
+        self.cursorChanged.emit(self.cursor)
+
+    def _tick(self):
+        now = time.perf_counter()
+        elapsed, self._last_tick = now - self._last_tick, now
+        self.seek(self.cursor + elapsed * self.speed)
+        if not len(self.times) or self.cursor >= self.times[-1]:
+            self.pause()
+            self.finished.emit()
@@ -0,0 +1,432 @@
+import codecs
+import io
+import locale
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from PyQt5 import QtCore
+
+from object_constructors import build_dxf_arrays, dxf_cache_params, load_dxf_mesh
+
+
+CSV_CHUNK_SIZE = 1 << 23
+# tables exported on Russian Windows machines, tried when the locale encoding does not fit
+CSV_FALLBACK_ENCODING = 'cp1251'
+DXF_POOL_WORKERS = os.cpu_count() or 1
+
+
+class LoadCancelled(Exception):
+    pass
+
+
+def _timestamps(column):
+    # seconds : plain numbers, or ISO dates ("2024-05-01 13:45:00") counted from the epoch, NaN when unknown
+    if column.dtype.kind == 'f':
+        return column
+    try:
+        return column.astype(np.float64)
+    except ValueError:
+        pass
+    try:
+        dates = np.char.replace(np.char.strip(column), ' ', 'T').astype('datetime64[ms]')
+    except ValueError:
+        return np.full(len(column), np.nan)
+    return (dates - np.datetime64(0, 'ms')) / np.timedelta64(1, 's')
+
+
+def _load_table(text, columns, time_dtype):
+    kinds = {'S': 'U64', 'T': time_dtype}
+    dtype = np.dtype([(name, kinds.get(kind, kind)) for name, (index, kind) in columns.items()])
+    # no comment character : a '#' is part of a field (names, remarks)
+    return np.loadtxt(io.StringIO(text, newline=None), dtype=dtype, delimiter=';', quotechar='|', comments=None,
+                      usecols=[index for index, kind in columns.values()], ndmin=1)
+
+
+def _parse_csv_chunk(text, columns):
+    if not text.strip():
+        return None
+    numbers = {name: column for name, column in columns.items() if column[1] != 'S'}
+    texts = {name: column for name, column in columns.items() if column[1] == 'S'}
+    # numpy's C reader, the numeric columns are read from a copy with decimal commas turned into points,
+    # the text columns from the text as it is
+    converted = text.replace(',', '.')
+    try:
+        # time stamps are usually plain seconds, dates go through the slower text path
+        table = _load_table(converted, numbers, 'f8')
+    except ValueError:
+        if not any(kind == 'T' for index, kind in numbers.values()):
+            raise
+        table = _load_table(converted, numbers, 'U64')
+
+    result = {name: table[name] for name in numbers}
+    for name, (index, kind) in numbers.items():
+        if kind == 'T':
+            result[name] = _timestamps(result[name])
+    if texts:
+        table = _load_table(text, texts, 'U64')
+        for name in texts:
+            # narrowed to the longest value, U64 would take 256 bytes per row
+            width = max(1, int(np.char.str_len(table[name]).max())) if len(table) else 1
+            result[name] = table[name].astype(f'U{width}')
+    return {name: result[name] for name in columns}
+
+
+def _decoder(encoding):
+    # bytes -> str in the given encoding (the locale one by default), CSV_FALLBACK_ENCODING from the first chunk
+    # that does not decode on
+    encodings = [encoding or locale.getpreferredencoding(False)]
+    if codecs.lookup(encodings[0]).name != codecs.lookup(CSV_FALLBACK_ENCODING).name:
+        encodings.append(CSV_FALLBACK_ENCODING)
+
+    def decode(data):
+        while True:
+            try:
+                return data.decode(encodings[0])
+            except UnicodeDecodeError:
+                if len(encodings) == 1:
+                    raise
+                encodings.pop(0)
+    return decode
+
+
+# Reads a ';' separated, decimal comma table into NumPy columns, columns : {name: (field index, dtype)},
+# dtype 'S' is text and 'T' a time stamp in seconds. encoding : None for the locale one, as open() does
+def read_csv_columns(file_path, columns, progress=None, chunk_size=CSV_CHUNK_SIZE, encoding=None):
+    file_size = max(1, os.path.getsize(file_path))
+    decode = _decoder(encoding)
+    parts = []
+    tail = b''
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            data = tail + block
+            # the last line of a chunk may be incomplete
+            cut = data.rfind(b'\n') + 1 if block else len(data)
+            data, tail = data[:cut], data[cut:]
+            chunk = _parse_csv_chunk(decode(data), columns)
+            if chunk is not None:
+                parts.append(chunk)
+            if progress is not None:
+                progress(f.tell() / file_size)
+            if not block:
+                break
+
+    if not parts:
+        return {name: np.empty(0, dtype={'S': str, 'T': np.float64}.get(kind, kind))
+                for name, (index, kind) in columns.items()}
+    return {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+
+DETECTOR_COLUMNS = {'id': (0, 'i8'), 'x': (2, 'f8'), 'y': (3, 'f8'), 'z': (1, 'f8')}
+EVENT_COLUMNS = {'time': (0, 'T'), 'x': (1, 'f8'), 'y': (3, 'f8'), 'z': (2, 'f8'), 'magnitude': (4, 'f8'),
+                 'energy': (5, 'f8'), 'location_error': (6, 'f8'), 'type': (-1, 'S')}
+
+
+def read_detectors_csv(file_path, progress=None, encoding=None):
+    return read_csv_columns(file_path, DETECTOR_COLUMNS, progress, encoding=encoding)
+
+
+def read_events_csv(file_path, progress=None, encoding=None):
+    return read_csv_columns(file_path, EVENT_COLUMNS, progress, encoding=encoding)
+
+
+def _parse_dxf_worker(file_path, out_dir, params, progress_queue=None):
+    # runs in a pool process, arrays go back as .npy files instead of through pickling,
+    # (path, fraction) of the file read so far goes to progress_queue whenever the percent changes
+    progress = None
+    if progress_queue is not None:
+        last = [-1]
+
+        def progress(fraction):
+            percent = int(fraction * 100)
+            if percent != last[0]:
+                last[0] = percent
+                progress_queue.put((file_path, fraction))
+    arrays = build_dxf_arrays(file_path, progress=progress, **params)
+    entry_dir = tempfile.mkdtemp(dir=out_dir, prefix='new.')
+    for name, array in arrays.items():
+        np.save(os.path.join(entry_dir, name + '.npy'), array)
+    return entry_dir
+
+
+# Parses several DXF files in parallel across a process pool, cached files are not sent to the pool.
+# progress(path, fraction) : called from batches() with what the workers read so far
+class DxfBatchParser:
+    def __init__(self, paths, workers=DXF_POOL_WORKERS, cache=None, scale=1.0, normalize=False, weld_tolerance=None,
+                 lod_levels=0, progress=None):
+        self.paths = list(paths)
+        self.workers = max(1, min(workers, len(self.paths)))
+        self.cache = cache
+        self.params = dxf_cache_params(scale, normalize, weld_tolerance, lod_levels)
+        self.progress = progress
+
+        self._executor = None
+        self._manager = None
+        self._progressQueue = None
+        self._futures = {}
+        self._hits = []
+        self._tmp_dir = None
+
+    def start(self):
+        missing = []
+        for path in self.paths:
+            arrays = self.cache.load(path, self.params) if self.cache is not None else None
+            if arrays is not None:
+                self._hits.append((path, arrays))
+            else:
+                missing.append(path)
+        if not missing:
+            return
+
+        # the workers write into a directory of this batch, deleted by close() with whatever was not collected.
+        # Inside the cache directory the entries are moved into place without a copy
+        if self.cache is not None:
+            out_dir = self._tmp_dir = self.cache.new_entry_dir()
+        else:
+            out_dir = self._tmp_dir = tempfile.mkdtemp(prefix='geophys_dxf_')
+
+        # spawn : forking a process that runs Qt threads is not safe
+        context = multiprocessing.get_context('spawn')
+        if self.progress is not None:
+            # a plain multiprocessing queue can't be passed to pool tasks, a manager's proxy can
+            self._manager = context.Manager()
+            self._progressQueue = self._manager.Queue()
+        self._executor = ProcessPoolExecutor(min(self.workers, len(missing)), mp_context=context)
+        for path in missing:
+            future = self._executor.submit(_parse_dxf_worker, path, out_dir, self.params, self._progressQueue)
+            self._futures[future] = path
+
+    def poll_progress(self):
+        # hands what the workers reported since the last call to progress
+        if self._progressQueue is None:
+            return
+        while True:
+            try:
+                path, fraction = self._progressQueue.get_nowait()
+            except (queue.Empty, OSError, EOFError):
+                return
+            self.progress(path, fraction)
+
+    def _collect(self, path, entry_dir):
+        if self.cache is not None:
+            self.cache.adopt(path, entry_dir, self.params)
+            arrays = self.cache.load(path, self.params)
+            if arrays is None:
+                # removed by another process in between
+                raise OSError(f"{path} left the mesh cache before it was read")
+            return arrays
+
+        arrays = {name[:-4]: np.load(os.path.join(entry_dir, name))
+                  for name in os.listdir(entry_dir) if name.endswith('.npy')}
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return arrays
+
+    def cached_results(self):
+        hits, self._hits = self._hits, []
+        return hits
+
+    def results(self, cancelled=None, poll_interval=0.2):
+        # yields (path, arrays, error) in completion order
+        for batch in self.batches(cancelled, poll_interval):
+            yield from batch
+
+    def batches(self, cancelled=None, poll_interval=0.2):
+        # yields lists of (path, arrays, error) : the cached files first, then the files the pool finished since
+        # the previous list
+        hits = self.cached_results()
+        if hits:
+            yield [(path, arrays, None) for path, arrays in hits]
+
+        pending = set(self._futures)
+        try:
+            while pending:
+                if cancelled is not None and cancelled():
+                    return
+                done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                self.poll_progress()
+                batch = []
+                for future in done:
+                    path = self._futures[future]
+                    try:
+                        batch.append((path, self._collect(path, future.result()), None))
+                    except Exception as e:
+                        batch.append((path, None, e))
+                if batch:
+                    yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._progressQueue = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+
+def project_files(folder_path):
+    files = []
+    for entry in os.listdir(folder_path):
+        path = os.path.join(folder_path, entry)
+        if entry.lower().endswith('.dxf'):
+            files.append(('dxf', path))
+        elif entry == "detectors.csv":
+            files.append(('detectors', path))
+        elif entry == "events.csv":
+            files.append(('events', path))
+    return files
+
+
+def read_project(folder_path, cache=None, workers=DXF_POOL_WORKERS, weld_tolerance=None, lod_levels=0):
+    # the files ProjectLoader reads, without Qt and in name order : yields (kind, path, data), data being the
+    # columns of a table or the arrays of a DXF mesh. workers <= 1 parses the DXF files in this process
+    files = sorted(project_files(folder_path), key=lambda file: file[1])
+    for kind, path in files:
+        if kind == 'detectors':
+            yield kind, path, read_detectors_csv(path)
+        elif kind == 'events':
+            yield kind, path, read_events_csv(path)
+
+    dxf_paths = [path for kind, path in files if kind == 'dxf']
+    if workers <= 1:
+        for path in dxf_paths:
+            yield 'dxf', path, load_dxf_mesh(path, 1.0, False, cache, None, weld_tolerance, lod_levels)
+        return
+    meshes = {}
+    parser = DxfBatchParser(dxf_paths, workers, cache, weld_tolerance=weld_tolerance, lod_levels=lod_levels)
+    try:
+        parser.start()
+        for path, arrays, error in parser.results():
+            if error is not None:
+                raise error
+            meshes[path] = arrays
+    finally:
+        parser.close()
+    for path in dxf_paths:
+        yield 'dxf', path, meshes[path]
+
+
+# Parses a project folder in a worker thread (DXF meshes in a process pool),
+# objects are handed over to the GUI thread through queued signals
+class ProjectLoader(QtCore.QObject):
+    progress = QtCore.pyqtSignal(str, int)
+    # [(path, arrays)] of the meshes parsed or read from the cache together, added to the scene at once
+    meshesReady = QtCore.pyqtSignal(object)
+    detectorsReady = QtCore.pyqtSignal(str, object)
+    eventsReady = QtCore.pyqtSignal(str, object)
+    fileFinished = QtCore.pyqtSignal(str)
+    failed = QtCore.pyqtSignal(str, str)
+    finished = QtCore.pyqtSignal(bool)
+
+    def __init__(self, folder_path, cache=None, workers=DXF_POOL_WORKERS, weld_tolerance=None, lod_levels=0,
+                 parent=None):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self.cache = cache
+        self.workers = workers
+        self.weld_tolerance = weld_tolerance
+        self.lod_levels = lod_levels
+        self.files = project_files(folder_path)
+
+        self._cancelled = threading.Event()
+        self._thread = None
+        # DxfBatchParser of the running load, its worker progress is also passed on while the tables are read
+        self._parser = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ProjectLoader", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _progress_callback(self, path):
+        last = [-1]
+
+        def report(fraction):
+            if self._cancelled.is_set():
+                raise LoadCancelled()
+            percent = int(fraction * 100)
+            if percent != last[0]:
+                last[0] = percent
+                self.progress.emit(path, percent)
+            if self._parser is not None:
+                self._parser.poll_progress()
+        return report
+
+    def _load_csv(self, kind, path):
+        # the whole table goes to the scene in one signal
+        report = self._progress_callback(path)
+        if kind == 'detectors':
+            self.detectorsReady.emit(path, read_detectors_csv(path, report))
+        elif kind == 'events':
+            self.eventsReady.emit(path, read_events_csv(path, report))
+
+    def _emit_meshes(self, batch):
+        meshes = []
+        for path, arrays, error in batch:
+            if error is not None:
+                self.failed.emit(path, str(error))
+            else:
+                self.progress.emit(path, 100)
+                meshes.append((path, arrays))
+        if meshes:
+            self.meshesReady.emit(meshes)
+        for path, arrays in meshes:
+            self.fileFinished.emit(path)
+
+    def _run(self):
+        dxf_paths = [path for kind, path in self.files if kind == 'dxf']
+        parser = DxfBatchParser(dxf_paths, self.workers, self.cache, weld_tolerance=self.weld_tolerance,
+                                lod_levels=self.lod_levels,
+                                progress=lambda path, fraction: self.progress.emit(path, int(fraction * 100)))
+        self._parser = parser
+        # finished is emitted whatever happens, the window would stay in the loading state otherwise
+        try:
+            try:
+                parser.start()
+            except Exception as e:
+                # no pool or no cache : the meshes fail, the tables are still read
+                for path in dxf_paths:
+                    self.failed.emit(path, str(e))
+                started = False
+            else:
+                self._emit_meshes([(path, arrays, None) for path, arrays in parser.cached_results()])
+                started = True
+
+            # the pool works on the meshes while this thread reads the tables
+            for kind, path in self.files:
+                if self._cancelled.is_set():
+                    break
+                if kind == 'dxf':
+                    continue
+                try:
+                    self._load_csv(kind, path)
+                except LoadCancelled:
+                    break
+                except Exception as e:
+                    self.failed.emit(path, str(e))
+                    continue
+                self.fileFinished.emit(path)
+
+            if started:
+                for batch in parser.batches(self._cancelled.is_set):
+                    self._emit_meshes(batch)
+        finally:
+            parser.close()
+            self._parser = None
+            self.finished.emit(self._cancelled.is_set())
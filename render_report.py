@@ -0,0 +1,187 @@
+import argparse
+import math
+import multiprocessing
+import os
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+# chooses the GL platform, has to come before the app modules import PyOpenGL
+import offscreen
+
+import numpy as np
+from OpenGL import GL as gl
+from PyQt5 import QtGui
+
+from main import GLWidget
+from mesh_cache import MeshCache
+from project_loader import DXF_POOL_WORKERS, DxfBatchParser, project_files
+
+
+# Renders report images of project folders without a display : every project (and time window of its events)
+# is loaded like AppWindow.openProject into an offscreen GLWidget of its own in a worker process, then drawn from
+# each camera preset into a PNG.
+# python render_report.py PROJECT [PROJECT ...] --out reports --views top side overview --last-hours 24
+
+# preset -> (rotX, rotY), top and side as GLWidget.set_perspective_top / set_perspective_side
+VIEWS = {
+    "top": (0.0, GLWidget.ROT_Y_MIN),
+    "side": (0.0, math.pi / 2),
+    "overview": (math.pi / 4, math.pi / 3),
+}
+# room left around the scene, as a share of its size
+FRAME_MARGIN = 1.1
+
+
+def parse_time(text):
+    # seconds from the epoch, or an ISO date / date time as in events.csv, "" for an open end
+    if text == "":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        date = np.datetime64(text.strip().replace(' ', 'T'), 's')
+        return float((date - np.datetime64(0, 's')) / np.timedelta64(1, 's'))
+
+
+def window_label(window):
+    if window is None:
+        return ""
+    if window[0] == "last":
+        return f"last{window[1]:g}h"
+
+    def label(seconds):
+        if seconds is None:
+            return "open"
+        return np.datetime_as_string(np.datetime64(int(seconds), 's'), unit='m').replace(':', '').replace('-', '')
+    return f"{label(window[0])}-{label(window[1])}"
+
+
+def resolve_window(widget, window):
+    # (begin, end) seconds for the event filter, "last" windows end at the newest event of the project
+    if window is None or window[0] != "last":
+        return window
+    time_range = widget.eventCatalog.time_range()
+    if time_range is None:
+        return None
+    return time_range[1] - window[1] * 3600.0, time_range[1]
+
+
+def scene_bounds(widget):
+    # box around the shown objects and the centers of the shown events
+    boxes = [obj.world_bounds() for obj in widget.objects.values() if obj.enabled]
+    events = widget.instanceSets["event"]
+    if events.enabled and events.drawn_count():
+        positions = events.positions[events.drawn_rows()]
+        boxes.append((positions.min(axis=0), positions.max(axis=0)))
+    if not boxes:
+        return None
+    return np.min([b[0] for b in boxes], axis=0), np.max([b[1] for b in boxes], axis=0)
+
+
+def frame_scene(widget, width, height):
+    # orbit center in the middle of the scene, arm long enough to keep all of it inside the narrowest field of view
+    bounds = scene_bounds(widget)
+    if bounds is None:
+        return
+    center = (bounds[0] + bounds[1]) / 2.0
+    radius = float(np.linalg.norm(bounds[1] - bounds[0])) / 2.0
+    half_fov = math.radians(widget.FIELD_OF_VIEW) / 2.0
+    half_fov = min(half_fov, math.atan(math.tan(half_fov) * width / height))
+    # _compute_camera only needs location + origin of the target
+    widget.viewTarget = types.SimpleNamespace(location=center, origin=np.zeros(3))
+    widget.armLength = max(widget.ARM_MIN, radius / math.sin(half_fov) * FRAME_MARGIN)
+
+
+def save_png(path, width, height):
+    # the frame just drawn in the offscreen framebuffer, rows flipped from GL's bottom-up order
+    pixels = gl.glReadPixels(0, 0, width, height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+    image = QtGui.QImage(pixels, width, height, width * 4, QtGui.QImage.Format_RGBA8888).mirrored(False, True)
+    if not image.save(path):
+        raise OSError(f"could not write {path}")
+
+
+def render_job(folder, windows, views, size, out_dir, renderer, use_cache):
+    # runs in a worker process : one widget and one GL context for a project, every window and view drawn from it
+    width, height = size
+    widget = offscreen.offscreen_widget(width, height)
+    if not use_cache:
+        widget.meshCache = None
+    widget.set_renderer(renderer)
+    offscreen.load_project(widget, folder)
+
+    name = os.path.basename(os.path.normpath(folder))
+    paths = []
+    for window in windows:
+        widget.set_event_filter(time=resolve_window(widget, window))
+        frame_scene(widget, width, height)
+        label = window_label(window)
+        for view in views:
+            widget.rotX, widget.rotY = VIEWS[view]
+            widget.paintGL()
+            path = os.path.join(out_dir, "_".join(part for part in (name, label, view) if part) + ".png")
+            save_png(path, width, height)
+            paths.append(path)
+    return paths
+
+
+def parse_cached_meshes(folders, workers):
+    # every DXF file missing from the mesh cache parsed once across the pool, so the render workers only read it
+    cache = MeshCache()
+    paths = [path for folder in folders for kind, path in project_files(folder) if kind == 'dxf']
+    parser = DxfBatchParser(paths, workers, cache, weld_tolerance=GLWidget.DXF_WELD_TOLERANCE,
+                            lod_levels=GLWidget.DXF_LOD_LEVELS)
+    parser.start()
+    for path, arrays, error in parser.results():
+        if error is not None:
+            print(f"{path} : {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PNG report images of project folders, rendered offscreen")
+    parser.add_argument("projects", nargs="+", help="project folders, as opened with Файл > Открыть проект")
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--size", type=int, nargs=2, default=[1600, 1200], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--views", nargs="+", choices=list(VIEWS), default=list(VIEWS))
+    parser.add_argument("--window", nargs=2, action="append", default=[], metavar=("BEGIN", "END"),
+                        help="events between two times (seconds or ISO dates, \"\" for an open end), repeatable")
+    parser.add_argument("--last-hours", type=float, action="append", default=[],
+                        help="events of the last hours before the newest one, repeatable")
+    parser.add_argument("--renderer", choices=GLWidget.RENDERERS, default=GLWidget.RENDERER)
+    parser.add_argument("--workers", type=int, default=DXF_POOL_WORKERS)
+    parser.add_argument("--no-cache", action="store_true", help="parse the DXF files in every job, cache untouched")
+    parser.add_argument("--split-windows", action="store_true",
+                        help="one job per project and window instead of one per project")
+    args = parser.parse_args()
+
+    windows = [(parse_time(begin), parse_time(end)) for begin, end in args.window]
+    windows = [None if window == (None, None) else window for window in windows]
+    windows += [("last", hours) for hours in args.last_hours]
+    windows = windows or [None]
+    os.makedirs(args.out, exist_ok=True)
+
+    use_cache = GLWidget.ENABLE_MESH_CACHE and not args.no_cache
+    if use_cache:
+        parse_cached_meshes(args.projects, args.workers)
+
+    if args.split_windows:
+        jobs = [(folder, [window]) for folder in args.projects for window in windows]
+    else:
+        jobs = [(folder, windows) for folder in args.projects]
+    # spawn : no GL or Qt state copied from this process, and a fresh process (and context) for every job
+    with ProcessPoolExecutor(max(1, min(args.workers, len(jobs))), mp_context=multiprocessing.get_context('spawn'),
+                             max_tasks_per_child=1) as executor:
+        futures = {executor.submit(render_job, folder, job_windows, args.views, args.size, args.out,
+                                   args.renderer, use_cache): folder for folder, job_windows in jobs}
+        failed = 0
+        for future, folder in futures.items():
+            try:
+                for path in future.result():
+                    print(path)
+            except Exception as e:
+                failed += 1
+                print(f"{folder} : {e}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
 import numpy as np
-from pyglm import glm
-from pyglm.glm import sin, cos
+
+from transforms import TRANSFORMS
 
 
 # NEVER EVER interact with this var outside SceneObject class
 OBJECT_COUNT = 0
 
-# TODO : create methods to update SceneObject fields and automatically recalculate matrix
-# OR : do something with matrices provided by OpenGL and make them work!!
+def _transform_array(value):
+    # read-only, so a change has to go through the setters and is never missed
+    array = np.array(value, dtype=np.float64).reshape(3)
+    array.setflags(write=False)
+    return array
+
+
 class SceneObject:
     def __init__(self, mesh, collision, origin=np.array([0.0, 0.0, 0.0]), obj_type="misc", data={}):
         self.enabled = True
@@ -19,53 +24,140 @@ class SceneObject:
         self.obj_type = obj_type
         self.data = data.copy()
 
+        # location / rotation (degrees) / scale setters only mark the object, see transforms.TransformStore
+        self.transformDirty = False
+        self._matrix = None
+        self._inverse = None
+        self._glMatrix = None
         self.scale = np.array([1.0, 1.0, 1.0])
         self.rotation = np.array([0.0, 0.0, 0.0])
         self.location = np.array([0.0, 0.0, 0.0])
-        self.matrix = None
-        self.calculate_matrix()
 
         global OBJECT_COUNT
         self.id = OBJECT_COUNT
         OBJECT_COUNT += 1
 
 
-    def calculate_matrix(self):
-        a, b, c = self.rotation
-        x, y, z = self.location
-        sx, sy, sz = self.scale
-        ox, oy, oz = self.origin
-        R = glm.mat4(cos(b) * cos(c), sin(a) * sin(b) * cos(c) - cos(a) * sin(c), cos(a) * sin(b) * cos(c) + sin(a) * sin(c), x - ox * sx,
-                      cos(b) * sin(c), sin(a) * sin(b) * sin(c) + cos(a) * cos(c), cos(a) * sin(b) * sin(c) - sin(a) * cos(c), y - oy * sy,
-                      -sin(b),         sin(a) * cos(b),                            cos(a) * cos(b),                            z - oz * sz,
-                      0.0,             0.0,                                        0.0,                                        1.0)
-        S = glm.mat4(sx, 0.0, 0.0, 0.0,
-                      0.0, sy, 0.0, 0.0,
-                      0.0, 0.0, sz, 0.0,
-                      0.0, 0.0, 0.0, 1.0)
-        self.matrix = glm.transpose(R)
+    @property
+    def location(self):
+        return self._location
+
+
+    @location.setter
+    def location(self, value):
+        self._location = _transform_array(value)
+        TRANSFORMS.mark(self)
+
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+
+    @rotation.setter
+    def rotation(self, value):
+        self._rotation = _transform_array(value)
+        TRANSFORMS.mark(self)
+
+
+    @property
+    def scale(self):
+        return self._scale
+
+
+    @scale.setter
+    def scale(self, value):
+        self._scale = _transform_array(value)
+        TRANSFORMS.mark(self)
+
+
+    def set_matrix(self, matrix, inverse, gl_matrix):
+        self._matrix, self._inverse, self._glMatrix = matrix, inverse, gl_matrix
+        self.transformDirty = False
+
+
+    # model matrix : translate * rotate x, y, z * scale, computed together with every other changed object
+    @property
+    def matrix(self):
+        if self.transformDirty:
+            TRANSFORMS.update()
+        return self._matrix
+
+
+    @property
+    def inverse_matrix(self):
+        if self.transformDirty:
+            TRANSFORMS.update()
+        return self._inverse
+
+
+    # the matrix in the column major float layout glMultMatrixf expects
+    @property
+    def gl_matrix(self):
+        if self.transformDirty:
+            TRANSFORMS.update()
+        return self._glMatrix
+
+
+    def world_bounds(self):
+        # axis aligned box around the collision box placed the way the mesh is drawn
+        begin = np.array(self.collision.pointBegin)
+        end = np.array(self.collision.pointEnd)
+        corners = np.array([[(begin, end)[(i >> k) & 1][k] for k in range(3)] for i in range(8)])
+        matrix = self.matrix
+        corners = corners @ matrix[:3, :3].T + matrix[:3, 3]
+        return corners.min(axis=0), corners.max(axis=0)
+
+
+    def ray_to_local(self, origin, direction):
+        # world ray -> mesh coordinates, distances along the ray stay the same
+        inverse = self.inverse_matrix
+        origin = inverse[:3, :3] @ np.asarray(origin, dtype=np.float64) + inverse[:3, 3]
+        direction = inverse[:3, :3] @ np.asarray(direction, dtype=np.float64)
+        return origin, direction
 
 
     def on_hover(self):
         self.hover = True
-        self.mesh.on_hover()
 
 
     def on_unhover(self):
         self.hover = False
-        self.mesh.on_unhover()
 
 
-class SceneEvent(SceneObject):
-    def __init__(self, time=0, magnitude=0, location_error=0, energy=0, l_param=0, event_type="Unknown"):
-        # mesh = create_sphere()
+# One row of an EventCatalog, the values stay in the catalog columns
+class SceneEvent:
+    def __init__(self, catalog, index):
+        self.catalog = catalog
+        self.index = index
+
+    def _value(self, name):
+        return self.catalog[name][self.index].item()
+
+    @property
+    def time(self):
+        return self._value('time')
+
+    @property
+    def magnitude(self):
+        return self._value('magnitude')
+
+    @property
+    def type(self):
+        return self._value('type')
+
+    @property
+    def location_error(self):
+        return self._value('location_error')
 
-        # SceneObject.__init__(self, mesh, collision, origin)
-        self.time = 0
-        self.magnitude = 0
-        self.type = "Unknown"
-        self.location_error = 0
-        self.energy = 0
-        self.L = 0
+    @property
+    def energy(self):
+        return self._value('energy')
 
+    @property
+    def L(self):
+        return self._value('L')
 
+    @property
+    def location(self):
+        return np.array([self._value('x'), self._value('y'), self._value('z')])
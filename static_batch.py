@@ -0,0 +1,144 @@
+import numpy as np
+from OpenGL.arrays import vbo
+
+from culling import boxes_in_frustum, visible_ranges
+from object_meshes import ObjectMesh
+
+
+KINDS = ('faces', 'edges')
+EMPTY_RANGES = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+
+def batch_key(mesh):
+    # meshes drawn with the same state can share a batch, None for per-vertex colors
+    colors = (mesh.colorFaces, mesh.colorEdges, mesh.colorHovered, mesh.colorSelected)
+    vertex_colors = (mesh.colorsFacesVBO, mesh.colorsEdgesVBO, mesh.colorsHoveredVBO, mesh.colorsSelectedVBO)
+    if any(buffer is not None for buffer in vertex_colors):
+        return None
+    return (mesh.enableFaces, mesh.enableEdges) + tuple(None if c is None else c.tobytes() for c in colors)
+
+
+def concat_ranges(ranges):
+    # [(offsets, counts)] -> one (offsets, counts) for a single multi-draw
+    ranges = list(ranges)
+    if not ranges:
+        return EMPTY_RANGES
+    return np.concatenate([r[0] for r in ranges]), np.concatenate([r[1] for r in ranges])
+
+
+# Static DXF meshes drawn with the same colors, merged per level of detail into one vertex buffer and one index
+# buffer per kind. Vertices are baked with the model matrix of their object. Every source keeps the index range
+# of each kind (and its culling chunks), so it is still hidden, culled, hovered and picked on its own
+class StaticBatch:
+    def __init__(self, objects):
+        self.objects = list(objects)
+        # positions in self.objects of sources drawn on their own again (moved or removed)
+        self.removed = set()
+        self.levels = []
+        # per level : {source position: {kind: (start, count, chunks or None)}}
+        self.sources = []
+
+        reference = self.objects[0].mesh
+        depth = max(len(obj.mesh.lods) for obj in self.objects)
+        for level in range(depth + 1):
+            members = [(position, obj, obj.mesh if level == 0 else obj.mesh.lods[level - 1][1])
+                       for position, obj in enumerate(self.objects) if level <= len(obj.mesh.lods)]
+            self._build_level(reference, members)
+
+    def _build_level(self, reference, members):
+        vertices = []
+        indices = {kind: [] for kind in KINDS}
+        sources = {}
+        vertex_offset = 0
+        index_offset = dict.fromkeys(KINDS, 0)
+        for position, obj, mesh in members:
+            local = np.asarray(mesh.verticesVBO.data, dtype=np.float32).reshape(-1, 3)
+            matrix = obj.matrix
+            vertices.append((local @ matrix[:3, :3].T + matrix[:3, 3]).astype(np.float32))
+
+            sources[position] = {}
+            for kind, array in zip(KINDS, (mesh.facesTriangles, mesh.edges)):
+                array = np.empty(0, dtype=np.uint32) if array is None else array
+                indices[kind].append(array + np.uint32(vertex_offset))
+                chunks = mesh.chunks.get(kind)
+                if chunks is not None:
+                    offsets, counts, box_min, box_max = chunks
+                    chunks = (offsets + index_offset[kind], counts, box_min, box_max)
+                sources[position][kind] = (index_offset[kind], len(array), chunks)
+                index_offset[kind] += len(array)
+            vertex_offset += len(local)
+
+        mesh = ObjectMesh(vbo.VBO(np.concatenate(vertices).ravel()), None,
+                          np.concatenate(indices['faces']), None, np.concatenate(indices['edges']), chunked=False)
+        mesh.set_colors(reference.colorFaces, reference.colorEdges, reference.colorHovered, reference.colorSelected)
+        mesh.enableFaces = reference.enableFaces
+        mesh.enableEdges = reference.enableEdges
+        self.levels.append(mesh)
+        self.sources.append(sources)
+
+    def drawn_sources(self):
+        return [(position, obj) for position, obj in enumerate(self.objects) if position not in self.removed]
+
+    def remove(self, position):
+        self.removed.add(position)
+
+    def is_empty(self):
+        return len(self.removed) == len(self.objects)
+
+    def level_of(self, obj, mesh):
+        # level of the mesh GLWidget.select_lod chose for obj
+        if mesh is obj.mesh:
+            return 0
+        return 1 + next(i for i, (cell_size, lod) in enumerate(obj.mesh.lods) if lod is mesh)
+
+    def source_ranges(self, level, position, planes=None):
+        # {kind: (offsets, counts)} of one source, chunks outside planes (in its mesh coordinates) left out,
+        # returns (ranges, drawn chunks, culled chunks)
+        ranges = {}
+        drawn = culled = 0
+        for kind, (start, count, chunks) in self.sources[level][position].items():
+            if chunks is None or planes is None:
+                ranges[kind] = (np.array([start]), np.array([count]))
+                continue
+            offsets, counts, box_min, box_max = chunks
+            visible = boxes_in_frustum(planes, box_min, box_max)
+            ranges[kind] = visible_ranges(offsets, counts, visible)
+            drawn += int(np.count_nonzero(visible))
+            culled += len(visible) - int(np.count_nonzero(visible))
+        return ranges, drawn, culled
+
+    def nbytes(self):
+        return sum(mesh.nbytes() for mesh in self.levels)
+
+    def upload(self):
+        for mesh in self.levels:
+            mesh.upload()
+
+    def release(self):
+        for mesh in self.levels:
+            mesh.release()
+        self.levels = []
+
+
+def build_batches(objects, max_vertices):
+    # static objects grouped by batch_key, every group cut in batches of at most max_vertices vertices,
+    # single objects are left to draw on their own
+    groups = {}
+    for obj in objects:
+        key = batch_key(obj.mesh)
+        if key is not None:
+            groups.setdefault(key, []).append(obj)
+
+    batches = []
+    for members in groups.values():
+        current, vertices = [], 0
+        for obj in members + [None]:
+            count = 0 if obj is None else len(obj.mesh.verticesVBO.data) // 3
+            if current and (obj is None or vertices + count > max_vertices):
+                if len(current) > 1:
+                    batches.append(StaticBatch(current))
+                current, vertices = [], 0
+            if obj is not None:
+                current.append(obj)
+                vertices += count
+    return batches
@@ -0,0 +1,123 @@
+import inspect
+import weakref
+
+import numpy as np
+
+
+# Matrices are NumPy 4x4 arrays acting on column vectors (p' = M @ p), transpose them for glLoadMatrix
+
+
+def rotation_matrices(rotations):
+    # (n, 3) angles in degrees -> (n, 3, 3) Rx @ Ry @ Rz, the order draw_object used with glRotatef
+    a, b, c = np.radians(np.asarray(rotations, dtype=np.float64).reshape(-1, 3)).T
+    ca, sa, cb, sb, cc, sc = np.cos(a), np.sin(a), np.cos(b), np.sin(b), np.cos(c), np.sin(c)
+    r = np.empty((len(a), 3, 3))
+    r[:, 0, 0] = cb * cc
+    r[:, 0, 1] = -cb * sc
+    r[:, 0, 2] = sb
+    r[:, 1, 0] = sa * sb * cc + ca * sc
+    r[:, 1, 1] = ca * cc - sa * sb * sc
+    r[:, 1, 2] = -sa * cb
+    r[:, 2, 0] = sa * sc - ca * sb * cc
+    r[:, 2, 1] = ca * sb * sc + sa * cc
+    r[:, 2, 2] = ca * cb
+    return r
+
+
+def model_matrices(locations, rotations, scales):
+    # translate * rotate * scale for many objects at once, returns (matrices, inverses)
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 3)
+    scales = np.asarray(scales, dtype=np.float64).reshape(-1, 3)
+    r = rotation_matrices(rotations)
+    n = len(locations)
+
+    matrices = np.zeros((n, 4, 4))
+    matrices[:, :3, :3] = r * scales[:, None, :]
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1.0
+
+    inverses = np.zeros((n, 4, 4))
+    inverses[:, :3, :3] = r.transpose(0, 2, 1) / scales[:, :, None]
+    inverses[:, :3, 3] = -np.einsum('nij,nj->ni', inverses[:, :3, :3], locations)
+    inverses[:, 3, 3] = 1.0
+    return matrices, inverses
+
+
+def look_at(eye, target, up=(0.0, 1.0, 0.0)):
+    # same matrix as gluLookAt
+    eye = np.asarray(eye, dtype=np.float64)
+    forward = np.asarray(target, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+
+    view = np.identity(4)
+    view[0, :3], view[1, :3], view[2, :3] = side, up, -forward
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view
+
+
+def perspective(fov_y, aspect, near, far):
+    # same matrix as gluPerspective, fov_y in degrees
+    f = 1.0 / np.tan(np.radians(fov_y) / 2.0)
+    projection = np.zeros((4, 4))
+    projection[0, 0] = f / aspect
+    projection[1, 1] = f
+    projection[2, 2] = (far + near) / (near - far)
+    projection[2, 3] = 2.0 * far * near / (near - far)
+    projection[3, 2] = -1.0
+    return projection
+
+
+# Objects whose location, rotation or scale changed since their matrix was last computed.
+# The matrices of all of them are recomputed in one pass, on the first read of any of them or once per frame
+class TransformStore:
+    def __init__(self):
+        self.dirty = []
+        # updated since the last take_moved, e.g. to refit picking bounds
+        self.moved = []
+        # called when the first object of a batch is marked, e.g. to ask for a frame, see add_listener
+        self.listeners = []
+
+    def add_listener(self, callback):
+        # bound methods are held weakly, the store must not keep e.g. a closed widget alive.
+        # returns the handle remove_listener takes
+        listener = weakref.WeakMethod(callback) if inspect.ismethod(callback) else (lambda: callback)
+        self.listeners.append(listener)
+        return listener
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def mark(self, obj):
+        if not obj.transformDirty:
+            obj.transformDirty = True
+            self.dirty.append(obj)
+            if len(self.dirty) == 1:
+                for listener in list(self.listeners):
+                    callback = listener()
+                    if callback is None:
+                        self.listeners.remove(listener)
+                    else:
+                        callback()
+
+    def update(self):
+        dirty, self.dirty = self.dirty, []
+        if not dirty:
+            return 0
+        matrices, inverses = model_matrices([obj.location for obj in dirty], [obj.rotation for obj in dirty],
+                                            [obj.scale for obj in dirty])
+        gl_matrices = np.ascontiguousarray(matrices.transpose(0, 2, 1), dtype=np.float32)
+        for obj, matrix, inverse, gl_matrix in zip(dirty, matrices, inverses, gl_matrices):
+            obj.set_matrix(matrix, inverse, gl_matrix)
+        self.moved.extend(dirty)
+        return len(dirty)
+
+    def take_moved(self):
+        moved, self.moved = self.moved, []
+        return moved
+
+
+TRANSFORMS = TransformStore()
@@ -1,4 +1,4 @@
-import OpenGL.GL as gl
+import numpy as np
 from pyglm import glm
 from pyglm.glm import sin, cos, inverse
 
@@ -9,35 +9,12 @@ def full_rotation(ax, ay, az):
              -sin(ay), sin(ax) * cos(ay), cos(ax) * cos(ay))
 
 
-def mul_mat4_vec4(a, b):
-    return glm.vec4(*[sum(a[i][j] * b[j] for j in range(4)) for i in range(4)])
-
-
-def screen_pos_to_vector(x, y, width, height, camera, target):
-    view = glm.transpose(glm.lookAt(camera, target, glm.vec3([0.0, 1.0, 0.0])))
-    projection = gl.glGetDouble(gl.GL_PROJECTION_MATRIX)
-    # print(view)
-    # print(projection)
-    ray_start = glm.vec4((x / width - 0.5) * 2.0,
-                         (y / height - 0.5) * 2.0,
-                         -1.0,
-                         1.0)
-    ray_end = glm.vec4((x / width - 0.5) * 2.0,
-                         (y / height - 0.5) * 2.0,
-                         0.0,
-                         1.0)
-    inverse_projection = glm.inverse(projection)
-    inverse_view = glm.inverse(view)
-
-    ray_start_cam = mul_mat4_vec4(inverse_projection, ray_start)
-    ray_start_cam /= ray_start_cam.w
-    ray_start_world = mul_mat4_vec4(inverse_view, ray_start_cam)
-    ray_start_world /= ray_start_world.w
-
-    ray_end_cam = mul_mat4_vec4(inverse_projection, ray_end)
-    ray_end_cam /= ray_end_cam.w
-    ray_end_world = mul_mat4_vec4(inverse_view, ray_end_cam)
-    ray_end_world /= ray_start_world.w
-
-    return glm.normalize(glm.vec3(ray_end_world - ray_start_world))
-
+def screen_pos_to_vector(x, y, width, height, inverse_view_projection):
+    # unit world direction through window pixel (x, y), y grows upwards as in OpenGL.
+    # inverse_view_projection : inverse of projection @ view, cached by the widget
+    ndc = np.array([[(x / width - 0.5) * 2.0, (y / height - 0.5) * 2.0, -1.0, 1.0],
+                    [(x / width - 0.5) * 2.0, (y / height - 0.5) * 2.0, 0.0, 1.0]])
+    world = ndc @ inverse_view_projection.T
+    world = world[:, :3] / world[:, 3:]
+    direction = world[1] - world[0]
+    return direction / np.linalg.norm(direction)